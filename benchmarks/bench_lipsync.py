@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Wav2Lip benchmark: mel extraction, datagen, model forward (full and with cached
+static-face features) and blend on CPU.
+
+The model is randomly initialized and the face box is fixed (--box), so neither
+the Wav2Lip checkpoint nor the S3FD face detector weights are needed. With
+--backend torchscript/onnx the forward stage runs the exported model (exported
+into the temp dir before timing starts); --precision bf16/int8 runs it with
+autocast or quantized (calibrated on the first batch before timing starts).
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+from harness import Suite, WAV2LIP_DIR, make_face_image, make_speech_wav
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wav2Lip CPU benchmark")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Length of the generated audio")
+    parser.add_argument("--batch_size", type=int, default=16, help="Wav2Lip batch size")
+    parser.add_argument("--size", type=int, default=256, help="Side of the generated face image")
+    parser.add_argument("--backend", choices=["eager", "torchscript", "onnx"], default="eager",
+                        help="Wav2Lip runtime for the forward stage")
+    parser.add_argument("--precision", choices=["fp32", "bf16", "int8"], default="fp32",
+                        help="Wav2Lip precision for the forward stage")
+    opts = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_lipsync_")
+    face_path = make_face_image(os.path.join(work_dir, "face.png"), opts.size)
+    audio_path = make_speech_wav(os.path.join(work_dir, "speech.wav"), opts.seconds)
+
+    # inference.py parses its arguments at import time
+    box = [opts.size // 4, opts.size * 7 // 8, opts.size // 4, opts.size * 3 // 4]
+    sys.argv = ["inference.py", "--checkpoint_path", "unused", "--face", face_path, "--audio", audio_path,
+                "--wav2lip_batch_size", str(opts.batch_size), "--backend", opts.backend,
+                "--export_dir", work_dir, "--box"] + [str(v) for v in box]
+    sys.path.insert(0, WAV2LIP_DIR)
+    os.chdir(WAV2LIP_DIR)
+    import torch
+    import cv2
+    import audio
+    import inference
+    import precision
+    from models import Wav2Lip
+
+    torch.manual_seed(0)
+    suite = Suite("lipsync")
+    full_frames = [cv2.imread(face_path)]
+    inference.setup_batch_tuners(full_frames[0].shape[:2])
+
+    wav = audio.load_wav(audio_path, 16000)
+    num_frames = int(opts.seconds * inference.args.fps)
+    with suite.measure("mel", num_frames):
+        mel = audio.melspectrogram(wav)
+        mel_chunks = inference.get_mel_chunks(mel, inference.args.fps)
+
+    with suite.measure("datagen", len(mel_chunks)):
+        batches = list(inference.datagen(full_frames.copy(), mel_chunks, np.zeros(len(mel_chunks), dtype=bool)))
+
+    model = Wav2Lip().to(inference.device).eval()
+    mode = precision.resolve(opts.precision, inference.device)
+    if mode == "int8":
+        img_batch, mel_batch = batches[0][:2]
+        precision.prepare_int8(model)
+        with torch.no_grad():
+            model(torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))),
+                  torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))))
+        precision.convert_int8(model)
+    elif opts.backend != "eager":
+        # Exports are keyed by checkpoint hash, so the random weights are saved first
+        checkpoint_path = os.path.join(work_dir, "wav2lip.pth")
+        torch.save({"state_dict": model.state_dict()}, checkpoint_path)
+        img_batch, mel_batch = batches[0][:2]
+        example = (torch.FloatTensor(np.transpose(mel_batch[:1], (0, 3, 1, 2))).to(inference.device),
+                   torch.FloatTensor(np.transpose(img_batch[:1], (0, 3, 1, 2))).to(inference.device))
+        model = inference.load_backend("wav2lip", model, example, checkpoint_path, ["mel", "face"], ["pred"],
+                                       {"mel": {0: "batch"}, "face": {0: "batch"}, "pred": {0: "batch"}})
+    preds = []
+    with suite.measure("forward", len(mel_chunks)):
+        for img_batch, mel_batch, _, _, _ in batches:
+            img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(inference.device)
+            mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(inference.device)
+            with torch.no_grad(), precision.autocast(mode, inference.device):
+                pred = model(mel_batch, img_batch)
+            preds.append(pred.float().cpu().numpy().transpose(0, 2, 3, 1) * 255.)
+
+    # Static image path of inference.run_inference (eager model only)
+    if isinstance(model, Wav2Lip):
+        with suite.measure("forward_static", len(mel_chunks)):
+            with torch.no_grad(), precision.autocast(mode, inference.device):
+                face = torch.FloatTensor(np.transpose(batches[0][0][:1], (0, 3, 1, 2))).to(inference.device)
+                face_feats = model.encode_face(face)
+                for _, mel_batch, _, _, _ in batches:
+                    mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(inference.device)
+                    model.decode(mel_batch, face_feats).float().cpu().numpy()
+    else:
+        suite.skip("forward_static", "needs the eager model")
+
+    with suite.measure("blend", len(mel_chunks)):
+        for pred, (_, _, frames, coords, _) in zip(preds, batches):
+            for p, f, c in zip(pred, frames, coords):
+                inference.blend_face(p, f, c)
+
+    suite.emit()
+
+
+if __name__ == "__main__":
+    main()
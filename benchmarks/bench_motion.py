@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+SadTalker benchmark: get_data, Audio2Coeff.generate (per-window and batched), make_animation and paste_pic on CPU.
+
+Audio2Coeff is loaded through its safetensors path from a randomly initialized
+checkpoint written to a temp dir; the face renderer networks are built from
+facerender.yaml with random weights. No downloaded checkpoints are needed.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+from harness import Suite, SADTALKER_DIR, make_face_image, make_speech_wav
+
+
+def write_random_audio2coeff_checkpoint(path, config_dir, device):
+    """Saves randomly initialized Audio2Pose/Audio2Exp weights in the SadTalker safetensors layout."""
+    import safetensors.torch
+    from yacs.config import CfgNode as CN
+    from src.audio2pose_models.audio2pose import Audio2Pose
+    from src.audio2exp_models.networks import SimpleWrapperV2
+
+    with open(os.path.join(config_dir, 'auido2pose.yaml')) as f:
+        cfg_pose = CN.load_cfg(f)
+    tensors = {}
+    for prefix, model in (('audio2pose', Audio2Pose(cfg_pose, None, device=device)),
+                          ('audio2exp', SimpleWrapperV2())):
+        for k, v in model.state_dict().items():
+            tensors[f'{prefix}.{k}'] = v.contiguous()
+    safetensors.torch.save_file(tensors, path)
+
+
+def build_face_renderer(config_dir, device):
+    """Face renderer networks of AnimateFromCoeff with random weights."""
+    import yaml
+    from src.facerender.modules.keypoint_detector import HEEstimator, KPDetector
+    from src.facerender.modules.mapping import MappingNet
+    from src.facerender.modules.generator import OcclusionAwareSPADEGenerator
+
+    with open(os.path.join(config_dir, 'facerender.yaml')) as f:
+        config = yaml.safe_load(f)
+    params = config['model_params']
+    networks = (
+        OcclusionAwareSPADEGenerator(**params['generator_params'], **params['common_params']),
+        KPDetector(**params['kp_detector_params'], **params['common_params']),
+        HEEstimator(**params['he_estimator_params'], **params['common_params']),
+        MappingNet(**params['mapping_params']),
+    )
+    return [network.to(device).eval() for network in networks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SadTalker CPU benchmark")
+    parser.add_argument("--seconds", type=float, default=0.5, help="Length of the generated audio")
+    parser.add_argument("--batch_size", type=int, default=2, help="Face renderer batch size")
+    parser.add_argument("--size", type=int, default=128,
+                        help="Face renderer resolution (SadTalker renders at 256; smaller keeps CPU runs short)")
+    opts = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_motion_")
+    face_path = make_face_image(os.path.join(work_dir, "face.png"), opts.size)
+    audio_path = make_speech_wav(os.path.join(work_dir, "speech.wav"), opts.seconds)
+
+    sys.path.insert(0, SADTALKER_DIR)
+    os.chdir(SADTALKER_DIR)
+    import cv2
+    import torch
+    from scipy.io import savemat
+    from src.generate_batch import get_data
+    from src.generate_facerender_batch import get_facerender_data
+    from src.test_audio2coeff import Audio2Coeff
+    from src.facerender.modules.make_animation import make_animation
+    from src.utils.init_path import init_path
+    from src.utils.paste_pic import paste_pic
+
+    torch.manual_seed(0)
+    device = "cpu"
+    config_dir = os.path.join(SADTALKER_DIR, 'src', 'config')
+    suite = Suite("motion")
+
+    # First-frame 3DMM coefficients as written by CropAndExtract (70 coeffs + 3 crop params)
+    first_coeff_path = os.path.join(work_dir, 'face.mat')
+    rng = np.random.default_rng(0)
+    savemat(first_coeff_path, {'coeff_3dmm': rng.normal(0, 0.1, (1, 73)).astype(np.float32),
+                               'full_3dmm': rng.normal(0, 0.1, (1, 257)).astype(np.float32)})
+
+    num_frames = int(opts.seconds * 25)
+    with suite.measure("get_data", num_frames):
+        batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path=None, still=True)
+
+    checkpoint_dir = os.path.join(work_dir, 'checkpoints')
+    os.makedirs(checkpoint_dir)
+    write_random_audio2coeff_checkpoint(os.path.join(checkpoint_dir, 'SadTalker_V0.0.2_256.safetensors'),
+                                        config_dir, device)
+    sadtalker_paths = init_path(checkpoint_dir, config_dir, 256, False, 'crop')
+    # Cold start from the safetensors checkpoint (one frame = one model load)
+    with suite.measure("audio2coeff_load", 1):
+        audio_to_coeff = Audio2Coeff(sadtalker_paths, device)
+    with suite.measure("audio2coeff", batch['num_frames']):
+        coeff_path = audio_to_coeff.generate(batch, work_dir, pose_style=0)
+    audio_to_coeff.batch_frames = 256
+    with suite.measure("audio2coeff_batched", batch['num_frames']):
+        audio_to_coeff.generate(batch, work_dir, pose_style=0)
+
+    with suite.measure("facerender_data", batch['num_frames']):
+        data = get_facerender_data(coeff_path, face_path, first_coeff_path, audio_path,
+                                   opts.batch_size, still_mode=True, preprocess='crop', size=opts.size)
+    generator, kp_extractor, he_estimator, mapping = build_face_renderer(config_dir, device)
+    with suite.measure("make_animation", data['frame_num']):
+        predictions = make_animation(data['source_image'], data['source_semantics'], data['target_semantics_list'],
+                                     generator, kp_extractor, he_estimator, mapping, use_exp=True)
+
+    # paste_pic reads the rendered crop video and muxes audio with ffmpeg
+    predictions = predictions.reshape((-1,) + predictions.shape[2:])[:data['frame_num']]
+    video = (predictions.permute(0, 2, 3, 1).cpu().numpy() * 255).astype(np.uint8)
+    crop_video_path = os.path.join(work_dir, 'crop.mp4')
+    writer = cv2.VideoWriter(crop_video_path, cv2.VideoWriter_fourcc(*'mp4v'), 25, (opts.size, opts.size))
+    for frame in video:
+        writer.write(frame)
+    writer.release()
+
+    if shutil.which('ffmpeg'):
+        inner = (opts.size // 8, opts.size // 8, opts.size * 7 // 8, opts.size * 7 // 8)
+        crop_info = ((opts.size, opts.size), (0, 0, opts.size, opts.size), inner)
+        with suite.measure("paste_pic", data['frame_num']):
+            paste_pic(crop_video_path, face_path, crop_info, audio_path, os.path.join(work_dir, 'full.mp4'))
+    else:
+        suite.skip("paste_pic", "ffmpeg not found")
+
+    shutil.rmtree(work_dir, ignore_errors=True)
+    suite.emit()
+
+
+if __name__ == "__main__":
+    main()
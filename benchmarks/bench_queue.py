@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Queue benchmark: RedisQueue round trip (submit, pop, status updates, progress, read back).
+
+Runs against a local Redis when reachable, otherwise against fakeredis.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from harness import Suite, ORCHESTRATOR_DIR
+
+sys.path.insert(0, ORCHESTRATOR_DIR)
+from queue_manager import RedisQueue
+
+
+def connect(use_fake: bool) -> RedisQueue:
+    """RedisQueue on a local Redis, falling back to fakeredis."""
+    import redis
+    if not use_fake:
+        queue = RedisQueue()
+        try:
+            queue.redis.ping()
+            return queue
+        except redis.ConnectionError:
+            print("Redis not reachable, using fakeredis", file=sys.stderr)
+    import fakeredis
+    return RedisQueue(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue round trip benchmark")
+    parser.add_argument("--jobs", type=int, default=500, help="Number of jobs to push through the queue")
+    parser.add_argument("--fake", action="store_true", help="Always use fakeredis")
+    opts = parser.parse_args()
+
+    queue = connect(opts.fake)
+    suite = Suite("queue")
+    payload = {"text": "Benchmark job", "video_path": "/tmp/face.png", "mode": "motion"}
+
+    # A queue no worker listens on; frames here are jobs, so fps reads as jobs/sec
+    job_ids = []
+    with suite.measure("round_trip", opts.jobs):
+        for _ in range(opts.jobs):
+            job_id = queue.submit_job("benchmark", payload)
+            job_ids.append(job_id)
+            popped = queue.pop_job("benchmark")
+            queue.update_job_status(popped, "processing")
+            queue.report_progress(popped, "render", 1, 1)
+            queue.update_job_status(popped, "completed", result="/tmp/video.mp4")
+            assert queue.get_job_status(job_id)["status"] == "completed"
+
+    queue.redis.delete(*[f"{queue.JOB_PREFIX}{job_id}" for job_id in job_ids])
+    suite.emit()
+
+
+if __name__ == "__main__":
+    main()
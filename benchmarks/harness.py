@@ -0,0 +1,129 @@
+"""
+Shared helpers for the CPU benchmark suites.
+
+Each suite runs real inference code paths with randomly initialized weights and
+generated inputs, measures every stage with `measure()` and prints its results
+as JSON on the last stdout line (collected by run_benchmarks.py).
+"""
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+import wave
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+WAV2LIP_DIR = os.path.join(REPO_ROOT, 'services', 'visual', 'Wav2Lip')
+SADTALKER_DIR = os.path.join(REPO_ROOT, 'services', 'motion', 'SadTalker')
+ORCHESTRATOR_DIR = os.path.join(REPO_ROOT, 'orchestrator')
+
+# Seconds between two RSS samples while a stage runs
+RSS_SAMPLE_INTERVAL = 0.005
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    # Without psutil only the lifetime peak is known (KiB on Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSSSampler:
+    """Samples the process RSS in a background thread and keeps the maximum."""
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+class Suite:
+    """Collects the stage results of one benchmark suite."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, stage: str, frames: int):
+        """Times the block and records frames/sec and peak RSS for the stage."""
+        with PeakRSSSampler() as sampler:
+            start = time.perf_counter()
+            yield
+            seconds = time.perf_counter() - start
+        self.stages[stage] = {
+            "frames": frames,
+            "seconds": round(seconds, 4),
+            "fps": round(frames / seconds, 3) if seconds > 0 else None,
+            "peak_rss_mb": round(sampler.peak / 2 ** 20, 1),
+        }
+        print(f"{self.name}.{stage}: {frames} frames in {seconds:.3f}s", file=sys.stderr)
+
+    def skip(self, stage: str, reason: str):
+        """Marks a stage that cannot run in this environment (e.g. missing ffmpeg)."""
+        self.stages[stage] = {"skipped": reason}
+        print(f"{self.name}.{stage}: skipped ({reason})", file=sys.stderr)
+
+    def emit(self):
+        """Prints the suite results as the final JSON line of stdout."""
+        print(json.dumps({"suite": self.name, "stages": self.stages}))
+
+
+# --- Generated inputs ---
+
+def make_face_image(path: str, size: int = 256):
+    """Writes a synthetic face-like image (skin ellipse, eyes, mouth) as PNG."""
+    import cv2
+    image = np.full((size, size, 3), 200, dtype=np.uint8)
+    center = (size // 2, size // 2)
+    cv2.ellipse(image, center, (size * 3 // 10, size * 4 // 10), 0, 0, 360, (140, 170, 220), -1)
+    for dx in (-1, 1):
+        cv2.circle(image, (size // 2 + dx * size // 8, size * 2 // 5), size // 25, (40, 40, 40), -1)
+    cv2.ellipse(image, (size // 2, size * 2 // 3), (size // 8, size // 25), 0, 0, 360, (60, 60, 160), -1)
+    cv2.imwrite(path, image)
+    return path
+
+
+def make_speech_wav(path: str, seconds: float = 2.0, sr: int = 16000):
+    """Writes a 16-bit mono WAV of voiced, syllable-modulated tones (speech-like spectrum)."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    pitch = 140 + 20 * np.sin(2 * math.pi * 0.5 * t)
+    phase = 2 * math.pi * np.cumsum(pitch) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = 0.5 * (1 + np.sin(2 * math.pi * 4 * t))
+    signal = 0.3 * voiced * envelope + 0.01 * rng.standard_normal(len(t))
+    samples = (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(samples.tobytes())
+    return path
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Orchestrator load test with simulated workers.
+
+Drives POST /pipeline and GET /status at a target rate while mock audio, visual
+and motion workers serve the queues with log-normally distributed service times.
+The real pipeline dispatcher (pipeline_worker.serve) and RedisQueue are used, so
+changes to dispatch and scheduling show up directly in the report:
+
+- API latency p50/p95/p99 per endpoint
+- queue wait per service (started_at - created_at)
+- pipeline end-to-end time (finished_at - created_at)
+- Redis commands per pipeline job
+
+By default the API app runs in-process against fakeredis. With --redis-host the
+queue, workers and app use that Redis; --url sends requests to a running
+orchestrator instead (it must use the same Redis).
+
+Usage:
+    python benchmarks/load_test.py --rate 1000 --duration 60
+    python benchmarks/load_test.py --service-time motion=60 --time-scale 0.01 --workers motion=16
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+from harness import ORCHESTRATOR_DIR, REPO_ROOT
+
+sys.path.insert(0, ORCHESTRATOR_DIR)
+from queue_manager import RedisQueue
+
+# Median service time in seconds per worker type (see Animation Modes in USAGE.md)
+DEFAULT_SERVICE_TIMES = {"audio": 3.0, "visual": 15.0, "motion": 60.0}
+DEFAULT_WORKERS = {"audio": 2, "visual": 2, "motion": 4}
+
+# Idle poll interval of the real workers (services/*/worker.py)
+WORKER_POLL_SECONDS = 1.0
+
+
+class CountingClient:
+    """Wraps a Redis client and counts the commands sent through it."""
+
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.commands = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            with self._lock:
+                self.commands += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def parse_mapping(values, defaults, cast):
+    """Parses ['motion=30', ...] over a dict of defaults."""
+    result = dict(defaults)
+    for item in values or []:
+        key, _, value = item.partition("=")
+        if key not in defaults:
+            raise SystemExit(f"Unknown service '{key}' (expected one of {', '.join(defaults)})")
+        result[key] = cast(value)
+    return result
+
+
+def percentiles(values):
+    """p50/p95/p99 (and count) of a list of seconds, in milliseconds."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)] * 1000, 2)
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99)}
+
+
+def mock_worker(queue, job_type, median, sigma, time_scale, stop_event):
+    """Serves one queue like services/*/worker.py, sleeping a log-normal service time per job."""
+    while not stop_event.is_set():
+        job_id = queue.pop_job(job_type)
+        if not job_id:
+            stop_event.wait(WORKER_POLL_SECONDS * time_scale)
+            continue
+        queue.update_job_status(job_id, "processing")
+        queue.get_job_status(job_id)
+        service_time = random.lognormvariate(math.log(median), sigma) * time_scale
+        queue.report_progress(job_id, "render", 0, 1)
+        time.sleep(service_time)
+        queue.record_timings(job_id, {"stages": {"render": service_time}})
+        queue.update_job_status(job_id, "completed", result=f"/tmp/{job_id}")
+
+
+async def drive_api(client, rate, duration, mode, poll_interval):
+    """Submits pipelines at a Poisson rate and polls /status until every job finishes."""
+    latencies = {"POST /pipeline": [], "GET /status": []}
+    pending, finished, rejected = set(), set(), []
+    body = {"text": "Load test job.", "video_path": "/tmp/face.png", "mode": mode, "generate_subtitles": False}
+    rate_per_second = rate / 60.0
+
+    async def timed_request(name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        latencies[name].append(time.perf_counter() - start)
+        return response
+
+    async def submit():
+        end = time.time() + duration
+        while time.time() < end:
+            response = await timed_request("POST /pipeline", "POST", "/pipeline", json=body)
+            if response.status_code == 429:
+                # admission control (pipeline.max_wait_seconds)
+                rejected.append(response.headers.get("Retry-After"))
+            else:
+                pending.add(response.json()["job_id"])
+            await asyncio.sleep(random.expovariate(rate_per_second))
+
+    async def poll():
+        while True:
+            for job_id in list(pending):
+                response = await timed_request("GET /status", "GET", f"/status/{job_id}")
+                if response.json().get("status") in ("completed", "failed", "cancelled"):
+                    pending.discard(job_id)
+                    finished.add(job_id)
+            await asyncio.sleep(poll_interval)
+
+    poller = asyncio.create_task(poll())
+    await submit()
+    return latencies, pending, finished, rejected, poller
+
+
+def collect_job_stats(queue, pipeline_ids):
+    """Queue wait per child service and pipeline end-to-end times from the job hashes."""
+    queue_wait = {"audio": [], "visual": [], "motion": []}
+    end_to_end, statuses = [], {}
+    for job_id in pipeline_ids:
+        job = queue.get_job_status(job_id) or {}
+        statuses[job.get("status")] = statuses.get(job.get("status"), 0) + 1
+        if job.get("finished_at"):
+            end_to_end.append(float(job["finished_at"]) - float(job["created_at"]))
+        timings = json.loads(job.get("timings") or "{}")
+        for service, child in timings.get("jobs", {}).items():
+            wait = child.get("stages", {}).get("queue_wait")
+            if wait is not None:
+                queue_wait[service].append(wait)
+    return queue_wait, end_to_end, statuses
+
+
+async def run(args):
+    import httpx
+
+    if args.redis_host:
+        import redis
+        raw_client = redis.Redis(host=args.redis_host, port=args.redis_port, decode_responses=True)
+    else:
+        import fakeredis
+        raw_client = fakeredis.FakeRedis(decode_responses=True)
+    counting = CountingClient(raw_client)
+    queue = RedisQueue(client=counting)
+
+    # Keep worker log lines out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+    import pipeline_worker
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        import main as api
+        api.queue = queue
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://loadtest")
+
+    service_times = parse_mapping(args.service_time, DEFAULT_SERVICE_TIMES, float)
+    workers = parse_mapping(args.workers, DEFAULT_WORKERS, int)
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=pipeline_worker.serve, args=(queue, args.pipelines, stop_event), daemon=True)]
+    for job_type, count in workers.items():
+        for _ in range(count):
+            threads.append(threading.Thread(
+                target=mock_worker, daemon=True,
+                args=(queue, job_type, service_times[job_type], args.sigma, args.time_scale, stop_event)))
+    for thread in threads:
+        thread.start()
+
+    start = time.time()
+    latencies, pending, finished, rejected, poller = await drive_api(client, args.rate, args.duration, args.mode,
+                                                          args.poll_interval)
+    # Let the backlog drain before reporting
+    deadline = time.time() + args.drain
+    while pending and time.time() < deadline:
+        await asyncio.sleep(0.5)
+    poller.cancel()
+    elapsed = time.time() - start
+    stop_event.set()
+    await client.aclose()
+    redis_commands = counting.commands
+
+    pipeline_ids = finished | pending
+    queue_wait, end_to_end, statuses = collect_job_stats(queue, pipeline_ids)
+    report = {
+        "config": {"rate_per_min": args.rate, "duration_s": args.duration, "mode": args.mode,
+                   "service_time_median_s": service_times, "sigma": args.sigma, "time_scale": args.time_scale,
+                   "workers": workers, "max_concurrent_pipelines": args.pipelines},
+        "submitted": len(pipeline_ids),
+        "rejected": len(rejected),
+        "statuses": statuses,
+        "unfinished": len(pending),
+        "throughput_per_min": round(len(finished) / elapsed * 60, 1),
+        "api_latency": {name: percentiles(values) for name, values in latencies.items()},
+        "queue_wait": {service: percentiles(values) for service, values in queue_wait.items() if values},
+        "pipeline_end_to_end": percentiles(end_to_end),
+        "redis_commands_per_job": round(redis_commands / max(len(pipeline_ids), 1), 1),
+    }
+
+    # process_pipeline_job creates outputs/{job_id}/ for every pipeline
+    for job_id in pipeline_ids:
+        shutil.rmtree(os.path.join(REPO_ROOT, "outputs", job_id), ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the orchestrator with simulated workers")
+    parser.add_argument("--rate", type=float, default=1000, help="Pipeline submissions per minute")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to keep submitting")
+    parser.add_argument("--drain", type=float, default=60, help="Max seconds to wait for the backlog afterwards")
+    parser.add_argument("--mode", choices=["motion", "lipsync"], default="motion")
+    parser.add_argument("--service-time", nargs="*", metavar="SERVICE=SECONDS",
+                        help="Median service time per worker type (default: audio=3 visual=15 motion=60)")
+    parser.add_argument("--sigma", type=float, default=0.4, help="Log-normal spread of service times")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="Multiplier applied to service times (0.01 turns 60s into 0.6s)")
+    parser.add_argument("--workers", nargs="*", metavar="SERVICE=COUNT",
+                        help="Mock worker count per type (default: audio=2 visual=2 motion=4)")
+    parser.add_argument("--pipelines", type=int, default=3, help="Max concurrent pipelines in the dispatcher")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Client /status poll interval")
+    parser.add_argument("--url", help="Send requests to a running orchestrator instead of the in-process app")
+    parser.add_argument("--redis-host", help="Use this Redis instead of fakeredis")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+    if args.url and not args.redis_host:
+        parser.error("--url needs --redis-host (workers must share the orchestrator's Redis)")
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
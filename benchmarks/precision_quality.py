@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Precision quality/throughput report.
+
+Renders one avatar with the real checkpoints once per precision (fp32, bf16,
+int8), reads the render fps from each run's timings and scores lip sync with the
+SyncNet LSE scripts shipped in services/visual/Wav2Lip/evaluation/scores_LSE:
+
+- LSE-D: mean SyncNet distance between audio and mouth (lower is better)
+- LSE-C: mean SyncNet confidence (higher is better)
+
+Scoring needs a syncnet_python checkout with the scores_LSE scripts copied into
+it (see services/visual/Wav2Lip/evaluation/README.md); without --syncnet_dir
+only throughput is reported. The first int8 run calibrates on this avatar and
+caches the quantized model, so use one of our own avatars here.
+
+Usage:
+    python benchmarks/precision_quality.py --face avatar.png --audio speech.wav --syncnet_dir ~/syncnet_python
+    python benchmarks/precision_quality.py --service motion --face avatar.png --audio speech.wav
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+from harness import WAV2LIP_DIR, SADTALKER_DIR
+
+PRECISIONS = ["fp32", "bf16", "int8"]
+
+
+def render_command(service: str, precision: str, face: str, audio: str, out_dir: str, timings_path: str) -> list:
+    """inference.py command line of the service, as the workers run it."""
+    if service == "visual":
+        checkpoint = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip_gan.pth")
+        if not os.path.exists(checkpoint):
+            checkpoint = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip.pth")
+        return [sys.executable, "inference.py", "--checkpoint_path", checkpoint, "--face", face, "--audio", audio,
+                "--outfile", os.path.join(out_dir, "result.mp4"), "--nosmooth",
+                "--precision", precision, "--timings_path", timings_path]
+    return [sys.executable, "inference.py", "--source_image", face, "--driven_audio", audio,
+            "--checkpoint_dir", os.path.join(SADTALKER_DIR, "checkpoints"), "--result_dir", out_dir,
+            "--size", "256", "--preprocess", "crop", "--still",
+            "--precision", precision, "--timings_path", timings_path]
+
+
+def render(service: str, precision: str, face: str, audio: str, work_dir: str) -> dict:
+    """Renders the avatar with one precision; returns the video path and render fps."""
+    out_dir = os.path.join(work_dir, precision)
+    os.makedirs(out_dir, exist_ok=True)
+    timings_path = os.path.join(out_dir, "timings.json")
+    cwd = WAV2LIP_DIR if service == "visual" else SADTALKER_DIR
+    cmd = render_command(service, precision, os.path.abspath(face), os.path.abspath(audio), out_dir, timings_path)
+    result = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True)
+    videos = sorted(glob.glob(os.path.join(out_dir, "*.mp4")), key=os.path.getmtime)
+    if result.returncode != 0 or not videos:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output"}
+
+    with open(timings_path) as f:
+        timings = json.load(f)
+    render_seconds = timings["stages"].get("render", 0.)
+    return {"video": videos[-1], "frames": timings["frames"],
+            "render_fps": round(timings["frames"] / render_seconds, 2) if render_seconds else None,
+            "model_load_s": round(timings["stages"].get("model_load", 0.), 2)}
+
+
+def parse_lse(output: str):
+    """
+    Averages the "<dist> <conf>" lines printed by calculate_scores_real_videos.py.
+
+    Returns: (LSE-D, LSE-C), or None if no face track was scored.
+    """
+    scores = []
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) != 2:
+            continue
+        try:
+            scores.append((float(parts[0]), float(parts[1])))
+        except ValueError:
+            continue
+    if not scores:
+        return None
+    return (round(sum(d for d, _ in scores) / len(scores), 3),
+            round(sum(c for _, c in scores) / len(scores), 3))
+
+
+def lse_scores(video: str, syncnet_dir: str, data_dir: str):
+    """Runs the scores_LSE steps of calculate_scores_real_videos.sh on one video."""
+    args = ["--videofile", video, "--reference", "wav2lip", "--data_dir", data_dir]
+    subprocess.run([sys.executable, "run_pipeline.py"] + args, cwd=syncnet_dir, capture_output=True, check=True)
+    result = subprocess.run([sys.executable, "calculate_scores_real_videos.py"] + args,
+                            cwd=syncnet_dir, capture_output=True, text=True, check=True)
+    return parse_lse(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare render precisions on throughput and SyncNet LSE")
+    parser.add_argument("--service", choices=["visual", "motion"], default="visual")
+    parser.add_argument("--face", required=True, help="Avatar image (or video for visual)")
+    parser.add_argument("--audio", required=True, help="Driving speech (.wav)")
+    parser.add_argument("--precisions", nargs="+", choices=PRECISIONS, default=PRECISIONS)
+    parser.add_argument("--syncnet_dir", help="syncnet_python checkout with the scores_LSE scripts copied in")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="precision_quality_")
+    report = {"service": args.service, "face": args.face, "audio": args.audio, "precisions": {}}
+    for precision in args.precisions:
+        print(f"Rendering with {precision}...", file=sys.stderr)
+        result = render(args.service, precision, args.face, args.audio, work_dir)
+        if args.syncnet_dir and "video" in result:
+            scores = lse_scores(result["video"], os.path.abspath(args.syncnet_dir),
+                                os.path.join(work_dir, precision, "syncnet"))
+            if scores:
+                result["lse_d"], result["lse_c"] = scores
+        result.pop("video", None)
+        report["precisions"][precision] = result
+
+    print(f"{'precision':<10} {'render fps':>10} {'LSE-D':>8} {'LSE-C':>8}")
+    for precision, result in report["precisions"].items():
+        if "error" in result:
+            print(f"{precision:<10} ERROR: {result['error']}")
+            continue
+        print(f"{precision:<10} {str(result['render_fps']):>10} "
+              f"{str(result.get('lse_d', '-')):>8} {str(result.get('lse_c', '-')):>8}")
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+JayAvatar CPU benchmark runner.
+
+Runs each benchmark suite in its own process (clean peak RSS, no module clashes
+between Wav2Lip and SadTalker), writes a JSON report and compares it against a
+stored baseline. Exits with status 1 when a stage regresses beyond the tolerance.
+
+Usage:
+    python benchmarks/run_benchmarks.py                  # run + compare
+    python benchmarks/run_benchmarks.py --save-baseline  # run + store as baseline
+    python benchmarks/run_benchmarks.py --suites queue lipsync
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SUITES = {
+    "queue": "bench_queue.py",
+    "lipsync": "bench_lipsync.py",
+    "motion": "bench_motion.py",
+}
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+# Allowed relative change before a stage counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+def run_suite(name: str) -> dict:
+    """Runs one suite script and returns its stage results (or the error)."""
+    cmd = [sys.executable, os.path.join(BENCH_DIR, SUITES[name])]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no output"}
+    return json.loads(lines[-1])["stages"]
+
+
+def environment() -> dict:
+    """Machine details stored with the report (baselines are only comparable on the same host)."""
+    info = {"python": platform.python_version(), "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count()}
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares stage fps and peak RSS with the baseline.
+
+    Returns: list of regression messages (empty if none).
+    """
+    regressions = []
+    for suite, stages in report["suites"].items():
+        for stage, current in stages.items():
+            previous = baseline.get("suites", {}).get(suite, {}).get(stage)
+            if not isinstance(current, dict) or not previous or "fps" not in current or "fps" not in previous:
+                continue
+            name = f"{suite}.{stage}"
+            if current["fps"] < previous["fps"] * (1 - tolerance):
+                regressions.append(f"{name}: {current['fps']} fps (baseline {previous['fps']})")
+            if current["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+                regressions.append(f"{name}: {current['peak_rss_mb']} MB peak RSS (baseline {previous['peak_rss_mb']})")
+    return regressions
+
+
+def print_table(report: dict, baseline: dict):
+    print(f"{'stage':<24} {'fps':>10} {'baseline':>10} {'peak RSS MB':>12}")
+    for suite, stages in report["suites"].items():
+        if "error" in stages:
+            print(f"{suite:<24} ERROR: {stages['error']}")
+            continue
+        for stage, result in stages.items():
+            name = f"{suite}.{stage}"
+            if "skipped" in result:
+                print(f"{name:<24} skipped: {result['skipped']}")
+                continue
+            previous = baseline.get("suites", {}).get(suite, {}).get(stage, {})
+            print(f"{name:<24} {result['fps']:>10} {previous.get('fps', '-'):>10} {result['peak_rss_mb']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the JayAvatar CPU benchmarks")
+    parser.add_argument("--suites", nargs="+", choices=list(SUITES), default=list(SUITES))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare against")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the JSON report")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative fps drop / RSS growth (default: 0.15)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    args = parser.parse_args()
+
+    report = {"created_at": time.time(), "environment": environment(), "suites": {}}
+    for name in args.suites:
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        report["suites"][name] = run_suite(name)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(report, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    failed = [name for name, stages in report["suites"].items() if "error" in stages]
+    regressions = compare(report, baseline, args.tolerance) if baseline else []
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Runtime model and admission control for pipeline submissions.
+
+The cost of each service is learned from completed pipelines as seconds of
+processing per second of generated audio (exponential moving averages kept in
+Redis), and the audio length of a text from its characters. A new pipeline is
+predicted to start once the audio work ahead of it is done and to finish after
+the render work ahead of it and its own work. Pipelines whose predicted wait
+exceeds the configured SLO are rejected (429 with Retry-After in main.py).
+
+Only pipelines are counted: standalone /motion and /animate jobs are not
+predicted, so on workers they share the estimates are optimistic.
+"""
+import json
+import time
+import uuid
+
+import redis
+
+MODEL_KEY = "jayavatar:runtime_model"
+# Pipelines submitted and not yet finished (and reservations of ones being
+# submitted), whose remaining work is ahead of new ones
+ACTIVE_KEY = "jayavatar:pipelines:active"
+# Seconds a reservation counts if its submission never registers (e.g. API crash)
+RESERVATION_TTL = 60
+
+# Priors until the first pipelines complete: "speech" is audio seconds per character
+# of text, the others processing seconds per audio second of a service (and quality)
+DEFAULT_RATES = {
+    "speech": 0.07,
+    "audio": 0.5,
+    "motion": 6.0,
+    "motion_draft": 2.0,
+    "visual": 1.5,
+    "visual_draft": 1.0,
+}
+
+# Weight of the newest observation in the moving averages
+SMOOTHING = 0.2
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+def render_service(mode: str) -> str:
+    """Service rendering the video of a pipeline mode."""
+    return "visual" if mode == "lipsync" else "motion"
+
+
+def load_rates(queue) -> dict:
+    stored = queue.redis.hgetall(MODEL_KEY)
+    return {name: float(stored.get(name, default)) for name, default in DEFAULT_RATES.items()}
+
+
+def observe(queue, name: str, value: float):
+    """Moves the rate `name` towards one observation."""
+    old = queue.redis.hget(MODEL_KEY, name)
+    rate = value if old is None else (1 - SMOOTHING) * float(old) + SMOOTHING * value
+    queue.redis.hset(MODEL_KEY, name, rate)
+
+
+def processing_seconds(job: dict):
+    """Seconds between a job's start and finish (None if it did not run to completion)."""
+    if not job or job.get("status") != "completed" or not job.get("started_at"):
+        return None
+    return float(job["finished_at"]) - float(job["started_at"])
+
+
+def learn(queue, text: str, audio_seconds: float, child_jobs: dict, quality: str = "final"):
+    """
+    Updates the rates from a completed pipeline.
+
+    Args:
+        audio_seconds: length of the generated audio (None if unknown)
+        child_jobs: child name ('audio', 'motion', 'motion_draft', ...) -> child job id
+    """
+    if not audio_seconds or not text:
+        return
+    observe(queue, "speech", audio_seconds / len(text))
+    for name, child_id in child_jobs.items():
+        seconds = processing_seconds(queue.get_job_status(child_id))
+        rate = f"{name}_draft" if quality == "draft" and name in ("motion", "visual") else name
+        if seconds is not None and rate in DEFAULT_RATES:
+            observe(queue, rate, seconds / audio_seconds)
+
+
+def pipeline_work(rates: dict, text: str, mode: str, quality: str = "final", preview: bool = False) -> dict:
+    """Predicted processing seconds of a pipeline on each service."""
+    audio_seconds = len(text) * rates["speech"]
+    service = render_service(mode)
+    render_rate = rates[f"{service}_draft"] if quality == "draft" else rates[service]
+    if preview and quality == "final":
+        render_rate += rates[f"{service}_draft"]
+    return {"audio": audio_seconds * rates["audio"], service: audio_seconds * render_rate}
+
+
+def remaining_work(job: dict, now: float) -> dict:
+    """Work of an active pipeline still to do: its prediction less the time it has been running, audio first."""
+    work = json.loads(job.get("work") or "{}")
+    elapsed = now - float(job["started_at"]) if job.get("started_at") else 0.0
+    remaining = {}
+    for service in ["audio"] + [s for s in work if s != "audio"]:
+        seconds = work.get(service, 0.0)
+        remaining[service] = max(0.0, seconds - elapsed)
+        elapsed = max(0.0, elapsed - seconds)
+    return remaining
+
+
+def backlog(queue, now: float = None) -> dict:
+    """Remaining predicted seconds of all active pipelines per service; drops finished ones from the set."""
+    now = now or time.time()
+    job_ids = list(queue.redis.smembers(ACTIVE_KEY))
+    # one round trip for all active pipelines
+    reads = queue.redis.pipeline(transaction=False)
+    for job_id in job_ids:
+        reads.hgetall(f"{queue.JOB_PREFIX}{job_id}")
+    ahead = {}
+    for job_id, job in zip(job_ids, reads.execute()):
+        if not job or job.get("status") in TERMINAL_STATUSES:
+            queue.redis.srem(ACTIVE_KEY, job_id)
+            continue
+        for service, seconds in remaining_work(job, now).items():
+            ahead[service] = ahead.get(service, 0.0) + seconds
+    return ahead
+
+
+def predict(work: dict, ahead: dict, processes: dict, now: float) -> dict:
+    """
+    Start and finish time of a pipeline with `work`, behind `ahead` seconds of work per
+    service shared by processes[service] processes.
+
+    Returns: dict with estimated_start, estimated_finish (unix time) and wait (seconds
+    spent queued rather than processed).
+    """
+    service = next(s for s in work if s != "audio")
+    audio_wait = ahead.get("audio", 0.0) / max(1, processes.get("audio", 1))
+    # render work ahead drains while this pipeline waits for and generates its audio
+    render_wait = max(0.0, ahead.get(service, 0.0) / max(1, processes.get(service, 1)) - audio_wait - work["audio"])
+    wait = audio_wait + render_wait
+    return {"estimated_start": now + audio_wait,
+            "estimated_finish": now + wait + work["audio"] + work[service],
+            "wait": wait}
+
+
+def estimate(queue, text: str, mode: str, processes: dict, quality: str = "final", preview: bool = False) -> dict:
+    """Predicted work and timing of a pipeline submitted now (see predict), to be stored with register."""
+    now = time.time()
+    work = pipeline_work(load_rates(queue), text, mode, quality, preview)
+    return {"work": work, **predict(work, backlog(queue, now), processes, now)}
+
+
+def admit(queue, text: str, mode: str, processes: dict, max_wait: float, quality: str = "final",
+          preview: bool = False) -> dict:
+    """
+    Estimates a pipeline submitted now (see estimate) and, unless its wait exceeds
+    max_wait (0: no limit), reserves its work in the backlog until register or
+    release. The backlog is read and the reservation added in one WATCH
+    transaction on the active set, so concurrent submissions count each other.
+
+    Returns: the estimate, with 'reservation' set when the pipeline is admitted.
+    """
+    while True:
+        with queue.redis.pipeline() as pipe:
+            pipe.watch(ACTIVE_KEY)
+            result = estimate(queue, text, mode, processes, quality, preview)
+            if max_wait and result["wait"] > max_wait:
+                return result
+            reservation = f"reservation:{uuid.uuid4()}"
+            pipe.multi()
+            pipe.hset(f"{queue.JOB_PREFIX}{reservation}", "work", json.dumps(result["work"]))
+            pipe.expire(f"{queue.JOB_PREFIX}{reservation}", RESERVATION_TTL)
+            pipe.sadd(ACTIVE_KEY, reservation)
+            try:
+                pipe.execute()
+            except redis.WatchError:
+                # another submission changed the backlog in between
+                continue
+        return {**result, "reservation": reservation}
+
+
+def release(queue, estimate: dict):
+    """Drops the reservation of an admitted estimate (its submission was coalesced instead)."""
+    if estimate.get("reservation"):
+        queue.redis.srem(ACTIVE_KEY, estimate["reservation"])
+        queue.redis.delete(f"{queue.JOB_PREFIX}{estimate['reservation']}")
+
+
+def register(queue, job_id: str, estimate: dict):
+    """Stores a submitted pipeline's estimate and counts its work (instead of its reservation) ahead of later submissions."""
+    pipe = queue.redis.pipeline()
+    pipe.hset(f"{queue.JOB_PREFIX}{job_id}", mapping={
+        "work": json.dumps(estimate["work"]),
+        "estimated_start": estimate["estimated_start"],
+        "estimated_finish": estimate["estimated_finish"],
+    })
+    pipe.sadd(ACTIVE_KEY, job_id)
+    if estimate.get("reservation"):
+        pipe.srem(ACTIVE_KEY, estimate["reservation"])
+        pipe.delete(f"{queue.JOB_PREFIX}{estimate['reservation']}")
+    pipe.execute()
@@ -59,6 +59,15 @@ def get(section: str, key: str, default=None, env_var: str = None):
 def pipeline_max_concurrent():
     return get('pipeline', 'max_concurrent', default=3, env_var='MAX_CONCURRENT_PIPELINES')
 
+def pipeline_max_wait():
+    """Longest predicted queueing time (seconds) of an accepted pipeline; 0 accepts every submission."""
+    return get('pipeline', 'max_wait_seconds', default=0, env_var='PIPELINE_MAX_WAIT')
+
+def pipeline_single_flight():
+    """(enabled, ttl_seconds): identical pipeline requests in flight share one job; ttl bounds a registration."""
+    return (get('pipeline', 'single_flight', default=True, env_var='PIPELINE_SINGLE_FLIGHT'),
+            get('pipeline', 'single_flight_ttl', default=3600, env_var='PIPELINE_SINGLE_FLIGHT_TTL'))
+
 def motion_timeout():
     return get('motion', 'timeout_seconds', default=300, env_var='MOTION_TIMEOUT')
 
@@ -68,14 +77,121 @@ def motion_size():
 def motion_still():
     return get('motion', 'still', default=True, env_var='MOTION_STILL')
 
+def motion_preprocess():
+    return get('motion', 'preprocess', default='full', env_var='MOTION_PREPROCESS')
+
+def motion_enhancer():
+    """Face enhancer of final renders ('gfpgan', or None when null/'none')."""
+    enhancer = get('motion', 'enhancer', default='gfpgan', env_var='MOTION_ENHANCER')
+    return None if not enhancer or enhancer == 'none' else enhancer
+
+def motion_quality(tier='final', motion_preset=None):
+    """
+    SadTalker settings of a quality tier: size, preprocess, still, enhancer,
+    paste ('seamless' or 'fast') and render_fps (frames rendered per second of
+    the 25 fps video). draft: draft_size, no enhancer, fast paste, draft_fps.
+    still is off with a motion preset: still mode replaces the preset's head
+    motion with the source pose.
+    """
+    still = motion_still() and not motion_preset
+    if tier == 'draft':
+        return {'size': get('motion', 'draft_size', default=256, env_var='MOTION_DRAFT_SIZE'),
+                'preprocess': motion_preprocess(), 'still': still, 'enhancer': None, 'paste': 'fast',
+                'render_fps': get('motion', 'draft_fps', default=12.5, env_var='MOTION_DRAFT_FPS')}
+    return {'size': motion_size(), 'preprocess': motion_preprocess(), 'still': still,
+            'enhancer': motion_enhancer(), 'paste': 'seamless', 'render_fps': 25.0}
+
+def motion_precision():
+    """Face renderer precision: fp32, bf16 or int8 (see config.yaml)."""
+    return get('motion', 'precision', default='fp32', env_var='MOTION_PRECISION')
+
+def motion_coeff_batch_frames():
+    """Frames per Audio2Exp/Audio2Pose forward (0 = per-window loop)."""
+    return get('motion', 'coeff_batch_frames', default=0, env_var='MOTION_COEFF_BATCH_FRAMES')
+
+def motion_skip_silence():
+    """Render only an idle loop in pauses of the driving audio."""
+    return get('motion', 'skip_silence', default=False, env_var='MOTION_SKIP_SILENCE')
+
+def motion_render_shards():
+    """(shards, min_frames): time shards a long clip's render is split into, and the shortest shard."""
+    return (get('motion', 'render_shards', default=1, env_var='MOTION_RENDER_SHARDS'),
+            get('motion', 'shard_min_frames', default=250, env_var='MOTION_SHARD_MIN_FRAMES'))
+
+def motion_library_dir():
+    """Directory of the motion presets added with SadTalker/add_motion_preset.py."""
+    return get('motion', 'library_dir', default=os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'library'),
+               env_var='MOTION_LIBRARY_DIR')
+
 def audio_timeout():
     return get('audio', 'timeout_seconds', default=120, env_var='AUDIO_TIMEOUT')
 
 def visual_timeout():
     return get('visual', 'timeout_seconds', default=180, env_var='VISUAL_TIMEOUT')
 
+def visual_process_timeout():
+    """Seconds a Wav2Lip subprocess may run before it is stopped (None = no limit)."""
+    return get('visual', 'process_timeout_seconds', default=3600, env_var='VISUAL_PROCESS_TIMEOUT') or None
+
+def visual_backend():
+    return get('visual', 'backend', default='eager', env_var='VISUAL_BACKEND')
+
+def visual_precision():
+    """Wav2Lip precision: fp32, bf16 or int8 (see config.yaml)."""
+    return get('visual', 'precision', default='fp32', env_var='VISUAL_PRECISION')
+
+def visual_threads():
+    """(intra_op, inter_op) thread counts for the Wav2Lip runtime (0 = runtime default)."""
+    return (get('visual', 'intra_op_threads', default=0, env_var='VISUAL_INTRA_OP_THREADS'),
+            get('visual', 'inter_op_threads', default=0, env_var='VISUAL_INTER_OP_THREADS'))
+
+def visual_autotune():
+    """Use (and on first use, tune) per-resolution batch size profiles for Wav2Lip."""
+    return get('visual', 'autotune', default=False, env_var='VISUAL_AUTOTUNE')
+
+def visual_detection():
+    """(detect_every, detect_scale) of Wav2Lip's keyframe face detection (1, 1.0 = every frame)."""
+    return (get('visual', 'detect_every', default=1, env_var='VISUAL_DETECT_EVERY'),
+            get('visual', 'detect_scale', default=1.0, env_var='VISUAL_DETECT_SCALE'))
+
+def visual_skip_silence():
+    """Copy the input frames through pauses of the driving audio instead of running Wav2Lip."""
+    return get('visual', 'skip_silence', default=False, env_var='VISUAL_SKIP_SILENCE')
+
+def visual_batch_server():
+    """Run Wav2Lip for all lipsync jobs in one micro-batching server process."""
+    return get('visual', 'batch_server', default=False, env_var='VISUAL_BATCH_SERVER')
+
+def visual_batch_server_options():
+    """(port, batch_size, max_wait_ms) of the Wav2Lip batch server."""
+    return (get('visual', 'batch_server_port', default=9190, env_var='VISUAL_BATCH_SERVER_PORT'),
+            get('visual', 'batch_server_batch_size', default=128, env_var='VISUAL_BATCH_SERVER_BATCH_SIZE'),
+            get('visual', 'batch_server_max_wait_ms', default=50, env_var='VISUAL_BATCH_SERVER_MAX_WAIT_MS'))
+
+def visual_batch_server_job_batch_size():
+    """
+    Frames each lipsync job sends the batch server per request: the server batch
+    split between the jobs running at once (the visual fork server children), so
+    that concurrent full batches fill one forward together.
+    """
+    batch_size = int(visual_batch_server_options()[1])
+    return max(1, batch_size // max(1, int(forkserver_children('visual'))))
+
 def redis_host():
     return get('redis', 'host', default='localhost', env_var='REDIS_HOST')
 
 def redis_port():
     return get('redis', 'port', default=6379, env_var='REDIS_PORT')
+
+METRICS_DEFAULT_PORTS = {'audio': 9101, 'visual': 9102, 'motion': 9103, 'pipeline': 9104}
+
+def metrics_port(service: str):
+    """Port of a worker's embedded metrics exporter (None when metrics are disabled)."""
+    if not get('metrics', 'enabled', default=True, env_var='METRICS_ENABLED'):
+        return None
+    return get('metrics', f'{service}_port', default=METRICS_DEFAULT_PORTS.get(service),
+               env_var=f'{service.upper()}_METRICS_PORT')
+
+def forkserver_children(service: str):
+    """Job-executing children forked from a preloaded worker (0 = single-process worker)."""
+    return get('forkserver', f'{service}_children', default=0, env_var=f'{service.upper()}_FORK_CHILDREN')
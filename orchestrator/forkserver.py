@@ -0,0 +1,188 @@
+"""
+Pre-forked worker supervisor.
+
+The parent process imports the worker's libraries and preloads whatever the
+service keeps in-process (XTTS, GFPGAN) once, then forks job-executing children
+that share those pages copy-on-write. A crashed child is replaced by a fresh fork
+of the parent in milliseconds instead of a full cold start, and extra children
+can be added at runtime:
+
+    kill -TTIN <parent pid>   # one more child
+    kill -TTOU <parent pid>   # one child less
+    kill -TERM <parent pid>   # stop parent and children
+
+A child stopped by SIGTERM (scale-down or shutdown) raises Terminated in its job
+loop: a running inference subprocess is stopped with its process group (see
+job_progress.run_with_progress) and child_main fails the job it was running.
+
+POSIX only (os.fork); workers fall back to a single process elsewhere.
+"""
+import gc
+import logging
+import os
+import random
+import signal
+import time
+
+logger = logging.getLogger(__name__)
+
+HAS_FORK = hasattr(os, "fork")
+
+# A child that exits sooner than this is considered crash-looping
+MIN_CHILD_UPTIME = 5.0
+# Upper bound of the restart delay for crash-looping children
+MAX_RESTART_DELAY = 10.0
+# Seconds between two checks of the children
+SUPERVISE_INTERVAL = 0.1
+
+
+class Terminated(BaseException):
+    """A fork server child received SIGTERM; unwinds the job it is running."""
+
+
+def _terminate(signum, frame):
+    raise Terminated()
+
+
+class ForkServer:
+    """
+    Keeps `children` forked copies of child_main running.
+
+    child_main(index) runs in each child (connect to Redis, move models to the GPU,
+    run the job loop); index is the child's slot, stable across restarts. It should
+    fail its running job on Terminated and re-raise.
+    """
+
+    def __init__(self, service: str, child_main, children: int = 1):
+        self.service = service
+        self.child_main = child_main
+        self.target = max(1, children)
+        self.slots = {}            # pid -> (index, started_at)
+        self.retiring = set()      # pids asked to exit after a scale-down
+        self.quick_exits = 0       # consecutive children that died young
+        self.stopping = False
+
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            # Child: default signal handling (SIGTERM unwinds the job), own random state
+            for sig in (signal.SIGTTIN, signal.SIGTTOU):
+                signal.signal(sig, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, _terminate)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            random.seed()
+            code = 0
+            try:
+                self.child_main(index)
+            except (KeyboardInterrupt, Terminated):
+                pass
+            except BaseException:
+                logger.exception(f"[{self.service}] child {index} crashed")
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+
+        self.slots[pid] = (index, time.time())
+        logger.info(f"[{self.service}] started child {index} (PID {pid})")
+
+    def _free_index(self) -> int:
+        used = {index for index, _ in self.slots.values()}
+        return next(i for i in range(len(used) + 1) if i not in used)
+
+    def _reap(self):
+        while self.slots or self.retiring:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            index, started_at = self.slots.pop(pid, (None, time.time()))
+            uptime = time.time() - started_at
+            logger.warning(f"[{self.service}] child {index} (PID {pid}) exited with status "
+                           f"{os.waitstatus_to_exitcode(status)} after {uptime:.1f}s")
+            self.quick_exits = self.quick_exits + 1 if uptime < MIN_CHILD_UPTIME else 0
+
+    def _restart_delay(self) -> float:
+        """No delay for a single crash; exponential backoff while children keep dying young."""
+        if self.quick_exits <= 1:
+            return 0.0
+        return min(0.5 * 2 ** (self.quick_exits - 2), MAX_RESTART_DELAY)
+
+    def _on_signal(self, signum, frame):
+        if signum == signal.SIGTTIN:
+            self.target += 1
+        elif signum == signal.SIGTTOU:
+            self.target = max(1, self.target - 1)
+        else:
+            self.stopping = True
+
+    def serve(self):
+        """Forks the children and supervises them until SIGTERM/SIGINT."""
+        # Keep preloaded objects out of the cyclic GC so collections in the
+        # children do not touch (and un-share) their pages
+        gc.collect()
+        gc.freeze()
+
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(sig, self._on_signal)
+        logger.info(f"[{self.service}] fork server (PID {os.getpid()}) running {self.target} children")
+
+        while not self.stopping:
+            self._reap()
+            if len(self.slots) < self.target:
+                time.sleep(self._restart_delay())
+                self._spawn(self._free_index())
+                continue
+            if len(self.slots) > self.target:
+                pid = max(self.slots, key=lambda p: self.slots[p][0])
+                os.kill(pid, signal.SIGTERM)
+                self.slots.pop(pid)
+                self.retiring.add(pid)
+            time.sleep(SUPERVISE_INTERVAL)
+
+        self.stop()
+
+    def stop(self, timeout: float = 10.0):
+        """Terminates the children, killing those still alive after the timeout."""
+        for pid in list(self.slots):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            self.retiring.add(pid)
+        self.slots.clear()
+        deadline = time.time() + timeout
+        while self.retiring and time.time() < deadline:
+            self._reap()
+            time.sleep(SUPERVISE_INTERVAL)
+        for pid in self.retiring:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        logger.info(f"[{self.service}] fork server stopped")
+
+
+def configured_children(service: str) -> int:
+    """Number of forked children configured for a worker (0 when disabled or unsupported)."""
+    if not HAS_FORK:
+        return 0
+    try:
+        import config
+        return config.forkserver_children(service)
+    except ImportError:
+        return 0
+
+
+def serve(service: str, child_main, children: int = 1):
+    """Runs child_main in `children` forked processes, or directly when fork is unavailable."""
+    if not HAS_FORK:
+        logger.warning("os.fork not available; running a single worker process.")
+        child_main(0)
+        return
+    ForkServer(service, child_main, children).serve()
@@ -0,0 +1,229 @@
+"""
+Progress reporting for worker subprocesses.
+
+Wav2Lip and SadTalker report progress through tqdm bars on stderr
+(e.g. 'Face Renderer:', 'Face Enhancer:', 'seamlessClone:'). This module
+parses those bars and forwards them to Redis as structured progress
+(stage, frames done / total, ETA) so clients can follow a job live.
+It also stops the subprocess (and everything it started) when the job is
+cancelled.
+"""
+import json
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+
+# tqdm bar, e.g. "Face Renderer::  45%|####5     | 45/100 [00:10<00:12,  4.50it/s]"
+TQDM_PATTERN = re.compile(
+    r'(?:(?P<desc>[^|\r\n]*?):*\s*)?(?P<percent>\d+)%\|[^|]*\|\s*'
+    r'(?P<done>\d+)/(?P<total>\d+)\s*\[(?P<elapsed>[\d:]+)<(?P<remaining>[\d:?]+)'
+)
+
+# Canonical stage names for the tqdm descriptions used by the inference scripts
+STAGE_NAMES = {
+    'landmark Det': 'face_detect',
+    'Face Detection': 'face_detect',
+    '3DMM Extraction In Video': '3dmm',
+    'mel': 'mel',
+    'audio2exp': 'audio2coeff',
+    'Face Renderer': 'render',
+    'Wav2Lip Inference': 'render',
+    'seamlessClone': 'paste',
+    'Fast Paste': 'paste',
+    'Face Enhancer': 'enhance',
+}
+
+# Minimum seconds between two progress reports of the same stage
+REPORT_INTERVAL = 0.5
+
+# Seconds between checks of a job's cancel flag while its subprocess runs
+CANCEL_POLL_INTERVAL = 1.0
+
+# Seconds a stopped subprocess gets to exit on SIGTERM before it is killed
+TERMINATE_GRACE = 5.0
+
+
+class JobCancelled(Exception):
+    """The job was cancelled (DELETE /jobs/{id}) while a worker ran it."""
+
+
+def parse_duration(text: str):
+    """Converts a tqdm 'MM:SS' or 'H:MM:SS' duration to seconds (None if unknown)."""
+    if not text or '?' in text:
+        return None
+    seconds = 0
+    for part in text.split(':'):
+        seconds = seconds * 60 + int(part)
+    return float(seconds)
+
+
+def parse_tqdm_line(line: str):
+    """
+    Parses one tqdm progress line.
+
+    Returns: dict with stage, done, total, elapsed, eta, or None if the line is not a bar.
+    """
+    match = TQDM_PATTERN.search(line)
+    if not match:
+        return None
+
+    desc = (match.group('desc') or '').strip().rstrip(':').strip()
+    return {
+        "stage": STAGE_NAMES.get(desc, desc.lower().replace(' ', '_') or 'processing'),
+        "done": int(match.group('done')),
+        "total": int(match.group('total')),
+        "elapsed": parse_duration(match.group('elapsed')),
+        "eta": parse_duration(match.group('remaining')),
+    }
+
+
+def read_timings(path: str):
+    """
+    Loads the timing breakdown written by an inference script (--timings_path).
+
+    Returns: dict with frames, total and stages (seconds per stage), or None if unavailable.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ProgressReporter:
+    """Throttles progress updates of a job before they are written to Redis."""
+
+    def __init__(self, queue, job_id: str, interval: float = REPORT_INTERVAL):
+        self.queue = queue
+        self.job_id = job_id
+        self.interval = interval
+        self._last = {}
+
+    def update(self, stage: str, done: int, total: int, eta=None):
+        now = time.time()
+        last_time, last_done = self._last.get(stage, (0.0, None))
+        finished = total and done >= total
+        if done == last_done or (not finished and now - last_time < self.interval):
+            return
+        self._last[stage] = (now, done)
+        try:
+            self.queue.report_progress(self.job_id, stage, done, total, eta=eta)
+        except Exception:
+            # Progress is best-effort; never fail a job because of it
+            pass
+
+
+def _read_stream(stream, on_line, chunks):
+    """Reads a text stream, splitting on both '\\r' (tqdm redraws) and '\\n'."""
+    buffer = ''
+    for chunk in iter(lambda: stream.read(256), ''):
+        buffer += chunk
+        parts = re.split(r'[\r\n]', buffer)
+        buffer = parts.pop()
+        for line in parts:
+            on_line(line, chunks)
+    if buffer:
+        on_line(buffer, chunks)
+    stream.close()
+
+
+def stop_process_group(process, grace: float = TERMINATE_GRACE):
+    """
+    Stops a subprocess started in its own session, with the processes it spawned
+    (ffmpeg, DataLoader workers): SIGTERM, then SIGKILL after grace seconds.
+    """
+    if os.name != 'posix':
+        process.kill()
+        process.wait()
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=grace)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    # what is left of the group (or a leader ignoring SIGTERM)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def process_rss(pid: int):
+    """Resident memory of a running process in bytes (Linux /proc; None elsewhere or once it exited)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def run_with_progress(cmd, queue, job_id: str, cwd=None, env=None, timeout=None):
+    """
+    Runs an inference subprocess, streaming its tqdm progress into the job record.
+
+    Mirrors subprocess.run(capture_output=True, text=True): returns a CompletedProcess
+    and raises subprocess.TimeoutExpired when the timeout is exceeded. Progress bar
+    redraws are dropped from the captured stderr. The subprocess runs in its own
+    process group, which is stopped on timeout or when the job is cancelled
+    (raises JobCancelled). The returned process's peak_rss is the largest RSS of the
+    subprocess sampled while it ran (None if never sampled).
+    """
+    reporter = ProgressReporter(queue, job_id)
+
+    def on_stderr(line, chunks):
+        progress = parse_tqdm_line(line)
+        if progress:
+            reporter.update(progress["stage"], progress["done"], progress["total"], eta=progress["eta"])
+        elif line.strip():
+            chunks.append(line + '\n')
+
+    def on_stdout(line, chunks):
+        chunks.append(line + '\n')
+
+    process = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, start_new_session=os.name == 'posix')
+    stdout_chunks, stderr_chunks = [], []
+    readers = [
+        threading.Thread(target=_read_stream, args=(process.stdout, on_stdout, stdout_chunks), daemon=True),
+        threading.Thread(target=_read_stream, args=(process.stderr, on_stderr, stderr_chunks), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    deadline = None if timeout is None else time.time() + timeout
+    peak_rss = None
+    try:
+        while True:
+            wait = CANCEL_POLL_INTERVAL if deadline is None else min(CANCEL_POLL_INTERVAL, deadline - time.time())
+            try:
+                process.wait(timeout=max(wait, 0))
+                break
+            except subprocess.TimeoutExpired:
+                rss = process_rss(process.pid)
+                if rss is not None:
+                    peak_rss = max(rss, peak_rss or 0)
+                if queue.is_cancelled(job_id):
+                    raise JobCancelled(job_id)
+                if deadline is not None and time.time() >= deadline:
+                    raise subprocess.TimeoutExpired(cmd, timeout)
+    except BaseException:
+        # also on KeyboardInterrupt, which no longer reaches the subprocess's own session
+        stop_process_group(process)
+        raise
+    finally:
+        for reader in readers:
+            reader.join(timeout=5)
+
+    completed = subprocess.CompletedProcess(cmd, process.returncode,
+                                            ''.join(stdout_chunks), ''.join(stderr_chunks))
+    completed.peak_rss = peak_rss
+    return completed
@@ -1,11 +1,23 @@
-from fastapi import FastAPI, HTTPException
+import json
+import math
+import os
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from schemas import JobRequest, JobResponse, VisualRequest, PipelineRequest, MotionRequest
-from queue_manager import RedisQueue
+from queue_manager import RedisQueue, request_fingerprint
+import metrics
+import config
+import admission
+import redis.asyncio as aioredis
 import uvicorn
 
 app = FastAPI(title="JayAvatar Orchestrator")
 queue = RedisQueue()
 
+# Seconds between SSE keep-alive comments while a job is quiet
+EVENTS_KEEPALIVE_SECONDS = 15
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
 @app.post("/generate", response_model=JobResponse)
 async def generate_audio(request: JobRequest):
     job_id = queue.submit_job("audio", request.model_dump())
@@ -16,17 +28,61 @@ async def animate_face(request: VisualRequest):
     job_id = queue.submit_job("visual", request.model_dump())
     return JobResponse(job_id=job_id, status="queued")
 
+def motion_presets():
+    library_dir = config.motion_library_dir()
+    if not os.path.isdir(library_dir):
+        return []
+    return sorted(f[:-4] for f in os.listdir(library_dir) if f.endswith('.npy'))
+
+def check_motion_preset(name):
+    if name is not None and name not in motion_presets():
+        raise HTTPException(status_code=400, detail=f"Unknown motion preset: {name}")
+
+def job_response(job_id: str, decision: str) -> JobResponse:
+    """Response of an accepted or coalesced pipeline, with the estimates stored by admission.register."""
+    metrics.observe_admission(decision)
+    status = queue.get_job_status(job_id)
+    estimated = {key: float(status[key]) for key in ("estimated_start", "estimated_finish") if status.get(key)}
+    return JobResponse(job_id=job_id, status=status["status"], **estimated)
+
 @app.post("/pipeline", response_model=JobResponse)
 async def run_pipeline(request: PipelineRequest):
-    job_id = queue.submit_job("pipeline", request.model_dump())
-    return JobResponse(job_id=job_id, status="queued")
+    check_motion_preset(request.motion_preset)
+    payload = request.model_dump()
+    single_flight, ttl = config.pipeline_single_flight()
+    fingerprint = request_fingerprint("pipeline", payload) if single_flight else None
+    primary_id = queue.in_flight(fingerprint) if fingerprint else None
+    if primary_id:
+        # an identical request is in flight: no new work, so no admission check
+        return job_response(queue.add_alias(primary_id), "coalesced")
+
+    processes = {service: max(1, config.forkserver_children(service)) for service in ("audio", "motion", "visual")}
+    max_wait = config.pipeline_max_wait()
+    estimate = admission.admit(queue, request.text, request.mode, processes, max_wait, request.quality, request.preview)
+    if not estimate.get("reservation"):
+        metrics.observe_admission("rejected")
+        raise HTTPException(status_code=429, detail=f"Predicted wait of {estimate['wait']:.0f}s exceeds {max_wait}s",
+                            headers={"Retry-After": str(math.ceil(estimate["wait"] - max_wait))})
+    job_id = queue.submit_job("pipeline", payload, fingerprint=fingerprint, ttl=ttl)
+    if queue.resolve_alias(job_id) != job_id:
+        # an identical request was registered in the meantime
+        admission.release(queue, estimate)
+        return job_response(job_id, "coalesced")
+    admission.register(queue, job_id, estimate)
+    return job_response(job_id, "accepted")
 
 @app.post("/motion", response_model=JobResponse)
 async def generate_motion(request: MotionRequest):
     """Generate talking head video with natural motion (SadTalker)."""
+    check_motion_preset(request.motion_preset)
     job_id = queue.submit_job("motion", request.model_dump())
     return JobResponse(job_id=job_id, status="queued")
 
+@app.get("/motion/presets")
+async def list_motion_presets():
+    """Names accepted as motion_preset by /motion and /pipeline."""
+    return {"presets": motion_presets()}
+
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
     status = queue.get_job_status(job_id)
@@ -34,5 +90,75 @@ async def get_status(job_id: str):
         raise HTTPException(status_code=404, detail="Job not found")
     return status
 
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def job_event_stream(job_id: str):
+    """Yields the job's current state, then its status/progress events until it finishes."""
+    client = aioredis.Redis(host=queue.host, port=queue.port, db=queue.db, decode_responses=True)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    # an alias streams the events of its job
+    target_id = queue.resolve_alias(job_id)
+    try:
+        # Subscribe before reading the snapshot so no event is lost in between
+        await pubsub.subscribe(queue.events_channel(target_id))
+
+        status = queue.get_job_status(job_id) or {}
+        yield format_sse("status", {"job_id": job_id, "status": status.get("status"),
+                                    "result": status.get("result"), "error": status.get("error")})
+        if status.get("progress"):
+            yield format_sse("progress", {"job_id": job_id, **json.loads(status["progress"])})
+        if status.get("draft_result"):
+            yield format_sse("draft", {"job_id": job_id, "result": status["draft_result"]})
+        if status.get("status") in TERMINAL_STATUSES:
+            return
+
+        while True:
+            message = await pubsub.get_message(timeout=EVENTS_KEEPALIVE_SECONDS)
+            if message is None:
+                yield ": keep-alive\n\n"
+                continue
+
+            event = json.loads(message["data"])
+            yield format_sse(event.get("type", "message"), event)
+
+            # Child job events are forwarded too; only this job's own status ends the stream
+            if event.get("job_id") == target_id and event.get("status") in TERMINAL_STATUSES:
+                return
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancels a job and its child jobs. Queued jobs end at once; running ones are
+    stopped by their worker (subprocess group killed) within about a second.
+    """
+    status = queue.get_job_status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status.get("status") in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {status['status']}")
+    cancelled = queue.cancel_job(job_id)
+    if not cancelled:
+        # the original request of a job its aliases still wait for
+        return {"job_id": job_id, "cancelled": [], "detached": True}
+    return {"job_id": job_id, "cancelled": cancelled}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events stream of a job's status and per-stage frame progress."""
+    if not queue.get_job_status(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_event_stream(job_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint (queue depths are refreshed on every scrape)."""
+    metrics.update_queue_depths(queue)
+    return Response(content=metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
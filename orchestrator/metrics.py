@@ -0,0 +1,138 @@
+"""
+Prometheus metrics shared by the orchestrator and the workers.
+
+The orchestrator serves them on GET /metrics; each worker runs an embedded
+exporter on its own port (see the 'metrics' section of config.yaml).
+If prometheus_client is not installed every metric is a no-op.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, start_http_server, generate_latest, CONTENT_TYPE_LATEST
+    HAS_PROMETHEUS = True
+except ImportError:
+    HAS_PROMETHEUS = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _NoopMetric:
+    """Stand-in used when prometheus_client is missing."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+
+# Stage latencies range from sub-second (mel, encode) to minutes (render, enhance)
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+if HAS_PROMETHEUS:
+    QUEUE_DEPTH = Gauge("jayavatar_queue_depth", "Jobs waiting in the queue", ["job_type"])
+    JOBS_TOTAL = Counter("jayavatar_jobs_total", "Finished jobs", ["service", "status"])
+    JOB_SECONDS = Histogram("jayavatar_job_seconds", "End-to-end job processing time",
+                            ["service"], buckets=STAGE_BUCKETS)
+    STAGE_SECONDS = Histogram("jayavatar_stage_seconds", "Processing time per pipeline stage",
+                              ["service", "stage"], buckets=STAGE_BUCKETS)
+    STAGE_FPS = Gauge("jayavatar_stage_frames_per_second", "Frames per second of the last finished stage",
+                      ["service", "stage"])
+    CACHE_REQUESTS = Counter("jayavatar_cache_requests_total", "Cache lookups", ["cache", "result"])
+    ADMISSIONS = Counter("jayavatar_pipeline_admissions_total", "Pipeline submissions by admission decision", ["decision"])
+    INFERENCE_RSS = Gauge("jayavatar_inference_peak_rss_bytes",
+                          "Peak RSS of the last inference subprocess (the worker's own RSS excludes it)", ["service"])
+else:
+    QUEUE_DEPTH = JOBS_TOTAL = JOB_SECONDS = STAGE_SECONDS = STAGE_FPS = CACHE_REQUESTS = ADMISSIONS = INFERENCE_RSS = _NoopMetric()
+
+# Stages whose duration scales with the number of video frames
+FRAME_STAGES = ("face_detect", "3dmm", "render", "paste", "enhance")
+
+# Port spacing between forked children, above the per-service port range (9101-9104)
+CHILD_PORT_STRIDE = 10
+
+# Job types with a Redis queue
+JOB_TYPES = ("audio", "visual", "motion", "motion_render_shard", "pipeline")
+
+
+def observe_stage(service: str, stage: str, seconds: float, frames: int = None):
+    """Records one stage duration (and its throughput when frame-based)."""
+    if seconds is None:
+        return
+    STAGE_SECONDS.labels(service=service, stage=stage).observe(seconds)
+    if frames and seconds > 0:
+        STAGE_FPS.labels(service=service, stage=stage).set(frames / seconds)
+
+
+def observe_timings(service: str, timings: dict):
+    """Records every stage of a job's timing breakdown (see RedisQueue.record_timings)."""
+    frames = timings.get("frames")
+    for stage, seconds in timings.get("stages", {}).items():
+        observe_stage(service, stage, seconds, frames=frames if stage in FRAME_STAGES else None)
+
+
+def observe_job(service: str, status: str, seconds: float):
+    """Records a finished job."""
+    JOBS_TOTAL.labels(service=service, status=status).inc()
+    JOB_SECONDS.labels(service=service).observe(seconds)
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Counts a cache hit or miss (hit ratio = hit / (hit + miss))."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def observe_inference_rss(service: str, rss_bytes):
+    """Records the peak RSS of an inference subprocess (see job_progress.run_with_progress)."""
+    if rss_bytes:
+        INFERENCE_RSS.labels(service=service).set(rss_bytes)
+
+
+def observe_admission(decision: str):
+    """Counts a pipeline submission as 'accepted', 'rejected' (admission control) or 'coalesced' (single-flight)."""
+    ADMISSIONS.labels(decision=decision).inc()
+
+
+def update_queue_depths(queue):
+    """Refreshes the queue depth gauge from Redis (called on scrape)."""
+    for job_type in JOB_TYPES:
+        QUEUE_DEPTH.labels(job_type=job_type).set(queue.queue_depth(job_type))
+
+
+def render_latest() -> bytes:
+    """Metrics in the Prometheus text exposition format."""
+    if not HAS_PROMETHEUS:
+        return b"# prometheus_client not installed\n"
+    return generate_latest()
+
+
+def start_exporter(service: str, child: int = 0):
+    """
+    Starts the embedded metrics HTTP server of a worker (process RSS/CPU included).
+    Forked child N of a worker listens on the worker port + N * CHILD_PORT_STRIDE.
+    """
+    if not HAS_PROMETHEUS:
+        logger.warning("prometheus_client not installed. Metrics exporter disabled.")
+        return
+
+    try:
+        import config
+        port = config.metrics_port(service)
+    except ImportError:
+        port = None
+
+    if not port:
+        return
+    port += child * CHILD_PORT_STRIDE
+    try:
+        start_http_server(port)
+        logger.info(f"Metrics exporter for '{service}' listening on :{port}")
+    except OSError as e:
+        logger.warning(f"Could not start metrics exporter on :{port}: {e}")
@@ -15,24 +15,33 @@ sys.path.append(os.path.dirname(__file__))
 
 try:
     from queue_manager import RedisQueue
+    from job_progress import JobCancelled
+    import metrics
+    import admission
 except ImportError:
     logger.error("Could not import queue_manager.")
     sys.exit(1)
 
 
+def audio_duration(audio_path: str):
+    """Length of a WAV file in seconds (None if it cannot be read)."""
+    try:
+        with wave.open(audio_path, 'rb') as audio:
+            return audio.getnframes() / float(audio.getframerate())
+    except Exception as e:
+        logger.warning(f"Could not read audio duration: {e}")
+        return None
+
+
 def generate_srt_file(text: str, audio_path: str, output_path: str):
     """
     Generate an SRT subtitle file from text and audio duration.
     Splits text into chunks and distributes across the audio duration.
     """
     # Get audio duration
-    try:
-        with wave.open(audio_path, 'rb') as audio:
-            frames = audio.getnframes()
-            rate = audio.getframerate()
-            duration = frames / float(rate)
-    except Exception as e:
-        logger.warning(f"Could not read audio duration: {e}. Using 10s default.")
+    duration = audio_duration(audio_path)
+    if duration is None:
+        logger.warning("Using 10s default audio duration.")
         duration = 10.0
     
     # Split text into sentences or chunks
@@ -74,8 +83,66 @@ def generate_srt_file(text: str, audio_path: str, output_path: str):
     logger.info(f"Generated subtitles: {output_path}")
 
 
+def aggregate_timings(queue: RedisQueue, child_jobs: dict, total: float) -> dict:
+    """
+    Combines the timing breakdowns of a pipeline's child jobs.
+
+    Args:
+        child_jobs: service name -> child job id
+        total: wall time of the pipeline job in seconds
+
+    Returns: dict with summed 'stages' (including queue_wait), per-service 'jobs' and 'total'.
+    """
+    stages, jobs = {}, {}
+    for service, child_id in child_jobs.items():
+        child = queue.get_job_status(child_id) or {}
+        timings = json.loads(child.get("timings") or "{}")
+        timings.setdefault("stages", {})
+        if child.get("started_at"):
+            timings["stages"]["queue_wait"] = float(child["started_at"]) - float(child["created_at"])
+        jobs[service] = timings
+        for stage, seconds in timings["stages"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return {"stages": stages, "jobs": jobs, "total": total}
+
+
+def submit_render(queue: RedisQueue, job_id: str, payload: dict, audio_path: str, output_path: str, quality: str):
+    """
+    Submits the video job of a pipeline's mode at a quality tier.
+
+    Returns: (queue name, child job id)
+    """
+    mode = payload.get("mode", "motion")  # Default to motion (SadTalker)
+    if mode == "lipsync":
+        # Wav2Lip - lip sync only (faster, but static head)
+        visual_payload = {
+            "audio_path": audio_path,
+            "video_path": payload.get("video_path"),
+            "output_path": output_path,
+            "profile": payload.get("profile", False),
+            "quality": quality,
+        }
+        return "visual", queue.submit_job("visual", visual_payload, parent_id=job_id)
+
+    elif mode == "emage":
+        # Future: EMAGE full-body (not yet implemented)
+        raise NotImplementedError("EMAGE full-body mode not yet implemented. Use 'motion' or 'lipsync'.")
+
+    # mode == "motion" (default): SadTalker - lip sync + head motion + blinking
+    motion_payload = {
+        "source_image": payload.get("video_path"),
+        "driven_audio": audio_path,
+        "output_path": output_path,
+        "profile": payload.get("profile", False),
+        "motion_preset": payload.get("motion_preset"),
+        "quality": quality,
+    }
+    return "motion", queue.submit_job("motion", motion_payload, parent_id=job_id)
+
+
 def process_pipeline_job(queue: RedisQueue, job_id: str):
     logger.info(f"Processing pipeline job {job_id}")
+    job_start = time.time()
     
     # 1. Update status
     queue.update_job_status(job_id, "processing")
@@ -86,6 +153,8 @@ def process_pipeline_job(queue: RedisQueue, job_id: str):
         queue.update_job_status(job_id, "failed", error="Job data missing")
         return
 
+    # preview draft still queued or rendering (cancelled once the pipeline ends)
+    draft_job_id = None
     try:
         payload = json.loads(job_data.get("payload", "{}"))
         text = payload.get("text")
@@ -110,16 +179,20 @@ def process_pipeline_job(queue: RedisQueue, job_id: str):
             "voice_id": payload.get("voice_id"),
             "output_path": audio_output_path
         }
+        child_jobs = {}
         
-        audio_job_id = queue.submit_job("audio", audio_payload)
+        audio_job_id = queue.submit_job("audio", audio_payload, parent_id=job_id)
+        child_jobs["audio"] = audio_job_id
         logger.info(f"Submitted Audio Job {audio_job_id}. Waiting for completion...")
         
         # 5. Wait for Audio Job
         while True:
+            if queue.is_cancelled(job_id):
+                raise JobCancelled(job_id)
             audio_status = queue.get_job_status(audio_job_id)
             if audio_status["status"] == "completed":
                 break
-            elif audio_status["status"] == "failed":
+            elif audio_status["status"] in ("failed", "cancelled"):
                 raise Exception(f"Audio generation failed: {audio_status.get('error')}")
             time.sleep(1)
             
@@ -130,54 +203,64 @@ def process_pipeline_job(queue: RedisQueue, job_id: str):
         if payload.get("generate_subtitles", True):
             generate_srt_file(text, audio_output_path, srt_output_path)
 
-        # 6. Submit Visual/Motion Job based on mode
+        # 6. Submit Visual/Motion Job based on mode (a preview draft is queued ahead of the final render)
         video_output_path = os.path.join(master_output_dir, "video.mp4")
-        mode = payload.get("mode", "motion")  # Default to motion (SadTalker)
-        
-        if mode == "lipsync":
-            # Wav2Lip - lip sync only (faster, but static head)
-            visual_payload = {
-                "audio_path": audio_output_path,
-                "video_path": video_input_path,
-                "output_path": video_output_path
-            }
-            job_id_visual = queue.submit_job("visual", visual_payload)
-            queue_name = "visual"
-            logger.info(f"Mode: lipsync (Wav2Lip). Submitted Visual Job {job_id_visual}")
-            
-        elif mode == "emage":
-            # Future: EMAGE full-body (not yet implemented)
-            raise NotImplementedError("EMAGE full-body mode not yet implemented. Use 'motion' or 'lipsync'.")
-            
-        else:  # mode == "motion" (default)
-            # SadTalker - lip sync + head motion + blinking
-            motion_payload = {
-                "source_image": video_input_path,
-                "driven_audio": audio_output_path,
-                "output_path": video_output_path
-            }
-            job_id_visual = queue.submit_job("motion", motion_payload)
-            queue_name = "motion"
-            logger.info(f"Mode: motion (SadTalker). Submitted Motion Job {job_id_visual}")
+        quality = payload.get("quality", "final")
+        if payload.get("preview") and quality == "final":
+            draft_output_path = os.path.join(master_output_dir, "video_draft.mp4")
+            queue_name, draft_job_id = submit_render(queue, job_id, payload, audio_output_path, draft_output_path, "draft")
+            child_jobs[f"{queue_name}_draft"] = draft_job_id
+            logger.info(f"Submitted {queue_name} draft job {draft_job_id}")
+
+        queue_name, job_id_visual = submit_render(queue, job_id, payload, audio_output_path, video_output_path, quality)
+        logger.info(f"Mode: {payload.get('mode', 'motion')}. Submitted {queue_name} job {job_id_visual} ({quality})")
+        child_jobs[queue_name] = job_id_visual
         
-        # 7. Wait for Visual/Motion Job
+        # 7. Wait for Visual/Motion Job, publishing the draft when it is ready
         while True:
+            if queue.is_cancelled(job_id):
+                raise JobCancelled(job_id)
+            if draft_job_id:
+                draft_status = queue.get_job_status(draft_job_id)
+                if draft_status["status"] == "completed":
+                    queue.record_draft(job_id, draft_output_path)
+                    logger.info(f"Draft of pipeline {job_id} ready: {draft_output_path}")
+                    draft_job_id = None
+                elif draft_status["status"] in ("failed", "cancelled"):
+                    # the final render still runs; only the preview is lost
+                    logger.warning(f"Draft of pipeline {job_id} failed: {draft_status.get('error')}")
+                    draft_job_id = None
             job_status = queue.get_job_status(job_id_visual)
             if job_status["status"] == "completed":
                 break
-            elif job_status["status"] == "failed":
+            elif job_status["status"] in ("failed", "cancelled"):
                 raise Exception(f"{queue_name.capitalize()} generation failed: {job_status.get('error')}")
             time.sleep(1)
             
         logger.info(f"{queue_name.capitalize()} video generation complete.")
         
-        # 8. Success
+        # 8. Success (the child jobs' processing times update the admission runtime model)
+        queue.record_timings(job_id, aggregate_timings(queue, child_jobs, time.time() - job_start))
+        admission.learn(queue, text, audio_duration(audio_output_path), child_jobs, quality)
         queue.update_job_status(job_id, "completed", result=video_output_path)
+        metrics.observe_job("pipeline", "completed", time.time() - job_start)
         logger.info(f"Pipeline Job {job_id} completed successfully.")
 
+    except JobCancelled:
+        # the children were cancelled with the pipeline (RedisQueue.cancel_job)
+        logger.info(f"Pipeline Job {job_id} cancelled.")
+        queue.update_job_status(job_id, "cancelled", error="Cancelled")
+        metrics.observe_job("pipeline", "cancelled", time.time() - job_start)
+
     except Exception as e:
         logger.error(f"Error processing pipeline job {job_id}: {e}")
         queue.update_job_status(job_id, "failed", error=str(e))
+        metrics.observe_job("pipeline", "failed", time.time() - job_start)
+
+    finally:
+        # a draft behind the final render (or of a failed pipeline) would only keep a worker busy
+        if draft_job_id:
+            queue.cancel_job(draft_job_id)
 
 
 # Import config module
@@ -188,23 +271,17 @@ except ImportError:
     MAX_CONCURRENT_PIPELINES = int(os.environ.get("MAX_CONCURRENT_PIPELINES", "3"))
 
 
-def main():
+def serve(queue: RedisQueue, max_concurrent: int = MAX_CONCURRENT_PIPELINES, stop_event=None):
+    """
+    Dispatch loop: pops 'pipeline' jobs and runs up to max_concurrent of them in a thread pool.
+    Runs until interrupted or until stop_event (threading.Event) is set.
+    """
     from concurrent.futures import ThreadPoolExecutor
     
-    logger.info(f"Pipeline Worker Initializing (max concurrent: {MAX_CONCURRENT_PIPELINES})...")
-    
-    try:
-        queue = RedisQueue()
-    except Exception as e:
-        logger.error(f"Redis connection failed: {e}")
-        return
-
-    logger.info("Pipeline Worker listening for 'pipeline' jobs...")
-    
-    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PIPELINES) as executor:
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
         futures = set()
         
-        while True:
+        while not (stop_event and stop_event.is_set()):
             try:
                 # Remove completed futures
                 done_futures = {f for f in futures if f.done()}
@@ -216,10 +293,10 @@ def main():
                 futures -= done_futures
                 
                 # Only pop new jobs if we have capacity
-                if len(futures) < MAX_CONCURRENT_PIPELINES:
+                if len(futures) < max_concurrent:
                     job_id = queue.pop_job("pipeline")
                     if job_id:
-                        logger.info(f"Submitting job {job_id} to thread pool ({len(futures)+1}/{MAX_CONCURRENT_PIPELINES})")
+                        logger.info(f"Submitting job {job_id} to thread pool ({len(futures)+1}/{max_concurrent})")
                         future = executor.submit(process_pipeline_job, queue, job_id)
                         futures.add(future)
                     else:
@@ -234,6 +311,20 @@ def main():
                 logger.error(f"Unexpected error in loop: {e}")
                 time.sleep(5)
 
+
+def main():
+    logger.info(f"Pipeline Worker Initializing (max concurrent: {MAX_CONCURRENT_PIPELINES})...")
+    
+    try:
+        queue = RedisQueue()
+    except Exception as e:
+        logger.error(f"Redis connection failed: {e}")
+        return
+
+    metrics.start_exporter("pipeline")
+    logger.info("Pipeline Worker listening for 'pipeline' jobs...")
+    serve(queue)
+
 if __name__ == "__main__":
     main()
 
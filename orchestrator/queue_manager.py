@@ -1,18 +1,45 @@
 import json
 import uuid
 import time
+import hashlib
 import redis
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
+
+def request_fingerprint(job_type: str, payload: Dict[str, Any]) -> str:
+    """Deterministic id of a request: identical job type and payload give the same fingerprint."""
+    canonical = json.dumps({"type": job_type, "payload": payload}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
 
 class RedisQueue:
-    def __init__(self, host='localhost', port=6379, db=0):
-        self.redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+    def __init__(self, host='localhost', port=6379, db=0, client=None):
+        self.host, self.port, self.db = host, port, db
+        # An existing client (e.g. fakeredis in benchmarks) can be passed instead of a connection
+        self.redis = client or redis.Redis(host=host, port=port, db=db, decode_responses=True)
         self.QUEUE_KEY = "jayavatar:jobs:queue"
         self.JOB_PREFIX = "jayavatar:job:"
+        self.EVENTS_PREFIX = "jayavatar:events:"
+        # request fingerprint -> id of the job running it (single-flight registry)
+        self.INFLIGHT_PREFIX = "jayavatar:inflight:"
+        self.TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+        # Jobs this process set to processing and has not finished (see fail_running_jobs)
+        self.running = set()
 
-    def submit_job(self, job_type: str, payload: Dict[str, Any]) -> str:
-        """Creates a new job and pushes it to the queue."""
+    def submit_job(self, job_type: str, payload: Dict[str, Any], parent_id: Optional[str] = None,
+                   fingerprint: Optional[str] = None, ttl: Optional[int] = None) -> str:
+        """
+        Creates a new job and pushes it to the queue. With a fingerprint the job is
+        registered as in flight for ttl seconds; when an identical job got there
+        first, the new id is an alias of that job instead (see add_alias).
+        """
         job_id = str(uuid.uuid4())
+        if fingerprint:
+            key = f"{self.INFLIGHT_PREFIX}{fingerprint}"
+            if not self.redis.set(key, job_id, nx=True, ex=ttl):
+                primary_id = self.in_flight(fingerprint)
+                if primary_id:
+                    return self.add_alias(primary_id, alias_id=job_id)
+                # the registered job has finished
+                self.redis.set(key, job_id, ex=ttl)
         job_data = {
             "id": job_id,
             "type": job_type,  # 'audio', 'visual', 'composition'
@@ -22,6 +49,13 @@ class RedisQueue:
             "result": "",
             "error": ""
         }
+        if fingerprint:
+            job_data["fingerprint"] = fingerprint
+            self.redis.sadd(self.requesters_key(job_id), job_id)
+        # Child jobs of a pipeline forward their events to the parent's stream
+        if parent_id:
+            job_data["parent_id"] = parent_id
+            self.redis.sadd(f"{self.JOB_PREFIX}{parent_id}:children", job_id)
         
         # 1. Save Job Data (Persistent)
         self.redis.hset(f"{self.JOB_PREFIX}{job_id}", mapping=job_data)
@@ -32,25 +66,172 @@ class RedisQueue:
         
         return job_id
 
+    def in_flight(self, fingerprint: str) -> Optional[str]:
+        """Id of the unfinished job registered for a request fingerprint, if any."""
+        job_id = self.redis.get(f"{self.INFLIGHT_PREFIX}{fingerprint}")
+        status = self.redis.hget(f"{self.JOB_PREFIX}{job_id}", "status") if job_id else None
+        return job_id if status and status not in self.TERMINAL_STATUSES else None
+
+    def add_alias(self, job_id: str, alias_id: Optional[str] = None) -> str:
+        """
+        Creates an id that resolves to an existing job: its status, result and
+        events are the job's. Cancelling the alias only detaches it.
+        """
+        alias_id = alias_id or str(uuid.uuid4())
+        self.redis.hset(f"{self.JOB_PREFIX}{alias_id}",
+                        mapping={"id": alias_id, "alias_of": job_id, "created_at": time.time()})
+        self.redis.sadd(self.requesters_key(job_id), alias_id)
+        return alias_id
+
+    def requesters_key(self, job_id: str) -> str:
+        """Set of the ids (the job's own and its aliases) still waiting for a single-flight job."""
+        return f"{self.JOB_PREFIX}{job_id}:requesters"
+
+    def resolve_alias(self, job_id: str) -> str:
+        """The job an alias stands for (the id itself for other jobs)."""
+        return self.redis.hget(f"{self.JOB_PREFIX}{job_id}", "alias_of") or job_id
+
     def get_job_status(self, job_id: str) -> Dict[str, Any]:
         """Retrieves the full status of a job."""
         job_data = self.redis.hgetall(f"{self.JOB_PREFIX}{job_id}")
         if not job_data:
             return None
+        # an alias shows its job until it is cancelled itself
+        if job_data.get("alias_of") and job_data.get("status") != "cancelled":
+            primary = self.redis.hgetall(f"{self.JOB_PREFIX}{job_data['alias_of']}")
+            return {**primary, "id": job_id, "alias_of": job_data["alias_of"]}
         return job_data
 
     def update_job_status(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
         """Updates job status. Used by Workers."""
+        # a job cancelled while it ran ends as cancelled however its worker stopped
+        if status in ("completed", "failed") and self.is_cancelled(job_id):
+            status, result, error = "cancelled", None, "Cancelled"
         updates = {"status": status}
+        if status == "processing":
+            updates["started_at"] = time.time()
+            self.running.add(job_id)
+        elif status in self.TERMINAL_STATUSES:
+            updates["finished_at"] = time.time()
+            self.running.discard(job_id)
         if result:
             updates["result"] = result
         if error:
             updates["error"] = error
             
         self.redis.hset(f"{self.JOB_PREFIX}{job_id}", mapping=updates)
+        self.publish_event(job_id, {"type": "status", **updates})
+        if status in self.TERMINAL_STATUSES:
+            self.release_fingerprint(job_id)
+
+    def fail_running_jobs(self, error: str):
+        """Fails the jobs this process was running, e.g. when its worker is stopped mid-job."""
+        for job_id in list(self.running):
+            self.update_job_status(job_id, "failed", error=error)
+
+    def release_fingerprint(self, job_id: str):
+        """Ends a finished job's single-flight registration; later identical requests run anew."""
+        fingerprint = self.redis.hget(f"{self.JOB_PREFIX}{job_id}", "fingerprint")
+        key = f"{self.INFLIGHT_PREFIX}{fingerprint}"
+        if fingerprint and self.redis.get(key) == job_id:
+            self.redis.delete(key)
+
+    def report_progress(self, job_id: str, stage: str, done: int, total: int, eta: Optional[float] = None):
+        """Records per-stage frame progress. Used by Workers."""
+        progress = {
+            "stage": stage,
+            "done": done,
+            "total": total,
+            "eta": eta,
+            "updated_at": time.time()
+        }
+        self.redis.hset(f"{self.JOB_PREFIX}{job_id}", "progress", json.dumps(progress))
+        self.publish_event(job_id, {"type": "progress", **progress})
+
+    def record_timings(self, job_id: str, timings: Dict[str, Any]):
+        """Stores the per-stage timing breakdown of a job. Used by Workers."""
+        self.redis.hset(f"{self.JOB_PREFIX}{job_id}", "timings", json.dumps(timings))
+
+    def record_draft(self, job_id: str, result: str):
+        """Stores the draft-quality result of a job still rendering its final result. Used by Workers."""
+        self.redis.hset(f"{self.JOB_PREFIX}{job_id}", "draft_result", result)
+        self.publish_event(job_id, {"type": "draft", "result": result})
+
+    def events_channel(self, job_id: str) -> str:
+        """Pub/sub channel carrying status and progress events for a job."""
+        return f"{self.EVENTS_PREFIX}{job_id}"
+
+    def publish_event(self, job_id: str, event: Dict[str, Any]):
+        """Publishes an event for a job, and for its parent pipeline if any."""
+        message = json.dumps({"job_id": job_id, **event})
+        self.redis.publish(self.events_channel(job_id), message)
+
+        parent_id = self.redis.hget(f"{self.JOB_PREFIX}{job_id}", "parent_id")
+        if parent_id:
+            self.redis.publish(self.events_channel(parent_id), message)
+
+    def cancel_job(self, job_id: str) -> List[str]:
+        """
+        Cancels a job for the caller. A single-flight job shared with aliases only
+        detaches the caller (an alias ends as cancelled) until no requester is left;
+        then the job itself is cancelled (see cancel_job_tree).
+        Returns: ids cancelled, a detached alias included. Empty when the job's own
+        requester detached and the job keeps running for its aliases.
+        """
+        job = self.get_job_status(job_id)
+        if not job or job.get("status") in self.TERMINAL_STATUSES:
+            return []
+        detached = []
+        primary_id = job.get("alias_of") or job_id
+        if job.get("alias_of"):
+            self.redis.hset(f"{self.JOB_PREFIX}{job_id}",
+                            mapping={"status": "cancelled", "error": "Cancelled", "finished_at": time.time()})
+            detached.append(job_id)
+        if job.get("alias_of") or job.get("fingerprint"):
+            requesters = self.requesters_key(primary_id)
+            self.redis.srem(requesters, job_id)
+            if self.redis.scard(requesters):
+                # other requesters still wait for the job
+                return detached
+        return detached + self.cancel_job_tree(primary_id)
+
+    def cancel_job_tree(self, job_id: str) -> List[str]:
+        """
+        Flags a job and its child jobs (recursively) as cancelled. Queued ones are
+        taken off their queue and end right away; workers stop running ones at
+        their next check (see is_cancelled). Returns: ids of the jobs flagged.
+        """
+        cancelled = []
+        job = self.get_job_status(job_id)
+        if not job or job.get("status") in self.TERMINAL_STATUSES:
+            return cancelled
+        self.redis.hset(f"{self.JOB_PREFIX}{job_id}", "cancel_requested", time.time())
+        cancelled.append(job_id)
+        if self.claim_job(job["type"], job_id):
+            self.update_job_status(job_id, "cancelled", error="Cancelled")
+        for child_id in self.redis.smembers(f"{self.JOB_PREFIX}{job_id}:children"):
+            cancelled += self.cancel_job_tree(child_id)
+        return cancelled
+
+    def is_cancelled(self, job_id: str) -> bool:
+        """True once a cancel of the job was requested. Checked by Workers between steps."""
+        return bool(self.redis.hexists(f"{self.JOB_PREFIX}{job_id}", "cancel_requested"))
+
+    def queue_depth(self, job_type: str) -> int:
+        """Number of jobs waiting in the queue of a job type."""
+        return self.redis.llen(f"{self.QUEUE_KEY}:{job_type}")
 
     def pop_job(self, job_type: str) -> Optional[str]:
         """Worker calls this to get next job ID for a specific type."""
         # Non-blocking pop. In prod, use blpop for blocking.
         queue_name = f"{self.QUEUE_KEY}:{job_type}"
-        return self.redis.lpop(queue_name)
+        while True:
+            job_id = self.redis.lpop(queue_name)
+            if job_id is None or not self.is_cancelled(job_id):
+                return job_id
+            # popped between its cancel request and its removal from the queue
+            self.update_job_status(job_id, "cancelled", error="Cancelled")
+
+    def claim_job(self, job_type: str, job_id: str) -> bool:
+        """Takes a specific job off its queue; False when a worker already popped it."""
+        return self.redis.lrem(f"{self.QUEUE_KEY}:{job_type}", 1, job_id) == 1
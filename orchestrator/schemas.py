@@ -1,6 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Literal
 
+# Name of a motion library preset (services/motion/library/<name>.npy)
+MOTION_PRESET_PATTERN = r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$'
+
+# Render quality tiers: "draft" (small, unenhanced, fewer rendered frames) or "final"
+Quality = Literal["draft", "final"]
+
 class JobRequest(BaseModel):
     text: str
     voice_id: Optional[str] = None
@@ -8,6 +14,10 @@ class JobRequest(BaseModel):
 class VisualRequest(BaseModel):
     audio_path: str
     video_path: Optional[str] = None
+    # Capture a torch.profiler trace of the inference section
+    profile: bool = False
+    # "draft" skips the GFPGAN enhancement
+    quality: Quality = "final"
 
 class PipelineRequest(BaseModel):
     text: str
@@ -17,12 +27,32 @@ class PipelineRequest(BaseModel):
     mode: Literal["motion", "lipsync", "emage"] = "motion"
     # Generate subtitle track alongside video
     generate_subtitles: bool = True
+    # Capture torch.profiler traces of the inference sections (see USAGE.md, Stage Timings)
+    profile: bool = False
+    # Head pose and eye blinks from a motion library preset ("motion" mode)
+    motion_preset: Optional[str] = Field(None, pattern=MOTION_PRESET_PATTERN)
+    # Render quality of the video job ("draft" or "final")
+    quality: Quality = "final"
+    # With quality "final": render a draft first, published as the job's draft_result
+    preview: bool = False
 
 class MotionRequest(BaseModel):
     source_image: str
     driven_audio: str
     output_path: Optional[str] = None
+    # Capture a torch.profiler trace of the inference section
+    profile: bool = False
+    # Seed of the random head pose / eye blinks; same seed, audio and image give the same motion.
+    # Unset: fresh random motion every job (not cached)
+    seed: Optional[int] = None
+    # Head pose and eye blinks from a motion library preset instead of the random pose
+    motion_preset: Optional[str] = Field(None, pattern=MOTION_PRESET_PATTERN)
+    # "draft": draft_size render without enhancer, fast paste and draft_fps (see config.yaml)
+    quality: Quality = "final"
 
 class JobResponse(BaseModel):
     job_id: str
     status: str
+    # Predicted start / finish of a pipeline (unix time, see admission.py)
+    estimated_start: Optional[float] = None
+    estimated_finish: Optional[float] = None
@@ -19,6 +19,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../o
 
 try:
     from queue_manager import RedisQueue
+    import metrics
+    import forkserver
 except ImportError:
     logger.error("Could not import queue_manager. Make sure the 'orchestrator' directory is adjacent to 'services'.")
     sys.exit(1)
@@ -34,17 +36,17 @@ except ImportError:
 # Global TTS Model
 tts_model = None
 
-def load_model():
+def select_device():
+    if os.getenv("FORCE_CPU", "0") == "1":
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_model(device=None):
     global tts_model
     if not HAS_TTS:
         return
     
-    # Select device
-    if os.getenv("FORCE_CPU", "0") == "1":
-        device = "cpu"
-    else:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-    
+    device = device or select_device()
     logger.info(f"Loading Coqui TTS model on {device}...")
     try:
         # XTTS v2 is the standard for high-quality cloning
@@ -160,6 +162,7 @@ def process_job(queue: RedisQueue, job_id: str):
         logger.info(f"Text processed: '{text}' -> '{processed_text}' (Lang: {lang_code})")
         # ----------------------------------
 
+        tts_start = time.time()
         if tts_model:
             if not os.path.exists(speaker_wav):
                 pass
@@ -191,6 +194,10 @@ def process_job(queue: RedisQueue, job_id: str):
                 # If even speaker.wav is missing, creating a silent dummy (not implemented here)
                 pass
 
+        timings = {"stages": {"tts": time.time() - tts_start}}
+        queue.record_timings(job_id, timings)
+        metrics.observe_timings("audio", timings)
+
         # 4. Success
         queue.update_job_status(job_id, "completed", result=output_path)
         logger.info(f"Job {job_id} completed successfully.")
@@ -199,25 +206,15 @@ def process_job(queue: RedisQueue, job_id: str):
         logger.error(f"Error processing job {job_id}: {e}")
         queue.update_job_status(job_id, "failed", error=str(e))
 
-def main():
-    logger.info("Audio Worker Initializing...")
-    
-    # Connect to Redis
-    try:
-        queue = RedisQueue()
-    except Exception as e:
-        logger.error(f"Redis connection failed: {e}")
-        return
-
-    # Load Model
-    load_model()
-    
+def run(queue: RedisQueue):
     logger.info("Audio Worker listening for jobs...")
     while True:
         try:
             job_id = queue.pop_job("audio")
             if job_id:
+                job_start = time.time()
                 process_job(queue, job_id)
+                metrics.observe_job("audio", queue.get_job_status(job_id).get("status"), time.time() - job_start)
             else:
                 time.sleep(1) # Poll interval
                 
@@ -228,5 +225,40 @@ def main():
             logger.error(f"Unexpected error in loop: {e}")
             time.sleep(5)
 
+def child_main(index: int):
+    """Fork server child: moves the preloaded model to the GPU (if any) and serves jobs."""
+    device = select_device()
+    if tts_model is not None and device != "cpu":
+        tts_model.to(device)
+    metrics.start_exporter("audio", child=index)
+    queue = RedisQueue()
+    try:
+        run(queue)
+    except forkserver.Terminated:
+        queue.fail_running_jobs("Worker process stopped")
+        raise
+
+def main():
+    logger.info("Audio Worker Initializing...")
+
+    children = forkserver.configured_children("audio")
+    if children:
+        # Weights stay on the CPU in the parent and are shared copy-on-write
+        load_model(device="cpu")
+        forkserver.serve("audio", child_main, children)
+        return
+    
+    # Connect to Redis
+    try:
+        queue = RedisQueue()
+    except Exception as e:
+        logger.error(f"Redis connection failed: {e}")
+        return
+
+    # Load Model
+    load_model()
+    metrics.start_exporter("audio")
+    run(queue)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,6 @@
+"""
+Helpers shared by the Wav2Lip and SadTalker inference trees.
+
+Both trees run as separate scripts; the modules using these helpers add
+services/ to sys.path and import them as common.<module>.
+"""
@@ -0,0 +1,46 @@
+"""File identities used as cache keys (exports, int8 networks, coefficients, source features)."""
+import hashlib
+import json
+import os
+
+# Sidecar of a cache directory remembering checkpoint hashes per file_stamp
+HASHES_FILE = 'hashes.json'
+
+
+def file_hash(path):
+    """sha256 of a file's bytes (first 16 hex chars); None for no file."""
+    if path is None:
+        return None
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()[:16]
+
+
+def file_stamp(path):
+    """Cheap identity of a checkpoint: path, size and mtime (no full-file hashing per job)."""
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, int(stat.st_mtime)]
+
+
+def checkpoint_hash(path, cache_dir):
+    """
+    file_hash of a checkpoint, remembered in cache_dir/hashes.json under its
+    file_stamp: only the first job after the weights change reads them in full.
+    """
+    memo_path = os.path.join(cache_dir, HASHES_FILE)
+    stamp = json.dumps(file_stamp(path))
+    try:
+        with open(memo_path) as f:
+            hashes = json.load(f)
+    except (OSError, ValueError):
+        hashes = {}
+    if stamp not in hashes:
+        hashes[stamp] = file_hash(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = '{}.tmp{}'.format(memo_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(hashes, f)
+        os.replace(tmp_path, memo_path)
+    return hashes[stamp]
@@ -0,0 +1,126 @@
+"""
+Reduced-precision inference on CPU: bf16 autocast and int8 static quantization.
+
+int8 quantizes every Conv/Linear layer of a model (BatchNorm folded in where it
+directly follows the conv; spectral norm baked into the weight) with activation
+ranges calibrated on real inputs. Each tree caches the calibrated networks per
+checkpoint hash (Wav2Lip/precision.py, SadTalker src/utils/precision.py).
+"""
+import json
+import os
+import warnings
+from contextlib import nullcontext
+
+import torch
+from torch import nn
+from torch.nn.utils.spectral_norm import SpectralNorm
+
+PRECISIONS = ['fp32', 'bf16', 'int8']
+
+QUANTIZABLE = (nn.Conv1d, nn.Conv2d, nn.Conv3d, nn.Linear)
+QUANTIZABLE_TRANSPOSED = (nn.ConvTranspose2d,)
+
+
+def bf16_supported():
+    """True if the CPU has native bf16 instructions (AVX512-BF16 / AMX)."""
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve(precision, device):
+    """Precision actually used on this device (unsupported modes fall back to fp32)."""
+    if precision == 'bf16' and device == 'cpu' and not bf16_supported():
+        print('CPU has no native bf16 support; using fp32')
+        return 'fp32'
+    if precision == 'int8' and device != 'cpu':
+        print('int8 quantized kernels run on CPU only; using fp32 on', device)
+        return 'fp32'
+    return precision
+
+
+def autocast(precision, device):
+    if precision == 'bf16':
+        return torch.autocast(device_type=device, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def _fuse_conv_bn(model):
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        children = list(module.named_children())
+        pairs = [[a, b] for (a, x), (b, y) in zip(children, children[1:])
+                 if type(x) in (nn.Conv2d, nn.ConvTranspose2d) and type(y) is nn.BatchNorm2d]
+        if pairs:
+            torch.ao.quantization.fuse_modules(module, pairs, inplace=True)
+
+
+def _remove_spectral_norm(model):
+    # Bake the (eval-time constant) normalized weight in; the hook would not survive conversion
+    for module in model.modules():
+        hooks = [h for h in module._forward_pre_hooks.values() if isinstance(h, SpectralNorm)]
+        for hook in hooks:
+            nn.utils.remove_spectral_norm(module, hook.name)
+
+
+class Contiguous(nn.Module):
+    # Quantized convs return channels-last tensors; the renderer .view()s conv outputs
+    def forward(self, x):
+        return x.contiguous()
+
+
+def _wrap_layers(module, qconfig, qconfig_transposed):
+    # Quantize around each layer; norms, activations, warping (grid_sample) and
+    # residual adds in between keep running in float
+    for name, child in module.named_children():
+        if type(child) in QUANTIZABLE + QUANTIZABLE_TRANSPOSED:
+            wrapped = nn.Sequential(torch.ao.quantization.QuantStub(), child, torch.ao.quantization.DeQuantStub(),
+                                    Contiguous())
+            wrapped.qconfig = qconfig if type(child) in QUANTIZABLE else qconfig_transposed
+            setattr(module, name, wrapped)
+        else:
+            _wrap_layers(child, qconfig, qconfig_transposed)
+
+
+def prepare_int8(model):
+    """Inserts observers into `model` (in place); run calibration inputs through it, then convert_int8."""
+    torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+    qconfig = torch.ao.quantization.get_default_qconfig(torch.backends.quantized.engine)
+    # Transposed convs only support per-tensor weight quantization
+    qconfig_transposed = torch.ao.quantization.QConfig(activation=qconfig.activation,
+                                                       weight=torch.ao.quantization.default_weight_observer)
+    model.eval()
+    _remove_spectral_norm(model)
+    _fuse_conv_bn(model)
+    _wrap_layers(model, qconfig, qconfig_transposed)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        torch.ao.quantization.prepare(model, inplace=True)
+    return model
+
+
+def convert_int8(model):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        torch.ao.quantization.convert(model, inplace=True)
+    return model
+
+
+def save_int8(model, path, calibration):
+    """Saves the converted model's state dict, plus a JSON note on the calibration inputs."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.json', 'w') as f:
+        json.dump({'calibration': calibration}, f)
+    # moved into place whole, so concurrent jobs never load a partial file
+    tmp_path = path + '.tmp{}'.format(os.getpid())
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_int8(model, path):
+    """Rebuilds the quantized structure of the fp32 `model` and loads cached int8 weights into it."""
+    convert_int8(prepare_int8(model))
+    model.load_state_dict(torch.load(path, map_location='cpu'))
+    return model
@@ -0,0 +1,32 @@
+"""Pauses in the driving audio, which Wav2Lip copies from the input and SadTalker renders as an idle loop."""
+import numpy as np
+
+
+def silent_spans(wav, sr, fps, num_frames, offset=0., window=0.2, threshold_db=-40., min_silence=0.5, hop=0.01):
+    """
+    [start, end) frame ranges of pauses in the driving audio.
+
+    Speech is any 10 ms hop whose RMS is within threshold_db of the loud hops
+    (95th percentile). Frame i is silent when its audio window
+    [i/fps + offset, i/fps + offset + window) has no speech; only runs of at
+    least min_silence seconds count as pauses.
+    """
+    hop_len = int(sr * hop)
+    num_hops = len(wav) // hop_len
+    if num_hops == 0 or num_frames == 0:
+        return []
+    hops = np.asarray(wav[:num_hops * hop_len], dtype=np.float64).reshape(num_hops, hop_len)
+    rms = np.sqrt(np.mean(hops ** 2, axis=1))
+    speech = rms > np.percentile(rms, 95) * 10 ** (threshold_db / 20.)
+
+    # speech hops in each frame's window, from the running count
+    counts = np.concatenate([[0], np.cumsum(speech)])
+    starts = np.floor((np.arange(num_frames) / fps + offset) / hop).astype(int)
+    ends = np.clip(starts + int(round(window / hop)), 0, num_hops)
+    starts = np.clip(starts, 0, num_hops)
+    silent = counts[ends] == counts[starts]
+
+    edges = np.diff(np.concatenate([[0], silent.astype(np.int8), [0]]))
+    min_frames = max(1, int(round(min_silence * fps)))
+    return [(int(start), int(end)) for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+            if end - start >= min_frames]
@@ -0,0 +1,60 @@
+"""
+Adds a reference clip to the motion library: its 3DMM coefficients are extracted
+once and stored as a named preset for `inference.py --motion_preset`.
+
+    python add_motion_preset.py --name nod_calm --ref_video ./examples/ref_video/WDA_KatieHill_000.mp4
+"""
+import os, sys
+import shutil
+import tempfile
+import torch
+from argparse import ArgumentParser
+
+from scipy.io import loadmat
+
+from src.utils.preprocess import CropAndExtract
+from src.utils.init_path import init_path
+from src.utils.motion_library import DEFAULT_LIBRARY_DIR, MotionLibrary
+
+
+def main(args):
+    library = MotionLibrary(args.motion_library_dir)
+    library.path(args.name)    # validates the name before the extraction
+
+    current_root_path = os.path.split(sys.argv[0])[0]
+    sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), 256, args.old_version, args.preprocess)
+    preprocess_model = CropAndExtract(sadtalker_paths, args.device, batch_size=args.extract_batch_size, workers=args.extract_workers)
+
+    save_dir = tempfile.mkdtemp()
+    try:
+        coeff_path, _, _ = preprocess_model.generate(args.ref_video, save_dir, args.preprocess, source_image_flag=False)
+        if coeff_path is None:
+            raise SystemExit("Can't get the coeffs of the reference video")
+        coeffs = loadmat(coeff_path)['coeff_3dmm']
+    finally:
+        shutil.rmtree(save_dir)
+
+    path = library.add(args.name, coeffs)
+    print('Added motion preset {} ({} frames): {}'.format(args.name, coeffs.shape[0], path))
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser()
+    parser.add_argument("--name", required=True, help="preset name (letters, digits, '_' and '-')")
+    parser.add_argument("--ref_video", required=True, help="reference video providing head pose and eye blinking")
+    parser.add_argument("--motion_library_dir", default=DEFAULT_LIBRARY_DIR, help="directory of the motion presets")
+    parser.add_argument("--checkpoint_dir", default='./checkpoints', help="path to the SadTalker checkpoints")
+    parser.add_argument("--preprocess", default='crop', choices=['crop', 'extcrop', 'resize', 'full', 'extfull'], help="how to crop the reference frames")
+    parser.add_argument("--old_version", action="store_true", help="use the pth other than safetensor version")
+    parser.add_argument("--extract_batch_size", type=int, default=8, help="frames per landmark FAN / net_recon forward")
+    parser.add_argument("--extract_workers", type=int, default=2, help="threads running align_img ahead of net_recon")
+    parser.add_argument("--cpu", dest="cpu", action="store_true")
+    args = parser.parse_args()
+
+    if torch.cuda.is_available() and not args.cpu:
+        args.device = "cuda"
+    else:
+        args.device = "cpu"
+
+    main(args)
@@ -1,4 +1,5 @@
 from glob import glob
+import json
 import shutil
 import torch
 from time import  strftime
@@ -7,10 +8,23 @@ from argparse import ArgumentParser
 
 from src.utils.preprocess import CropAndExtract
 from src.test_audio2coeff import Audio2Coeff  
-from src.facerender.animate import AnimateFromCoeff
+from src.facerender.animate import AnimateFromCoeff, save_video
 from src.generate_batch import get_data
-from src.generate_facerender_batch import get_facerender_data
+from src.generate_facerender_batch import get_facerender_data, output_render_map
 from src.utils.init_path import init_path
+from src.utils.profiling import timed, profile_section
+from src.utils.safetensor_helper import release_checkpoints
+from src.utils.precision import PRECISIONS, resolve as resolve_precision
+from src.utils.coeff_cache import CoeffCache, array_hash
+from src.utils.motion_library import DEFAULT_LIBRARY_DIR, MotionLibrary
+from src.utils.render_shards import shard_ranges, write_plan, read_plan, shard_path, save_shard, assemble
+from src.utils import audio
+from scipy.io import loadmat
+
+# helpers shared with Wav2Lip (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common.hashing import file_hash, file_stamp
+from common.silence import silent_spans
 
 def main(args):
     #torch.backends.cudnn.enabled = False
@@ -28,37 +42,73 @@ def main(args):
     ref_eyeblink = args.ref_eyeblink
     ref_pose = args.ref_pose
 
+    # A motion preset stands in for both reference videos, already extracted
+    preset_path, preset_blink, preset_pose = None, None, None
+    if args.motion_preset:
+        motion_library = MotionLibrary(args.motion_library_dir)
+        preset_blink, preset_pose = motion_library.load(args.motion_preset)
+        preset_path = motion_library.path(args.motion_preset)
+        ref_eyeblink, ref_pose = None, None
+        if args.still:
+            # still mode would overwrite the preset's head pose with the source pose
+            print('--still ignored: rendering the head motion of preset {}'.format(args.motion_preset))
+            args.still = False
+
     current_root_path = os.path.split(sys.argv[0])[0]
+    main_start = time.time()
+    timings = {}
 
     sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), args.size, args.old_version, args.preprocess)
 
     #init model
-    preprocess_model = CropAndExtract(sadtalker_paths, device)
+    with timed(timings, 'model_load'):
+        preprocess_model = CropAndExtract(sadtalker_paths, device, batch_size=args.extract_batch_size, workers=args.extract_workers)
 
-    audio_to_coeff = Audio2Coeff(sadtalker_paths,  device)
-    
-    animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device)
+        audio_to_coeff = Audio2Coeff(sadtalker_paths,  device, batch_frames=args.coeff_batch_frames)
+        
+        precision = resolve_precision(args.precision, device)
+        animate_from_coeff = AnimateFromCoeff(sadtalker_paths, device, precision=precision,
+                                              quantized_dir=os.path.join(args.checkpoint_dir, 'quantized'),
+                                              calibration_frames=args.calibration_frames,
+                                              source_cache_dir=args.source_cache_dir)
+        release_checkpoints()
 
     #crop image and extract 3dmm from image
     first_frame_dir = os.path.join(save_dir, 'first_frame_dir')
     os.makedirs(first_frame_dir, exist_ok=True)
     print('3DMM Extraction for source image')
     first_coeff_path, crop_pic_path, crop_info =  preprocess_model.generate(pic_path, first_frame_dir, args.preprocess,\
-                                                                             source_image_flag=True, pic_size=args.size)
+                                                                             source_image_flag=True, pic_size=args.size, timings=timings)
     if first_coeff_path is None:
         print("Can't get the coeffs of the input")
         return
 
-    if ref_eyeblink is not None:
+    # Seeded jobs are reproducible: reuse the coefficients of an earlier job with the
+    # same audio, avatar and motion inputs (render-only variants skip the audio stage)
+    coeff_cache, cached_coeffs = None, None
+    # cache name -> hit, reported with the timings (see metrics.record_cache_lookup)
+    caches = {}
+    if args.coeff_cache_dir and args.seed is not None:
+        coeff_cache = CoeffCache(args.coeff_cache_dir)
+        coeff_key = CoeffCache.key(audio=file_hash(audio_path),
+                                   avatar=array_hash(loadmat(first_coeff_path)['coeff_3dmm'][:1, :70]),
+                                   pose_style=pose_style, still=args.still, seed=args.seed,
+                                   ref_eyeblink=file_hash(ref_eyeblink), ref_pose=file_hash(ref_pose),
+                                   motion_preset=file_hash(preset_path),
+                                   models=[file_stamp(path) for path in audio_to_coeff.model_files])
+        cached_coeffs = coeff_cache.get(coeff_key)
+        caches['coeffs'] = cached_coeffs is not None
+
+    if cached_coeffs is None and ref_eyeblink is not None:
         ref_eyeblink_videoname = os.path.splitext(os.path.split(ref_eyeblink)[-1])[0]
         ref_eyeblink_frame_dir = os.path.join(save_dir, ref_eyeblink_videoname)
         os.makedirs(ref_eyeblink_frame_dir, exist_ok=True)
         print('3DMM Extraction for the reference video providing eye blinking')
-        ref_eyeblink_coeff_path, _, _ =  preprocess_model.generate(ref_eyeblink, ref_eyeblink_frame_dir, args.preprocess, source_image_flag=False)
+        ref_eyeblink_coeff_path, _, _ =  preprocess_model.generate(ref_eyeblink, ref_eyeblink_frame_dir, args.preprocess, source_image_flag=False, timings=timings)
     else:
         ref_eyeblink_coeff_path=None
 
-    if ref_pose is not None:
+    if cached_coeffs is None and ref_pose is not None:
         if ref_pose == ref_eyeblink: 
             ref_pose_coeff_path = ref_eyeblink_coeff_path
         else:
@@ -66,33 +116,156 @@ def main(args):
             ref_pose_frame_dir = os.path.join(save_dir, ref_pose_videoname)
             os.makedirs(ref_pose_frame_dir, exist_ok=True)
             print('3DMM Extraction for the reference video providing pose')
-            ref_pose_coeff_path, _, _ =  preprocess_model.generate(ref_pose, ref_pose_frame_dir, args.preprocess, source_image_flag=False)
+            ref_pose_coeff_path, _, _ =  preprocess_model.generate(ref_pose, ref_pose_frame_dir, args.preprocess, source_image_flag=False, timings=timings)
     else:
         ref_pose_coeff_path=None
 
-    #audio2ceoff
-    batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=args.still)
-    coeff_path = audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path)
+    with profile_section(args.profile_dir, device):
+        #audio2ceoff
+        if cached_coeffs is not None:
+            print('Reusing cached audio-to-coefficient result')
+            coeff_path = Audio2Coeff.save_coeffs(cached_coeffs, save_dir,
+                                                 os.path.splitext(os.path.split(first_coeff_path)[-1])[0],
+                                                 os.path.splitext(os.path.split(audio_path)[-1])[0])
+        else:
+            with timed(timings, 'decode'):
+                batch = get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=args.still, seed=args.seed,
+                                 ref_eyeblink_coeff=preset_blink)
+            with timed(timings, 'audio2coeff'):
+                coeff_path = audio_to_coeff.generate(batch, save_dir, pose_style, ref_pose_coeff_path, seed=args.seed, ref_pose=preset_pose)
+            if coeff_cache is not None:
+                coeff_cache.put(coeff_key, loadmat(coeff_path)['coeff_3dmm'])
 
-    # 3dface render
-    if args.face3dvis:
-        from src.face3d.visualize import gen_composed_video
-        gen_composed_video(args, device, first_coeff_path, coeff_path, audio_path, os.path.join(save_dir, '3dface.mp4'))
-    
-    #coeff2video
-    data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path, 
-                                batch_size, input_yaw_list, input_pitch_list, input_roll_list,
-                                expression_scale=args.expression_scale, still_mode=args.still, preprocess=args.preprocess, size=args.size)
-    
-    result = animate_from_coeff.generate(data, save_dir, pic_path, crop_info, \
-                                enhancer=args.enhancer, background_enhancer=args.background_enhancer, preprocess=args.preprocess, img_size=args.size)
+        # 3dface render
+        if args.face3dvis:
+            from src.face3d.visualize import gen_composed_video
+            gen_composed_video(args, device, first_coeff_path, coeff_path, audio_path, os.path.join(save_dir, '3dface.mp4'))
+        
+        #coeff2video
+        with timed(timings, 'decode'):
+            frame_num = loadmat(coeff_path)['coeff_3dmm'].shape[0]
+            pauses = None
+            if args.skip_silence:
+                # same audio window per frame as get_data's mel chunks
+                pauses = silent_spans(audio.load_wav(audio_path, 16000), 16000, 25, frame_num,
+                                      offset=-2/25., threshold_db=args.silence_db, min_silence=args.min_silence)
+
+        # long clips: leave the render to time shards run by other processes (render_shard / compose_shards)
+        ranges = shard_ranges(frame_num, args.render_shards, args.shard_min_frames) if args.shard_dir else []
+        if len(ranges) > 1:
+            write_plan(args.shard_dir, {'ranges': ranges, 'frame_num': frame_num, 'pauses': pauses or [], 'save_dir': save_dir,
+                                        'coeff_path': coeff_path, 'crop_pic_path': crop_pic_path, 'first_coeff_path': first_coeff_path,
+                                        'audio_path': audio_path, 'pic_path': pic_path, 'crop_info': crop_info,
+                                        'options': {name: getattr(args, name) for name in SHARD_OPTIONS}})
+            print('Render planned in {} time shards: {}'.format(len(ranges), ranges))
+            if args.timings_path:
+                with open(args.timings_path, 'w') as f:
+                    json.dump({'frames': frame_num, 'total': time.time() - main_start, 'stages': timings, 'caches': caches}, f)
+            return
+
+        with timed(timings, 'decode'):
+            data = get_facerender_data(coeff_path, crop_pic_path, first_coeff_path, audio_path, 
+                                        batch_size, input_yaw_list, input_pitch_list, input_roll_list,
+                                        expression_scale=args.expression_scale, still_mode=args.still, preprocess=args.preprocess, size=args.size,
+                                        debug_dump=args.verbose, silent_spans=pauses, idle_frames=args.idle_frames,
+                                        frame_stride=frame_stride(args.render_fps))
+        
+        result = animate_from_coeff.generate(data, save_dir, pic_path, crop_info, \
+                                    enhancer=args.enhancer, background_enhancer=args.background_enhancer, preprocess=args.preprocess, img_size=args.size,
+                                    timings=timings, paste=args.paste)
+        if args.source_cache_dir and animate_from_coeff.source_cache_hit is not None:
+            caches['source'] = animate_from_coeff.source_cache_hit
     
     shutil.move(result, save_dir+'.mp4')
     print('The generated video is named:', save_dir+'.mp4')
 
+    if args.timings_path:
+        with open(args.timings_path, 'w') as f:
+            json.dump({'frames': data['frame_num'], 'total': time.time() - main_start, 'stages': timings, 'caches': caches}, f)
+
     if not args.verbose:
         shutil.rmtree(save_dir)
 
+
+# render options a shard plan fixes for every shard and the final video
+SHARD_OPTIONS = ('batch_size', 'size', 'expression_scale', 'input_yaw', 'input_pitch', 'input_roll', 'enhancer',
+                 'background_enhancer', 'still', 'preprocess', 'precision', 'idle_frames', 'old_version', 'verbose',
+                 'render_fps', 'paste')
+
+
+def frame_stride(render_fps):
+    """Rendered frames are held for this many of the video's 25 fps frames."""
+    return max(1, int(round(25. / render_fps)))
+
+
+def render_shard(args):
+    """Renders the frames of one time shard of a plan (written by main with --shard_dir) to its shard file."""
+    main_start = time.time()
+    timings = {}
+    plan = read_plan(args.shard_dir)
+    options = plan['options']
+    start, end = plan['ranges'][args.render_shard]
+
+    with timed(timings, 'decode'):
+        data = get_facerender_data(plan['coeff_path'], plan['crop_pic_path'], plan['first_coeff_path'], plan['audio_path'],
+                                   options['batch_size'], options['input_yaw'], options['input_pitch'], options['input_roll'],
+                                   expression_scale=options['expression_scale'], still_mode=options['still'],
+                                   preprocess=options['preprocess'], size=options['size'],
+                                   silent_spans=plan['pauses'], idle_frames=options['idle_frames'], frame_range=(start, end),
+                                   frame_stride=frame_stride(options['render_fps']))
+
+    result, caches = [], {}
+    if len(data['frame_index']):    # a shard inside a pause may only repeat idle frames of an earlier one
+        current_root_path = os.path.split(sys.argv[0])[0]
+        sadtalker_paths = init_path(args.checkpoint_dir, os.path.join(current_root_path, 'src/config'), options['size'],
+                                    options['old_version'], options['preprocess'])
+        with timed(timings, 'model_load'):
+            animate_from_coeff = AnimateFromCoeff(sadtalker_paths, args.device, precision=resolve_precision(options['precision'], args.device),
+                                                  quantized_dir=os.path.join(args.checkpoint_dir, 'quantized'),
+                                                  calibration_frames=args.calibration_frames,
+                                                  source_cache_dir=args.source_cache_dir)
+            release_checkpoints()
+        with profile_section(args.profile_dir, args.device, trace_name='motion_shard_{}_trace.json'.format(args.render_shard)):
+            result = animate_from_coeff.render(data, plan['pic_path'], plan['crop_info'], img_size=options['size'], timings=timings)
+        if args.source_cache_dir and animate_from_coeff.source_cache_hit is not None:
+            caches['source'] = animate_from_coeff.source_cache_hit
+
+    with timed(timings, 'encode'):
+        save_shard(shard_path(args.shard_dir, args.render_shard), data['frame_index'], result)
+    print('Shard {} (frames {}-{}) rendered to {}'.format(args.render_shard, start, end, shard_path(args.shard_dir, args.render_shard)))
+
+    if args.timings_path:
+        with open(args.timings_path, 'w') as f:
+            json.dump({'frames': len(data['frame_index']), 'total': time.time() - main_start, 'stages': timings, 'caches': caches}, f)
+
+
+def compose_shards(args):
+    """Joins the rendered shards of a plan frame-exactly, then muxes the audio and pastes/enhances like main."""
+    main_start = time.time()
+    timings = {}
+    plan = read_plan(args.shard_dir)
+    options = plan['options']
+    save_dir = plan['save_dir']
+
+    with timed(timings, 'decode'):
+        render_map = output_render_map(plan['frame_num'], plan['pauses'], options['idle_frames'], frame_stride(options['render_fps']))
+        result = assemble([shard_path(args.shard_dir, index) for index in range(len(plan['ranges']))], render_map)
+
+    video_name = os.path.splitext(os.path.split(plan['coeff_path'])[-1])[0]
+    result = save_video(result, video_name, plan['audio_path'], plan['frame_num'], save_dir, plan['pic_path'], plan['crop_info'],
+                        enhancer=options['enhancer'], background_enhancer=options['background_enhancer'],
+                        preprocess=options['preprocess'], timings=timings, paste=options['paste'])
+
+    shutil.move(result, save_dir+'.mp4')
+    print('The generated video is named:', save_dir+'.mp4')
+
+    if args.timings_path:
+        with open(args.timings_path, 'w') as f:
+            json.dump({'frames': plan['frame_num'], 'total': time.time() - main_start, 'stages': timings}, f)
+
+    if not options['verbose']:
+        shutil.rmtree(save_dir)
+
     
 if __name__ == '__main__':
 
@@ -118,6 +291,29 @@ if __name__ == '__main__':
     parser.add_argument("--preprocess", default='crop', choices=['crop', 'extcrop', 'resize', 'full', 'extfull'], help="how to preprocess the images" ) 
     parser.add_argument("--verbose",action="store_true", help="saving the intermedia output or not" ) 
     parser.add_argument("--old_version",action="store_true", help="use the pth other than safetensor version" ) 
+    parser.add_argument("--timings_path", default=None, help="write a JSON breakdown of per-stage timings to this file" ) 
+    parser.add_argument("--profile_dir", default=None, help="save a torch.profiler Chrome trace of the inference section into this directory" ) 
+    parser.add_argument("--precision", default='fp32', choices=PRECISIONS, help="face renderer precision: fp32, bf16 autocast or int8 quantized (CPU)" ) 
+    parser.add_argument("--calibration_frames", type=int, default=4, help="renderer steps of the first int8 job used for calibration" ) 
+    parser.add_argument("--coeff_batch_frames", type=int, default=0, help="frames per Audio2Exp/Audio2Pose forward (0: original per-window loop)" ) 
+    parser.add_argument("--seed", type=int, default=None, help="seed for the random pose and eye blinks (reproducible, cacheable coefficients)" ) 
+    parser.add_argument("--coeff_cache_dir", default=None, help="cache the audio-to-coefficient results of seeded jobs here" ) 
+    parser.add_argument("--source_cache_dir", default=None, help="cache the renderer's source-image features per avatar here" ) 
+    parser.add_argument("--extract_batch_size", type=int, default=8, help="frames per landmark FAN / net_recon forward when extracting 3DMM from videos" ) 
+    parser.add_argument("--extract_workers", type=int, default=2, help="threads running align_img ahead of net_recon during 3DMM extraction" ) 
+    parser.add_argument("--motion_preset", default=None, help="named pose and eye blink motion from the motion library (instead of --ref_pose/--ref_eyeblink)" ) 
+    parser.add_argument("--motion_library_dir", default=DEFAULT_LIBRARY_DIR, help="directory of the motion presets" ) 
+    parser.add_argument("--skip_silence", action="store_true", help="render only a short idle loop in pauses of the audio" ) 
+    parser.add_argument("--silence_db", type=float, default=-40., help="audio below the loud parts by this many dB counts as silence" ) 
+    parser.add_argument("--min_silence", type=float, default=0.5, help="shortest pause (seconds) that skips rendering" ) 
+    parser.add_argument("--idle_frames", type=int, default=10, help="frames rendered at the start of a pause and looped back and forth" ) 
+    parser.add_argument("--shard_dir", default=None, help="plan the render of long clips as time shards in this directory instead of rendering" ) 
+    parser.add_argument("--render_shards", type=int, default=1, help="time shards of a planned render (with --shard_dir)" ) 
+    parser.add_argument("--shard_min_frames", type=int, default=250, help="shortest time shard; shorter clips are rendered in one piece" ) 
+    parser.add_argument("--render_shard", type=int, default=None, help="render this shard of the plan in --shard_dir" ) 
+    parser.add_argument("--compose_shards", action="store_true", help="write the video from the rendered shards in --shard_dir" ) 
+    parser.add_argument("--render_fps", type=float, default=25., help="frames rendered per second, each held in the 25 fps video (draft quality)" ) 
+    parser.add_argument("--paste", default='seamless', choices=['seamless', 'fast'], help="paste back of full/extfull: Poisson blending or a feathered alpha blend" ) 
 
 
     # net structure and parameters
@@ -141,5 +337,10 @@ if __name__ == '__main__':
     else:
         args.device = "cpu"
 
-    main(args)
+    if args.render_shard is not None:
+        render_shard(args)
+    elif args.compose_shards:
+        compose_shards(args)
+    else:
+        main(args)
 
@@ -10,7 +10,9 @@ class Audio2Exp(nn.Module):
         self.device = device
         self.netG = netG.to(device)
 
-    def test(self, batch):
+    def test(self, batch, frames_per_step=10):
+        # netG predicts every frame independently, so frames_per_step only sets
+        # the forward batch size (larger steps: fewer, bigger calls)
 
         mel_input = batch['indiv_mels']                         # bs T 1 80 16
         bs = mel_input.shape[0]
@@ -18,13 +20,13 @@ class Audio2Exp(nn.Module):
 
         exp_coeff_pred = []
 
-        for i in tqdm(range(0, T, 10),'audio2exp:'): # every 10 frames
+        for i in tqdm(range(0, T, frames_per_step),'audio2exp:'): # every frames_per_step frames
             
-            current_mel_input = mel_input[:,i:i+10]
+            current_mel_input = mel_input[:,i:i+frames_per_step]
 
             #ref = batch['ref'][:, :, :64].repeat((1,current_mel_input.shape[1],1))           #bs T 64
-            ref = batch['ref'][:, :, :64][:, i:i+10]
-            ratio = batch['ratio_gt'][:, i:i+10]                               #bs T
+            ref = batch['ref'][:, :, :64][:, i:i+frames_per_step]
+            ratio = batch['ratio_gt'][:, i:i+frames_per_step]                               #bs T
 
             audiox = current_mel_input.view(-1, 1, 80, 16)                  # bs*T 1 80 16
 
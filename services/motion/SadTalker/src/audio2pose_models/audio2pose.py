@@ -45,7 +45,12 @@ class Audio2Pose(nn.Module):
 
         return batch
 
-    def test(self, x):
+    def test(self, x, batch_frames=0, generator=None):
+        # batch_frames > 0: encode the audio and decode all pose windows in batches
+        # of up to batch_frames frames instead of one window at a time.
+        # generator: torch.Generator for the CVAE latents (seeded jobs)
+        if batch_frames > 0:
+            return self.test_batched(x, batch_frames, generator)
 
         batch = {}
         ref = x['ref']                            #bs 1 70
@@ -66,7 +71,7 @@ class Audio2Pose(nn.Module):
                                                 device=batch['ref'].device)]
 
         for i in range(div):
-            z = torch.randn(bs, self.latent_dim).to(ref.device)
+            z = torch.randn(bs, self.latent_dim, generator=generator).to(ref.device)
             batch['z'] = z
             audio_emb = self.audio_encoder(indiv_mels_use[:, i*self.seq_len:(i+1)*self.seq_len,:,:,:]) #bs seq_len 512
             batch['audio_emb'] = audio_emb
@@ -74,7 +79,7 @@ class Audio2Pose(nn.Module):
             pose_motion_pred_list.append(batch['pose_motion_pred'])  #list of bs seq_len 6
         
         if re != 0:
-            z = torch.randn(bs, self.latent_dim).to(ref.device)
+            z = torch.randn(bs, self.latent_dim, generator=generator).to(ref.device)
             batch['z'] = z
             audio_emb = self.audio_encoder(indiv_mels_use[:, -1*self.seq_len:,:,:,:]) #bs seq_len  512
             if audio_emb.shape[1] != self.seq_len:
@@ -92,3 +97,62 @@ class Audio2Pose(nn.Module):
 
         batch['pose_pred'] = pose_pred
         return batch
+
+    def test_batched(self, x, batch_frames, generator=None):
+        """
+        Same windows and results as test(): a zero-motion first frame, div full
+        seq_len windows and, for the remaining re frames, the last seq_len frames
+        (left-padded with the first embedding if the clip is shorter) of which
+        only the last re are kept. Each window still draws its own z, in order.
+        """
+        batch = {}
+        ref = x['ref']                            #bs 1 70
+        batch['ref'] = x['ref'][:,0,-6:]  
+        batch['class'] = x['class']  
+        bs = ref.shape[0]
+
+        indiv_mels_use = x['indiv_mels'][:, 1:]  # we regard the ref as the first frame
+        num_frames = int(x['num_frames']) - 1
+        div = num_frames//self.seq_len
+        re = num_frames%self.seq_len
+
+        # The audio encoder works frame by frame: embed the whole clip at once
+        audio_emb = [self.audio_encoder(indiv_mels_use[:, i:i+batch_frames])
+                     for i in range(0, num_frames, batch_frames)]
+        audio_emb = torch.cat(audio_emb, 1) if audio_emb else None  #bs T-1 512
+
+        windows = [audio_emb[:, i*self.seq_len:(i+1)*self.seq_len] for i in range(div)]
+        if re != 0:
+            last = audio_emb[:, -1*self.seq_len:]
+            if last.shape[1] != self.seq_len:
+                last = torch.cat([last[:, :1].repeat(1, self.seq_len-last.shape[1], 1), last], 1)
+            windows.append(last)
+
+        pose_motion_pred_list = [torch.zeros(batch['ref'].unsqueeze(1).shape, dtype=batch['ref'].dtype, 
+                                                device=batch['ref'].device)]
+        if windows:
+            z = torch.stack([torch.randn(bs, self.latent_dim, generator=generator).to(ref.device)
+                             for _ in windows])  #W bs latent
+            windows = torch.stack(windows)                                                     #W bs seq_len 512
+            # Windows go along the batch dimension (window-major)
+            windows_per_step = max(1, batch_frames//self.seq_len)
+            preds = []
+            for i in range(0, len(windows), windows_per_step):
+                n = len(windows[i:i+windows_per_step])
+                window_batch = {'z': z[i:i+n].reshape(n*bs, -1),
+                                'audio_emb': windows[i:i+n].reshape((n*bs,) + windows.shape[2:]),
+                                'ref': batch['ref'].repeat(n, 1),
+                                'class': batch['class'].repeat(n)}
+                preds.append(self.netG.test(window_batch)['pose_motion_pred'].reshape(n, bs, self.seq_len, -1))
+            preds = torch.cat(preds)                                                           #W bs seq_len 6
+            pose_motion_pred_list += [preds[i] for i in range(div)]
+            if re != 0:
+                pose_motion_pred_list.append(preds[-1][:, -1*re:, :])
+
+        pose_motion_pred = torch.cat(pose_motion_pred_list, dim = 1)
+        batch['pose_motion_pred'] = pose_motion_pred
+
+        pose_pred = ref[:, :1, -6:] + pose_motion_pred  # bs T 6
+
+        batch['pose_pred'] = pose_pred
+        return batch
@@ -45,8 +45,12 @@ class KeypointExtractor():
         self.detector = init_alignment_model('awing_fan',device=device, model_rootpath=root_path)   
         self.det_net = init_detection_model('retinaface_resnet50', half=False,device=device, model_rootpath=root_path)
 
-    def extract_keypoint(self, images, name=None, info=True):
-        if isinstance(images, list):
+    def extract_keypoint(self, images, name=None, info=True, batch_size=1):
+        if isinstance(images, list) and batch_size > 1:
+            keypoints = self.extract_keypoint_batched(images, batch_size, info)
+            np.savetxt(os.path.splitext(name)[0]+'.txt', keypoints.reshape(-1))
+            return keypoints
+        elif isinstance(images, list):
             keypoints = []
             if info:
                 i_range = tqdm(images,desc='landmark Det:')
@@ -98,6 +102,53 @@ class KeypointExtractor():
                 np.savetxt(os.path.splitext(name)[0]+'.txt', keypoints.reshape(-1))
             return keypoints
 
+    def detect_face(self, image):
+        """Face crop of image and its top-left corner, or None when no face is found."""
+        while True:
+            try:
+                with torch.no_grad():
+                    bboxes = self.det_net.detect_faces(image, 0.97)
+                if len(bboxes) == 0:
+                    return None
+                bboxes = bboxes[0]
+                img = np.array(image)[int(bboxes[1]):int(bboxes[3]), int(bboxes[0]):int(bboxes[2]), :]
+                return img, int(bboxes[0]), int(bboxes[1])
+            except RuntimeError as e:
+                if str(e).startswith('CUDA'):
+                    print("Warning: out of memory, sleep for 1s")
+                    time.sleep(1)
+                else:
+                    raise
+            except TypeError:
+                return None
+
+    def extract_keypoint_batched(self, images, batch_size, info=True):
+        """
+        extract_keypoint for a list of frames, running the alignment FAN on
+        mini-batches of batch_size face crops. Frames without a face reuse the
+        previous frame's keypoints (all -1 before the first face).
+        """
+        keypoints = []
+        with tqdm(total=len(images), desc='landmark Det:', disable=not info) as pbar:
+            for start in range(0, len(images), batch_size):
+                faces = [self.detect_face(image) for image in images[start:start + batch_size]]
+                found = [face for face in faces if face is not None]
+                if found:
+                    with torch.no_grad():
+                        landmarks = iter(self.detector.get_landmarks_batch([img for img, _, _ in found]))
+                for face in faces:
+                    if face is None:
+                        keypoints.append(keypoints[-1] if keypoints else -1. * np.ones([68, 2]))
+                        continue
+                    _, x, y = face
+                    current_kp = landmark_98_to_68(next(landmarks))
+                    #### keypoints to the original location
+                    current_kp[:,0] += x
+                    current_kp[:,1] += y
+                    keypoints.append(current_kp)
+                pbar.update(len(faces))
+        return np.stack(keypoints)
+
 def read_video(filename):
     frames = []
     cap = cv2.VideoCapture(filename)
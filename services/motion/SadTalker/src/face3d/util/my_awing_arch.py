@@ -357,22 +357,27 @@ class FAN(nn.Module):
         return outputs, boundary_channels
 
     def get_landmarks(self, img):
-        H, W, _ = img.shape
-        offset = W / 64, H / 64, 0, 0
-
-        img = cv2.resize(img, (256, 256))
-        inp = img[..., ::-1]
-        inp = torch.from_numpy(np.ascontiguousarray(inp.transpose((2, 0, 1)))).float()
+        return self.get_landmarks_batch([img])[0]
+
+    def get_landmarks_batch(self, imgs):
+        """98 landmarks for each face crop in imgs (crops of any size, one forward pass)."""
+        inp, offsets = [], []
+        for img in imgs:
+            H, W, _ = img.shape
+            offsets.append((W / 64, H / 64))
+
+            img = cv2.resize(img, (256, 256))
+            inp.append(np.ascontiguousarray(img[..., ::-1].transpose((2, 0, 1))))
+        inp = torch.from_numpy(np.stack(inp)).float()
         inp = inp.to(self.device)
-        inp.div_(255.0).unsqueeze_(0)
+        inp.div_(255.0)
 
         outputs, _ = self.forward(inp)
         out = outputs[-1][:, :-1, :, :]
         heatmaps = out.detach().cpu().numpy()
 
-        pred = calculate_points(heatmaps).reshape(-1, 2)
-
-        pred *= offset[:2]
-        pred += offset[-2:]
+        # calculate_points clamps border neighbours batch-wide, so decode per face
+        preds = np.stack([calculate_points(heatmap[None])[0] for heatmap in heatmaps])
+        preds *= np.array(offsets)[:, None, :]
 
-        return pred
+        return preds
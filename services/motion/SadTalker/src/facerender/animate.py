@@ -4,8 +4,6 @@ import yaml
 import numpy as np
 import warnings
 from skimage import img_as_ubyte
-import safetensors
-import safetensors.torch 
 warnings.filterwarnings('ignore')
 
 
@@ -17,12 +15,16 @@ import torchvision
 from src.facerender.modules.keypoint_detector import HEEstimator, KPDetector
 from src.facerender.modules.mapping import MappingNet
 from src.facerender.modules.generator import OcclusionAwareGenerator, OcclusionAwareSPADEGenerator
-from src.facerender.modules.make_animation import make_animation 
+from src.facerender.modules.make_animation import make_animation, encode_source
 
 from pydub import AudioSegment 
 from src.utils.face_enhancer import enhancer_generator_with_len, enhancer_list
 from src.utils.paste_pic import paste_pic
 from src.utils.videoio import save_video_with_watermark
+from src.utils.profiling import timed
+from src.utils.safetensor_helper import load_prefix_from_safetensor
+from src.utils.precision import autocast, int8_cache_dir, prepare_int8, convert_int8, save_int8, load_int8
+from src.utils.source_cache import SourceFeatureCache, model_id, source_key
 
 try:
     import webui  # in webui
@@ -32,7 +34,8 @@ except:
 
 class AnimateFromCoeff():
 
-    def __init__(self, sadtalker_path, device):
+    def __init__(self, sadtalker_path, device, precision='fp32', quantized_dir=None, calibration_frames=4,
+                 source_cache_dir=None):
 
         with open(sadtalker_path['facerender_yaml']) as f:
             config = yaml.safe_load(f)
@@ -82,31 +85,67 @@ class AnimateFromCoeff():
         self.mapping.eval()
          
         self.device = device
+        self.precision = precision
+        self.calibration_frames = calibration_frames
+        # name -> cache path of int8 networks still waiting for calibration
+        self.uncalibrated = {}
+        # Checkpoints the rendered source features depend on (plus the int8 networks, if used)
+        self.model_files = [sadtalker_path.get('checkpoint') or sadtalker_path['free_view_checkpoint'],
+                            sadtalker_path['mappingnet_checkpoint']]
+        if precision == 'int8':
+            self.load_int8_networks(sadtalker_path, quantized_dir or os.path.join(os.path.dirname(sadtalker_path['mappingnet_checkpoint']), 'quantized'))
+        self.source_cache = SourceFeatureCache(source_cache_dir)
+        # Whether the last encode_source found the avatar in the cache (None before the first)
+        self.source_cache_hit = None
+
+    def load_int8_networks(self, sadtalker_path, quantized_dir):
+        """Loads cached int8 renderer networks, or prepares them for calibration on the first generate()."""
+        facerender_checkpoint = sadtalker_path.get('checkpoint') or sadtalker_path['free_view_checkpoint']
+        facerender_dir = int8_cache_dir(quantized_dir, facerender_checkpoint)
+        cache_dirs = {'generator': facerender_dir, 'kp_extractor': facerender_dir,
+                      'mapping': int8_cache_dir(quantized_dir, sadtalker_path['mappingnet_checkpoint'])}
+        for name, cache_dir in cache_dirs.items():
+            path = os.path.join(cache_dir, name + '.int8.pt')
+            self.model_files.append(path)
+            if os.path.isfile(path):
+                load_int8(getattr(self, name), path)
+            else:
+                prepare_int8(getattr(self, name))
+                self.uncalibrated[name] = path
+
+    def calibrate(self, source_image, source_semantics, target_semantics, calibration):
+        """Runs the first frames through the observed networks, then converts and caches them as int8."""
+        make_animation(source_image, source_semantics, target_semantics[:, :self.calibration_frames],
+                       self.generator, self.kp_extractor, self.he_estimator, self.mapping, use_exp=True)
+        for name, path in self.uncalibrated.items():
+            network = convert_int8(getattr(self, name))
+            save_int8(network, path, calibration)
+            print('int8 {} calibrated and saved to {}'.format(name, path))
+        self.uncalibrated = {}
+
+    def encode_source(self, source_image, source_semantics):
+        """Source keypoints and feature volume of the avatar, from the cache when it was rendered before."""
+        key = source_key(source_image, source_semantics, model_id(self.model_files, self.precision))
+        source = self.source_cache.get(key, self.device)
+        self.source_cache_hit = source is not None
+        if source is None:
+            with autocast(self.precision, self.device):
+                source = encode_source(source_image, source_semantics, self.generator, self.kp_extractor, self.mapping)
+            self.source_cache.put(key, source)
+        else:
+            print('Reusing cached source features of this avatar')
+        return source
     
     def load_cpk_facevid2vid_safetensor(self, checkpoint_path, generator=None, 
                         kp_detector=None, he_estimator=None,  
                         device="cpu"):
 
-        checkpoint = safetensors.torch.load_file(checkpoint_path)
-
         if generator is not None:
-            x_generator = {}
-            for k,v in checkpoint.items():
-                if 'generator' in k:
-                    x_generator[k.replace('generator.', '')] = v
-            generator.load_state_dict(x_generator)
+            generator.load_state_dict(load_prefix_from_safetensor(checkpoint_path, 'generator'))
         if kp_detector is not None:
-            x_generator = {}
-            for k,v in checkpoint.items():
-                if 'kp_extractor' in k:
-                    x_generator[k.replace('kp_extractor.', '')] = v
-            kp_detector.load_state_dict(x_generator)
+            kp_detector.load_state_dict(load_prefix_from_safetensor(checkpoint_path, 'kp_extractor'))
         if he_estimator is not None:
-            x_generator = {}
-            for k,v in checkpoint.items():
-                if 'he_estimator' in k:
-                    x_generator[k.replace('he_estimator.', '')] = v
-            he_estimator.load_state_dict(x_generator)
+            he_estimator.load_state_dict(load_prefix_from_safetensor(checkpoint_path, 'he_estimator'))
         
         return None
 
@@ -154,14 +193,26 @@ class AnimateFromCoeff():
 
         return checkpoint['epoch']
 
-    def generate(self, x, video_save_dir, pic_path, crop_info, enhancer=None, background_enhancer=None, preprocess='crop', img_size=256):
+    def generate(self, x, video_save_dir, pic_path, crop_info, enhancer=None, background_enhancer=None, preprocess='crop', img_size=256, timings=None,
+                 paste='seamless'):
+
+        result = self.render(x, pic_path, crop_info, img_size=img_size, timings=timings)
+        if 'render_map' in x:
+            # frames inside pauses repeat rendered idle frames
+            result = [result[idx] for idx in x['render_map']]
+        return save_video(result, x['video_name'], x['audio_path'], x['frame_num'], video_save_dir, pic_path, crop_info,
+                          enhancer=enhancer, background_enhancer=background_enhancer, preprocess=preprocess, timings=timings,
+                          paste=paste)
+
+    def render(self, x, pic_path, crop_info, img_size=256, timings=None):
+        """uint8 frames of the rendered windows of x (x['frame_index'] when given), in the crop's aspect ratio."""
 
         source_image=x['source_image'].type(torch.FloatTensor)
         source_semantics=x['source_semantics'].type(torch.FloatTensor)
+        # strided view of the coefficient windows; make_animation moves one frame at a time
         target_semantics=x['target_semantics_list'].type(torch.FloatTensor) 
         source_image=source_image.to(self.device)
         source_semantics=source_semantics.to(self.device)
-        target_semantics=target_semantics.to(self.device)
         if 'yaw_c_seq' in x:
             yaw_c_seq = x['yaw_c_seq'].type(torch.FloatTensor)
             yaw_c_seq = x['yaw_c_seq'].to(self.device)
@@ -180,78 +231,101 @@ class AnimateFromCoeff():
 
         frame_num = x['frame_num']
 
-        predictions_video = make_animation(source_image, source_semantics, target_semantics,
-                                        self.generator, self.kp_extractor, self.he_estimator, self.mapping, 
-                                        yaw_c_seq, pitch_c_seq, roll_c_seq, use_exp = True)
+        if self.uncalibrated:
+            with timed(timings, 'model_load'):
+                self.calibrate(source_image, source_semantics, target_semantics,
+                               {'source_image': pic_path, 'audio': x['audio_path'], 'frames': self.calibration_frames})
 
-        predictions_video = predictions_video.reshape((-1,)+predictions_video.shape[2:])
-        predictions_video = predictions_video[:frame_num]
+        with timed(timings, 'source_encode'):
+            source = self.encode_source(source_image, source_semantics)
 
-        video = []
-        for idx in range(predictions_video.shape[0]):
-            image = predictions_video[idx]
-            image = np.transpose(image.data.cpu().numpy(), [1, 2, 0]).astype(np.float32)
-            video.append(image)
-        result = img_as_ubyte(video)
+        with timed(timings, 'render'):
+            with autocast(self.precision, self.device):
+                predictions_video = make_animation(source_image, source_semantics, target_semantics,
+                                                self.generator, self.kp_extractor, self.he_estimator, self.mapping, 
+                                                yaw_c_seq, pitch_c_seq, roll_c_seq, use_exp = True, source=source)
 
-        ### the generated video is 256x256, so we keep the aspect ratio, 
-        original_size = crop_info[0]
-        if original_size:
-            result = [ cv2.resize(result_i,(img_size, int(img_size * original_size[1]/original_size[0]) )) for result_i in result ]
-        
-        video_name = x['video_name']  + '.mp4'
-        path = os.path.join(video_save_dir, 'temp_'+video_name)
-        
+            predictions_video = predictions_video.float().reshape((-1,)+predictions_video.shape[2:])
+            if 'frame_index' in x:
+                predictions_video = predictions_video[:len(x['frame_index'])]
+            else:
+                predictions_video = predictions_video[:frame_num]
+
+            video = []
+            for idx in range(predictions_video.shape[0]):
+                image = predictions_video[idx]
+                image = np.transpose(image.data.cpu().numpy(), [1, 2, 0]).astype(np.float32)
+                video.append(image)
+            result = img_as_ubyte(video)
+
+            ### the generated video is 256x256, so we keep the aspect ratio, 
+            original_size = crop_info[0]
+            if original_size:
+                result = [ cv2.resize(result_i,(img_size, int(img_size * original_size[1]/original_size[0]) )) for result_i in result ]
+        return result
+
+
+def save_video(result, name, audio_path, frame_num, video_save_dir, pic_path, crop_info, enhancer=None, background_enhancer=None,
+              preprocess='crop', timings=None, paste='seamless'):
+    """Writes the frames with the audio, pasted back into the full image ('seamless' or 'fast') and enhanced as configured."""
+    video_name = name + '.mp4'
+    path = os.path.join(video_save_dir, 'temp_'+video_name)
+    
+    with timed(timings, 'encode'):
         imageio.mimsave(path, result,  fps=float(25))
 
-        av_path = os.path.join(video_save_dir, video_name)
-        return_path = av_path 
-        
-        audio_path =  x['audio_path'] 
-        audio_name = os.path.splitext(os.path.split(audio_path)[-1])[0]
-        new_audio_path = os.path.join(video_save_dir, audio_name+'.wav')
-        start_time = 0
-        # cog will not keep the .mp3 filename
+    av_path = os.path.join(video_save_dir, video_name)
+    return_path = av_path 
+    
+    audio_name = os.path.splitext(os.path.split(audio_path)[-1])[0]
+    new_audio_path = os.path.join(video_save_dir, audio_name+'.wav')
+    start_time = 0
+    # cog will not keep the .mp3 filename
+    with timed(timings, 'mux'):
         sound = AudioSegment.from_file(audio_path)
-        frames = frame_num 
+        frames = frame_num
         end_time = start_time + frames*1/25*1000
         word1=sound.set_frame_rate(16000)
         word = word1[start_time:end_time]
         word.export(new_audio_path, format="wav")
 
         save_video_with_watermark(path, new_audio_path, av_path, watermark= False)
-        print(f'The generated video is named {video_save_dir}/{video_name}') 
-
-        if 'full' in preprocess.lower():
-            # only add watermark to the full image.
-            video_name_full = x['video_name']  + '_full.mp4'
-            full_video_path = os.path.join(video_save_dir, video_name_full)
-            return_path = full_video_path
-            paste_pic(path, pic_path, crop_info, new_audio_path, full_video_path, extended_crop= True if 'ext' in preprocess.lower() else False)
-            print(f'The generated video is named {video_save_dir}/{video_name_full}') 
-        else:
-            full_video_path = av_path 
-
-        #### paste back then enhancers
-        if enhancer:
-            video_name_enhancer = x['video_name']  + '_enhanced.mp4'
-            enhanced_path = os.path.join(video_save_dir, 'temp_'+video_name_enhancer)
-            av_path_enhancer = os.path.join(video_save_dir, video_name_enhancer) 
-            return_path = av_path_enhancer
-
+    print(f'The generated video is named {video_save_dir}/{video_name}') 
+
+    if 'full' in preprocess.lower():
+        # only add watermark to the full image.
+        video_name_full = name  + '_full.mp4'
+        full_video_path = os.path.join(video_save_dir, video_name_full)
+        return_path = full_video_path
+        with timed(timings, 'paste'):
+            paste_pic(path, pic_path, crop_info, new_audio_path, full_video_path, extended_crop= True if 'ext' in preprocess.lower() else False,
+                      fast=paste == 'fast')
+        print(f'The generated video is named {video_save_dir}/{video_name_full}') 
+    else:
+        full_video_path = av_path 
+
+    #### paste back then enhancers
+    if enhancer:
+        video_name_enhancer = name  + '_enhanced.mp4'
+        enhanced_path = os.path.join(video_save_dir, 'temp_'+video_name_enhancer)
+        av_path_enhancer = os.path.join(video_save_dir, video_name_enhancer) 
+        return_path = av_path_enhancer
+
+        with timed(timings, 'enhance'):
             try:
                 enhanced_images_gen_with_len = enhancer_generator_with_len(full_video_path, method=enhancer, bg_upsampler=background_enhancer)
                 imageio.mimsave(enhanced_path, enhanced_images_gen_with_len, fps=float(25))
             except:
                 enhanced_images_gen_with_len = enhancer_list(full_video_path, method=enhancer, bg_upsampler=background_enhancer)
                 imageio.mimsave(enhanced_path, enhanced_images_gen_with_len, fps=float(25))
-            
+        
+        with timed(timings, 'mux'):
             save_video_with_watermark(enhanced_path, new_audio_path, av_path_enhancer, watermark= False)
-            print(f'The generated video is named {video_save_dir}/{video_name_enhancer}')
-            os.remove(enhanced_path)
+        print(f'The generated video is named {video_save_dir}/{video_name_enhancer}')
+        os.remove(enhanced_path)
 
-        os.remove(path)
-        os.remove(new_audio_path)
+    os.remove(path)
+    os.remove(new_audio_path)
 
-        return return_path
+    return return_path
 
@@ -67,8 +67,8 @@ class OcclusionAwareGenerator(nn.Module):
             deformation = deformation.permute(0, 2, 3, 4, 1)
         return F.grid_sample(inp, deformation)
 
-    def forward(self, source_image, kp_driving, kp_source):
-        # Encoding (downsampling) part
+    def encode_source(self, source_image):
+        # Encoding (downsampling) part; depends on the source image only
         out = self.first(source_image)
         for i in range(len(self.down_blocks)):
             out = self.down_blocks[i](out)
@@ -76,7 +76,12 @@ class OcclusionAwareGenerator(nn.Module):
         bs, c, h, w = out.shape
         # print(out.shape)
         feature_3d = out.view(bs, self.reshape_channel, self.reshape_depth, h ,w) 
-        feature_3d = self.resblocks_3d(feature_3d)
+        return self.resblocks_3d(feature_3d)
+
+    def forward(self, source_image, kp_driving, kp_source, feature_3d=None):
+        # feature_3d: precomputed encode_source(source_image), reused across frames
+        if feature_3d is None:
+            feature_3d = self.encode_source(source_image)
 
         # Transforming feature representation according to deformation and occlusion
         output_dict = {}
@@ -207,8 +212,8 @@ class OcclusionAwareSPADEGenerator(nn.Module):
             deformation = deformation.permute(0, 2, 3, 4, 1)
         return F.grid_sample(inp, deformation)
 
-    def forward(self, source_image, kp_driving, kp_source):
-        # Encoding (downsampling) part
+    def encode_source(self, source_image):
+        # Encoding (downsampling) part; depends on the source image only
         out = self.first(source_image)
         for i in range(len(self.down_blocks)):
             out = self.down_blocks[i](out)
@@ -216,7 +221,12 @@ class OcclusionAwareSPADEGenerator(nn.Module):
         bs, c, h, w = out.shape
         # print(out.shape)
         feature_3d = out.view(bs, self.reshape_channel, self.reshape_depth, h ,w) 
-        feature_3d = self.resblocks_3d(feature_3d)
+        return self.resblocks_3d(feature_3d)
+
+    def forward(self, source_image, kp_driving, kp_source, feature_3d=None):
+        # feature_3d: precomputed encode_source(source_image), reused across frames
+        if feature_3d is None:
+            feature_3d = self.encode_source(source_image)
 
         # Transforming feature representation according to deformation and occlusion
         output_dict = {}
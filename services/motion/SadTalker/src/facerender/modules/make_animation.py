@@ -99,21 +99,45 @@ def keypoint_transformation(kp_canonical, he, wo_exp=False):
 
 
 
+def encode_source(source_image, source_semantics, generator, kp_detector, mapping):
+    """
+    Everything make_animation needs from the source that does not depend on the audio:
+    canonical/source keypoints and the generator's 3D feature volume.
+    Computed for one sample; expand_source repeats it to the batch size.
+    """
+    with torch.no_grad():
+        kp_canonical = kp_detector(source_image[:1])
+        he_source = mapping(source_semantics[:1])
+        kp_source = keypoint_transformation(kp_canonical, he_source)
+        feature_3d = generator.encode_source(source_image[:1])
+    return {'kp_canonical': kp_canonical, 'kp_source': kp_source, 'feature_3d': feature_3d}
+
+def expand_source(source, batch_size):
+    def repeat(x):
+        return x.repeat((batch_size,) + (1,) * (x.dim() - 1))
+    return {'kp_canonical': {k: repeat(v) for k, v in source['kp_canonical'].items()},
+            'kp_source': {k: repeat(v) for k, v in source['kp_source'].items()},
+            'feature_3d': repeat(source['feature_3d'])}
+
 def make_animation(source_image, source_semantics, target_semantics,
                             generator, kp_detector, he_estimator, mapping, 
                             yaw_c_seq=None, pitch_c_seq=None, roll_c_seq=None,
-                            use_exp=True, use_half=False):
+                            use_exp=True, use_half=False, source=None):
     with torch.no_grad():
         predictions = []
 
-        kp_canonical = kp_detector(source_image)
-        he_source = mapping(source_semantics)
-        kp_source = keypoint_transformation(kp_canonical, he_source)
+        # source: encode_source output (e.g. from the avatar cache); only the
+        # dense-motion warp and the decoder then run per frame
+        if source is None:
+            source = encode_source(source_image, source_semantics, generator, kp_detector, mapping)
+        source = expand_source(source, source_image.shape[0])
+        kp_canonical = source['kp_canonical']
+        kp_source = source['kp_source']
     
         for frame_idx in tqdm(range(target_semantics.shape[1]), 'Face Renderer:'):
             # still check the dimension
             # print(target_semantics.shape, source_semantics.shape)
-            target_semantics_frame = target_semantics[:, frame_idx]
+            target_semantics_frame = target_semantics[:, frame_idx].to(source_image.device)
             he_driving = mapping(target_semantics_frame)
             if yaw_c_seq is not None:
                 he_driving['yaw_in'] = yaw_c_seq[:, frame_idx]
@@ -125,7 +149,7 @@ def make_animation(source_image, source_semantics, target_semantics,
             kp_driving = keypoint_transformation(kp_canonical, he_driving)
                 
             kp_norm = kp_driving
-            out = generator(source_image, kp_source=kp_source, kp_driving=kp_norm)
+            out = generator(source_image, kp_source=kp_source, kp_driving=kp_norm, feature_3d=source['feature_3d'])
             '''
             source_image_new = out['prediction'].squeeze(1)
             kp_canonical_new =  kp_detector(source_image_new)
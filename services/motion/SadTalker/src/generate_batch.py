@@ -34,13 +34,13 @@ def generate_blink_seq(num_frames):
             break
     return ratio 
 
-def generate_blink_seq_randomly(num_frames):
+def generate_blink_seq_randomly(num_frames, rng=random):
     ratio = np.zeros((num_frames,1))
     if num_frames<=20:
         return ratio
     frame_id = 0
     while frame_id in range(num_frames):
-        start = random.choice(range(min(10,num_frames), min(int(num_frames/2), 70))) 
+        start = rng.choice(range(min(10,num_frames), min(int(num_frames/2), 70))) 
         if frame_id+start+5<=num_frames - 1:
             ratio[frame_id+start:frame_id+start+5, 0] = [0.5, 0.9, 1.0, 0.9, 0.5]
             frame_id = frame_id+start+5
@@ -48,7 +48,7 @@ def generate_blink_seq_randomly(num_frames):
             break
     return ratio
 
-def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=False, idlemode=False, length_of_audio=False, use_blink=True):
+def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, still=False, idlemode=False, length_of_audio=False, use_blink=True, seed=None, ref_eyeblink_coeff=None):
 
     syncnet_mel_step_size = 16
     fps = 25
@@ -78,16 +78,20 @@ def get_data(first_coeff_path, audio_path, device, ref_eyeblink_coeff_path, stil
             indiv_mels.append(m.T)
         indiv_mels = np.asarray(indiv_mels)         # T 80 16
 
-    ratio = generate_blink_seq_randomly(num_frames)      # T
+    ratio = generate_blink_seq_randomly(num_frames, random.Random(seed) if seed is not None else random)      # T
     source_semantics_path = first_coeff_path
     source_semantics_dict = scio.loadmat(source_semantics_path)
     ref_coeff = source_semantics_dict['coeff_3dmm'][:1,:70]         #1 70
     ref_coeff = np.repeat(ref_coeff, num_frames, axis=0)
 
+    # ref_eyeblink_coeff: T x 64 expression track of a motion preset, instead of a .mat path
     if ref_eyeblink_coeff_path is not None:
-        ratio[:num_frames] = 0
         refeyeblink_coeff_dict = scio.loadmat(ref_eyeblink_coeff_path)
-        refeyeblink_coeff = refeyeblink_coeff_dict['coeff_3dmm'][:,:64]
+        ref_eyeblink_coeff = refeyeblink_coeff_dict['coeff_3dmm']
+
+    if ref_eyeblink_coeff is not None:
+        ratio[:num_frames] = 0
+        refeyeblink_coeff = ref_eyeblink_coeff[:,:64]
         refeyeblink_num_frames = refeyeblink_coeff.shape[0]
         if refeyeblink_num_frames<num_frames:
             div = num_frames//refeyeblink_num_frames
@@ -1,13 +1,33 @@
 import os
+import cv2
 import numpy as np
 from PIL import Image
-from skimage import io, img_as_float32, transform
+from skimage import img_as_float32
 import torch
 import scipy.io as scio
 
+from src.utils.silence import idle_render_map
+
 def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path, 
                         batch_size, input_yaw_list=None, input_pitch_list=None, input_roll_list=None, 
-                        expression_scale=1.0, still_mode = False, preprocess='crop', size = 256):
+                        expression_scale=1.0, still_mode = False, preprocess='crop', size = 256, debug_dump=False,
+                        silent_spans=None, idle_frames=10, frame_range=None, frame_stride=1):
+    """
+    Renderer inputs. target_semantics_list is a (batch_size, frames/batch_size, 70|73,
+    2*semantic_radius+1) strided view over the padded coefficients: each frame's
+    window is only gathered when the renderer takes that frame. The last batch is
+    padded with extra frames, which are rendered and dropped (frame_num).
+    debug_dump: also write the target coefficients as text next to coeff_path.
+    silent_spans: [start, end) frame ranges of pauses in the audio. Only their first
+    idle_frames frames are rendered and played back and forth for the rest of the
+    pause; render_map then gives the rendered frame of every output frame.
+    frame_range: [start, end) time shard of the clip. Only its frames are rendered,
+    with the windows still taken from the whole sequence, so that the shards of a
+    clip join without seams. frame_index lists the frames rendered (without
+    render_map, which is left to the caller assembling the shards).
+    frame_stride: render every frame_stride-th frame only and hold it (a lower
+    frame rate in the same 25 fps video).
+    """
 
     semantic_radius = 13
     video_name = os.path.splitext(os.path.split(coeff_path)[-1])[0]
@@ -18,7 +38,10 @@ def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path,
     img1 = Image.open(pic_path)
     source_image = np.array(img1)
     source_image = img_as_float32(source_image)
-    source_image = transform.resize(source_image, (size, size, 3))
+    if source_image.shape[:2] != (size, size):
+        # the cropped source is usually saved at `size` already
+        interpolation = cv2.INTER_AREA if source_image.shape[0] > size else cv2.INTER_LINEAR
+        source_image = cv2.resize(source_image, (size, size), interpolation=interpolation)
     source_image = source_image.transpose((2, 0, 1))
     source_image_ts = torch.FloatTensor(source_image).unsqueeze(0)
     source_image_ts = source_image_ts.repeat(batch_size, 1, 1, 1)
@@ -49,53 +72,65 @@ def get_facerender_data(coeff_path, pic_path, first_coeff_path, audio_path,
     if still_mode:
         generated_3dmm[:, 64:] = np.repeat(source_semantics[:, 64:], generated_3dmm.shape[0], axis=0)
 
-    with open(txt_path+'.txt', 'w') as f:
-        for coeff in generated_3dmm:
-            for i in coeff:
-                f.write(str(i)[:7]   + '  '+'\t')
-            f.write('\n')
+    if debug_dump:
+        np.savetxt(txt_path+'.txt', generated_3dmm, fmt='%.5f', delimiter='\t')
 
-    target_semantics_list = [] 
     frame_num = generated_3dmm.shape[0]
     data['frame_num'] = frame_num
-    for frame_idx in range(frame_num):
-        target_semantics = transform_semantic_target(generated_3dmm, frame_idx, semantic_radius)
-        target_semantics_list.append(target_semantics)
-
-    remainder = frame_num%batch_size
-    if remainder!=0:
-        for _ in range(batch_size-remainder):
-            target_semantics_list.append(target_semantics)
-
-    target_semantics_np = np.array(target_semantics_list)             #frame_num 70 semantic_radius*2+1
-    target_semantics_np = target_semantics_np.reshape(batch_size, -1, target_semantics_np.shape[-2], target_semantics_np.shape[-1])
-    data['target_semantics_list'] = torch.FloatTensor(target_semantics_np)
+    num_windows = -(-frame_num // batch_size) * batch_size
+    target_semantics = transform_semantic_target(generated_3dmm, semantic_radius, num_windows)   #num_windows 70 semantic_radius*2+1
+
+    select = None
+    if silent_spans or frame_range is not None or frame_stride > 1:
+        render_map = output_render_map(frame_num, silent_spans, idle_frames, frame_stride)
+        rendered = np.unique(render_map)
+        if frame_range is not None:
+            rendered = rendered[(rendered >= frame_range[0]) & (rendered < frame_range[1])]
+        num_windows = -(-len(rendered) // batch_size) * batch_size
+        select = np.concatenate([rendered, np.repeat(rendered[-1:], num_windows - len(rendered))])
+        target_semantics = target_semantics[torch.from_numpy(select)]
+        data['frame_index'] = rendered
+        if frame_range is None:
+            data['render_map'] = np.searchsorted(rendered, render_map)
+        if silent_spans or frame_stride > 1:
+            print('Rendering {} of {} frames ({} pauses, frame stride {})'.format(
+                len(rendered), frame_num, len(silent_spans or []), frame_stride))
+
+    data['target_semantics_list'] = target_semantics.reshape((batch_size, num_windows // batch_size) + target_semantics.shape[1:])
     data['video_name'] = video_name
     data['audio_path'] = audio_path
     
-    if input_yaw_list is not None:
-        yaw_c_seq = gen_camera_pose(input_yaw_list, frame_num, batch_size)
-        data['yaw_c_seq'] = torch.FloatTensor(yaw_c_seq)
-    if input_pitch_list is not None:
-        pitch_c_seq = gen_camera_pose(input_pitch_list, frame_num, batch_size)
-        data['pitch_c_seq'] = torch.FloatTensor(pitch_c_seq)
-    if input_roll_list is not None:
-        roll_c_seq = gen_camera_pose(input_roll_list, frame_num, batch_size) 
-        data['roll_c_seq'] = torch.FloatTensor(roll_c_seq)
+    for name, degree_list in (('yaw_c_seq', input_yaw_list), ('pitch_c_seq', input_pitch_list), ('roll_c_seq', input_roll_list)):
+        if degree_list is not None:
+            c_seq = gen_camera_pose(degree_list, frame_num, batch_size)
+            if select is not None:
+                c_seq = c_seq.reshape(-1)[select].reshape(batch_size, -1)
+            data[name] = torch.FloatTensor(c_seq)
  
     return data
 
+def output_render_map(frame_num, silent_spans=None, idle_frames=10, frame_stride=1):
+    """Rendered frame of every output frame: idle loops in pauses, each frame_stride-th frame held."""
+    render_map = idle_render_map(frame_num, silent_spans or [], idle_frames)
+    return render_map // frame_stride * frame_stride
+
 def transform_semantic_1(semantic, semantic_radius):
     semantic_list =  [semantic for i in range(0, semantic_radius*2+1)]
     coeff_3dmm = np.concatenate(semantic_list, 0)
     return coeff_3dmm.transpose(1,0)
 
-def transform_semantic_target(coeff_3dmm, frame_index, semantic_radius):
+def transform_semantic_target(coeff_3dmm, semantic_radius, num_windows=None):
+    """
+    Windows of 2*semantic_radius+1 frames around every frame (clamped at the ends),
+    as a num_windows x C x window view of one edge-padded copy of the coefficients.
+    Windows past the last frame (batch padding) repeat the last frame.
+    """
     num_frames = coeff_3dmm.shape[0]
-    seq = list(range(frame_index- semantic_radius, frame_index + semantic_radius+1))
-    index = [ min(max(item, 0), num_frames-1) for item in seq ] 
-    coeff_3dmm_g = coeff_3dmm[index, :]
-    return coeff_3dmm_g.transpose(1,0)
+    num_windows = num_windows or num_frames
+    coeff_3dmm = torch.FloatTensor(np.asarray(coeff_3dmm))
+    padded = torch.cat([coeff_3dmm[:1].expand(semantic_radius, -1), coeff_3dmm,
+                        coeff_3dmm[-1:].expand(num_windows - num_frames + semantic_radius, -1)])
+    return padded.unfold(0, semantic_radius*2+1, 1)
 
 def gen_camera_pose(camera_degree_list, frame_num, batch_size):
 
@@ -5,13 +5,10 @@ from scipy.io import savemat, loadmat
 from yacs.config import CfgNode as CN
 from scipy.signal import savgol_filter
 
-import safetensors
-import safetensors.torch 
-
 from src.audio2pose_models.audio2pose import Audio2Pose
 from src.audio2exp_models.networks import SimpleWrapperV2 
 from src.audio2exp_models.audio2exp import Audio2Exp
-from src.utils.safetensor_helper import load_x_from_safetensor  
+from src.utils.safetensor_helper import load_prefix_from_safetensor
 
 def load_cpk(checkpoint_path, model=None, optimizer=None, device="cpu"):
     checkpoint = torch.load(checkpoint_path, map_location=torch.device(device))
@@ -24,7 +21,15 @@ def load_cpk(checkpoint_path, model=None, optimizer=None, device="cpu"):
 
 class Audio2Coeff():
 
-    def __init__(self, sadtalker_path, device):
+    def __init__(self, sadtalker_path, device, batch_frames=0):
+        # batch_frames > 0: run Audio2Exp / Audio2Pose over the clip in batches of up to
+        # this many frames instead of their small per-window steps (same results)
+        self.batch_frames = batch_frames
+        # Checkpoints the predicted coefficients depend on (coefficient cache key)
+        if sadtalker_path['use_safetensor']:
+            self.model_files = [sadtalker_path['checkpoint']]
+        else:
+            self.model_files = [sadtalker_path['audio2pose_checkpoint'], sadtalker_path['audio2exp_checkpoint']]
         #load config
         fcfg_pose = open(sadtalker_path['audio2pose_yaml_path'])
         cfg_pose = CN.load_cfg(fcfg_pose)
@@ -42,8 +47,7 @@ class Audio2Coeff():
         
         try:
             if sadtalker_path['use_safetensor']:
-                checkpoints = safetensors.torch.load_file(sadtalker_path['checkpoint'])
-                self.audio2pose_model.load_state_dict(load_x_from_safetensor(checkpoints, 'audio2pose'))
+                self.audio2pose_model.load_state_dict(load_prefix_from_safetensor(sadtalker_path['checkpoint'], 'audio2pose'))
             else:
                 load_cpk(sadtalker_path['audio2pose_checkpoint'], model=self.audio2pose_model, device=device)
         except:
@@ -57,8 +61,7 @@ class Audio2Coeff():
         netG.eval()
         try:
             if sadtalker_path['use_safetensor']:
-                checkpoints = safetensors.torch.load_file(sadtalker_path['checkpoint'])
-                netG.load_state_dict(load_x_from_safetensor(checkpoints, 'audio2exp'))
+                netG.load_state_dict(load_prefix_from_safetensor(sadtalker_path['checkpoint'], 'audio2exp'))
             else:
                 load_cpk(sadtalker_path['audio2exp_checkpoint'], model=netG, device=device)
         except:
@@ -71,43 +74,59 @@ class Audio2Coeff():
  
         self.device = device
 
-    def generate(self, batch, coeff_save_dir, pose_style, ref_pose_coeff_path=None):
+    def generate(self, batch, coeff_save_dir, pose_style, ref_pose_coeff_path=None, seed=None, ref_pose=None):
+        # ref_pose: T x 6 pose track of a motion preset. It replaces Audio2Pose: the head
+        # keeps the source pose and moves only by the preset's motion.
 
         with torch.no_grad():
             #test
-            results_dict_exp= self.audio2exp_model.test(batch)
+            if self.batch_frames > 0:
+                results_dict_exp= self.audio2exp_model.test(batch, frames_per_step=self.batch_frames)
+            else:
+                results_dict_exp= self.audio2exp_model.test(batch)
             exp_pred = results_dict_exp['exp_coeff_pred']                         #bs T 64
 
             #for class_id in  range(1):
             #class_id = 0#(i+10)%45
             #class_id = random.randint(0,46)                                   #46 styles can be selected 
-            batch['class'] = torch.LongTensor([pose_style]).to(self.device)
-            results_dict_pose = self.audio2pose_model.test(batch) 
-            pose_pred = results_dict_pose['pose_pred']                        #bs T 6
-
-            pose_len = pose_pred.shape[1]
-            if pose_len<13: 
-                pose_len = int((pose_len-1)/2)*2+1
-                pose_pred = torch.Tensor(savgol_filter(np.array(pose_pred.cpu()), pose_len, 2, axis=1)).to(self.device)
+            if ref_pose is not None:
+                pose_pred = batch['ref'][:, :1, 64:70].repeat(1, exp_pred.shape[1], 1)    #bs T 6
             else:
-                pose_pred = torch.Tensor(savgol_filter(np.array(pose_pred.cpu()), 13, 2, axis=1)).to(self.device) 
+                batch['class'] = torch.LongTensor([pose_style]).to(self.device)
+                generator = torch.Generator().manual_seed(seed) if seed is not None else None
+                results_dict_pose = self.audio2pose_model.test(batch, batch_frames=self.batch_frames, generator=generator) 
+                pose_pred = results_dict_pose['pose_pred']                        #bs T 6
+
+                pose_len = pose_pred.shape[1]
+                if pose_len<13: 
+                    pose_len = int((pose_len-1)/2)*2+1
+                    pose_pred = torch.Tensor(savgol_filter(np.array(pose_pred.cpu()), pose_len, 2, axis=1)).to(self.device)
+                else:
+                    pose_pred = torch.Tensor(savgol_filter(np.array(pose_pred.cpu()), 13, 2, axis=1)).to(self.device) 
             
             coeffs_pred = torch.cat((exp_pred, pose_pred), dim=-1)            #bs T 70
 
             coeffs_pred_numpy = coeffs_pred[0].clone().detach().cpu().numpy() 
 
-            if ref_pose_coeff_path is not None: 
+            if ref_pose is not None:
+                 coeffs_pred_numpy = self.using_refpose(coeffs_pred_numpy, refpose_coeff=ref_pose)
+            elif ref_pose_coeff_path is not None: 
                  coeffs_pred_numpy = self.using_refpose(coeffs_pred_numpy, ref_pose_coeff_path)
         
-            savemat(os.path.join(coeff_save_dir, '%s##%s.mat'%(batch['pic_name'], batch['audio_name'])),  
-                    {'coeff_3dmm': coeffs_pred_numpy})
-
-            return os.path.join(coeff_save_dir, '%s##%s.mat'%(batch['pic_name'], batch['audio_name']))
+            return self.save_coeffs(coeffs_pred_numpy, coeff_save_dir, batch['pic_name'], batch['audio_name'])
+
+    @staticmethod
+    def save_coeffs(coeffs_pred_numpy, coeff_save_dir, pic_name, audio_name):
+        """Writes the T x 70 coefficients where get_facerender_data expects them; returns the .mat path."""
+        coeff_path = os.path.join(coeff_save_dir, '%s##%s.mat'%(pic_name, audio_name))
+        savemat(coeff_path, {'coeff_3dmm': coeffs_pred_numpy})
+        return coeff_path
     
-    def using_refpose(self, coeffs_pred_numpy, ref_pose_coeff_path):
+    def using_refpose(self, coeffs_pred_numpy, ref_pose_coeff_path=None, refpose_coeff=None):
         num_frames = coeffs_pred_numpy.shape[0]
-        refpose_coeff_dict = loadmat(ref_pose_coeff_path)
-        refpose_coeff = refpose_coeff_dict['coeff_3dmm'][:,64:70]
+        if refpose_coeff is None:
+            refpose_coeff_dict = loadmat(ref_pose_coeff_path)
+            refpose_coeff = refpose_coeff_dict['coeff_3dmm'][:,64:70]
         refpose_num_frames = refpose_coeff.shape[0]
         if refpose_num_frames<num_frames:
             div = num_frames//refpose_num_frames
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def array_hash(array):
+    return hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()[:16]
+
+
+class CoeffCache:
+    """
+    Store of Audio2Coeff results (the T x 70 coeff_3dmm array) as <key>.npy files.
+
+    The key covers every input of the audio-to-coefficient stage, so render-only
+    variants of a job (size, enhancer, expression_scale, yaw/pitch/roll, precision)
+    start from the cached coefficients. Results are only reproducible, and thus
+    only cached, for seeded jobs. The oldest files beyond max_files are removed.
+    """
+
+    def __init__(self, cache_dir, max_files=1024):
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+
+    @staticmethod
+    def key(**inputs):
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.npy')
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            coeffs = np.load(path)
+        except (OSError, ValueError) as e:
+            print('Ignoring unreadable coefficient cache entry {}: {}'.format(key, e))
+            return None
+        os.utime(path)
+        return coeffs
+
+    def put(self, key, coeffs):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._path(key) + '.tmp{}'.format(os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, coeffs.astype(np.float32))
+        os.replace(tmp_path, self._path(key))
+        self._prune()
+
+    def _prune(self):
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.npy')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
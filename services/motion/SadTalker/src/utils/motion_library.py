@@ -0,0 +1,49 @@
+import os
+import re
+
+import numpy as np
+
+# services/motion/library, shared with the motion worker
+DEFAULT_LIBRARY_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'library'))
+
+# Preset names double as file names
+PRESET_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+
+class MotionLibrary:
+    """
+    Named reference motions extracted once from a reference clip, stored as
+    <name>.npy holding the clip's T x 70 3DMM coefficients (float32): the
+    expression track [:, :64] drives eye blinks like --ref_eyeblink and the
+    pose track [:, 64:70] drives head motion like --ref_pose.
+    """
+
+    def __init__(self, library_dir):
+        self.library_dir = library_dir
+
+    def path(self, name):
+        if not PRESET_NAME.match(name):
+            raise ValueError('Invalid motion preset name: {!r}'.format(name))
+        return os.path.join(self.library_dir, name + '.npy')
+
+    def names(self):
+        if not os.path.isdir(self.library_dir):
+            return []
+        return sorted(f[:-4] for f in os.listdir(self.library_dir) if f.endswith('.npy'))
+
+    def add(self, name, coeff_3dmm):
+        path = self.path(name)
+        os.makedirs(self.library_dir, exist_ok=True)
+        tmp_path = path + '.tmp{}'.format(os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(coeff_3dmm)[:, :70].astype(np.float32))
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, name):
+        """(blink T x 64, pose T x 6) tracks of a preset."""
+        path = self.path(name)
+        if not os.path.isfile(path):
+            raise KeyError('Unknown motion preset: {!r}'.format(name))
+        coeffs = np.load(path)
+        return coeffs[:, :64], coeffs[:, 64:70]
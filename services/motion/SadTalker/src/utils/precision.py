@@ -0,0 +1,13 @@
+import os
+import sys
+
+# bf16 / int8 helpers and file hashing are shared with Wav2Lip (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
+from common.hashing import checkpoint_hash
+from common.precision import (PRECISIONS, resolve, autocast, prepare_int8, convert_int8,  # noqa: F401
+                              save_int8, load_int8)
+
+
+def int8_cache_dir(cache_dir, checkpoint_path):
+    """Directory of the cached int8 networks loaded from one checkpoint (keyed by its hash)."""
+    return os.path.join(cache_dir, checkpoint_hash(checkpoint_path, cache_dir))
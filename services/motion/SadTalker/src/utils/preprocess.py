@@ -4,8 +4,6 @@ from tqdm import tqdm
 from PIL import Image 
 
 # 3dmm extraction
-import safetensors
-import safetensors.torch 
 from src.face3d.util.preprocess import align_img
 from src.face3d.util.load_mats import load_lm3d
 from src.face3d.models import networks
@@ -15,8 +13,10 @@ from src.utils.croper import Preprocesser
 
 
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
-from src.utils.safetensor_helper import load_x_from_safetensor 
+from src.utils.safetensor_helper import load_prefix_from_safetensor
+from src.utils.profiling import timed
 warnings.filterwarnings("ignore")
 
 def split_coeff(coeffs):
@@ -44,14 +44,19 @@ def split_coeff(coeffs):
 
 
 class CropAndExtract():
-    def __init__(self, sadtalker_path, device):
+    """
+    Crops the face of an image or video and extracts its landmarks and 3DMM
+    coefficients. Video frames go through the alignment FAN and net_recon in
+    mini-batches of batch_size, with align_img spread over `workers` threads.
+    """
+
+    def __init__(self, sadtalker_path, device, batch_size=1, workers=1):
 
         self.propress = Preprocesser(device)
         self.net_recon = networks.define_net_recon(net_recon='resnet50', use_last_fc=False, init_path='').to(device)
         
         if sadtalker_path['use_safetensor']:
-            checkpoint = safetensors.torch.load_file(sadtalker_path['checkpoint'])    
-            self.net_recon.load_state_dict(load_x_from_safetensor(checkpoint, 'face_3drecon'))
+            self.net_recon.load_state_dict(load_prefix_from_safetensor(sadtalker_path['checkpoint'], 'face_3drecon'))
         else:
             checkpoint = torch.load(sadtalker_path['path_of_net_recon_model'], map_location=torch.device(device))    
             self.net_recon.load_state_dict(checkpoint['net_recon'])
@@ -59,8 +64,27 @@ class CropAndExtract():
         self.net_recon.eval()
         self.lm3d_std = load_lm3d(sadtalker_path['dir_of_BFM_fitting'])
         self.device = device
-    
-    def generate(self, input_path, save_dir, crop_or_resize='crop', source_image_flag=False, pic_size=256):
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+
+    def align(self, frame, lm1):
+        """align_img for one frame: (trans_params as float32, aligned 224x224 RGB array)."""
+        W,H = frame.size
+        if np.mean(lm1) == -1:
+            lm1 = (self.lm3d_std[:, :2]+1)/2.
+            lm1 = np.concatenate(
+                [lm1[:, :1]*W, lm1[:, 1:2]*H], 1
+            )
+        else:
+            lm1 = lm1.copy()
+            lm1[:, -1] = H - 1 - lm1[:, -1]
+
+        trans_params, im1, lm1, _ = align_img(frame, lm1, self.lm3d_std)
+
+        trans_params = trans_params.astype(np.float32)
+        return trans_params, np.array(im1)
+
+    def generate(self, input_path, save_dir, crop_or_resize='crop', source_image_flag=False, pic_size=256, timings=None):
 
         pic_name = os.path.splitext(os.path.split(input_path)[-1])[0]  
 
@@ -91,24 +115,25 @@ class CropAndExtract():
 
         x_full_frames= [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)  for frame in full_frames] 
 
-        #### crop images as the 
-        if 'crop' in crop_or_resize.lower(): # default crop
-            x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
-            clx, cly, crx, cry = crop
-            lx, ly, rx, ry = quad
-            lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
-            oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
-            crop_info = ((ox2 - ox1, oy2 - oy1), crop, quad)
-        elif 'full' in crop_or_resize.lower():
-            x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
-            clx, cly, crx, cry = crop
-            lx, ly, rx, ry = quad
-            lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
-            oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
-            crop_info = ((ox2 - ox1, oy2 - oy1), crop, quad)
-        else: # resize mode
-            oy1, oy2, ox1, ox2 = 0, x_full_frames[0].shape[0], 0, x_full_frames[0].shape[1] 
-            crop_info = ((ox2 - ox1, oy2 - oy1), None, None)
+        with timed(timings, 'face_detect'):
+            #### crop images as the 
+            if 'crop' in crop_or_resize.lower(): # default crop
+                x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
+                clx, cly, crx, cry = crop
+                lx, ly, rx, ry = quad
+                lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
+                oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
+                crop_info = ((ox2 - ox1, oy2 - oy1), crop, quad)
+            elif 'full' in crop_or_resize.lower():
+                x_full_frames, crop, quad = self.propress.crop(x_full_frames, still=True if 'ext' in crop_or_resize.lower() else False, xsize=512)
+                clx, cly, crx, cry = crop
+                lx, ly, rx, ry = quad
+                lx, ly, rx, ry = int(lx), int(ly), int(rx), int(ry)
+                oy1, oy2, ox1, ox2 = cly+ly, cly+ry, clx+lx, clx+rx
+                crop_info = ((ox2 - ox1, oy2 - oy1), crop, quad)
+            else: # resize mode
+                oy1, oy2, ox1, ox2 = 0, x_full_frames[0].shape[0], 0, x_full_frames[0].shape[1] 
+                crop_info = ((ox2 - ox1, oy2 - oy1), None, None)
 
         frames_pil = [Image.fromarray(cv2.resize(frame,(pic_size, pic_size))) for frame in x_full_frames]
         if len(frames_pil) == 0:
@@ -120,51 +145,46 @@ class CropAndExtract():
             cv2.imwrite(png_path, cv2.cvtColor(np.array(frame), cv2.COLOR_RGB2BGR))
 
         # 2. get the landmark according to the detected face. 
-        if not os.path.isfile(landmarks_path): 
-            lm = self.propress.predictor.extract_keypoint(frames_pil, landmarks_path)
-        else:
-            print(' Using saved landmarks.')
-            lm = np.loadtxt(landmarks_path).astype(np.float32)
-            lm = lm.reshape([len(x_full_frames), -1, 2])
-
-        if not os.path.isfile(coeff_path):
-            # load 3dmm paramter generator from Deep3DFaceRecon_pytorch 
-            video_coeffs, full_coeffs = [],  []
-            for idx in tqdm(range(len(frames_pil)), desc='3DMM Extraction In Video:'):
-                frame = frames_pil[idx]
-                W,H = frame.size
-                lm1 = lm[idx].reshape([-1, 2])
-            
-                if np.mean(lm1) == -1:
-                    lm1 = (self.lm3d_std[:, :2]+1)/2.
-                    lm1 = np.concatenate(
-                        [lm1[:, :1]*W, lm1[:, 1:2]*H], 1
-                    )
-                else:
-                    lm1[:, -1] = H - 1 - lm1[:, -1]
-
-                trans_params, im1, lm1, _ = align_img(frame, lm1, self.lm3d_std)
- 
-                trans_params = np.array([float(item) for item in np.hsplit(trans_params, 5)]).astype(np.float32)
-                im_t = torch.tensor(np.array(im1)/255., dtype=torch.float32).permute(2, 0, 1).to(self.device).unsqueeze(0)
-                
-                with torch.no_grad():
-                    full_coeff = self.net_recon(im_t)
-                    coeffs = split_coeff(full_coeff)
-
-                pred_coeff = {key:coeffs[key].cpu().numpy() for key in coeffs}
- 
-                pred_coeff = np.concatenate([
-                    pred_coeff['exp'], 
-                    pred_coeff['angle'],
-                    pred_coeff['trans'],
-                    trans_params[2:][None],
-                    ], 1)
-                video_coeffs.append(pred_coeff)
-                full_coeffs.append(full_coeff.cpu().numpy())
-
-            semantic_npy = np.array(video_coeffs)[:,0] 
-
-            savemat(coeff_path, {'coeff_3dmm': semantic_npy, 'full_3dmm': np.array(full_coeffs)[0]})
+        with timed(timings, 'face_detect'):
+            if not os.path.isfile(landmarks_path): 
+                lm = self.propress.predictor.extract_keypoint(frames_pil, landmarks_path, batch_size=self.batch_size)
+            else:
+                print(' Using saved landmarks.')
+                lm = np.loadtxt(landmarks_path).astype(np.float32)
+                lm = lm.reshape([len(x_full_frames), -1, 2])
+
+        with timed(timings, '3dmm'):
+            if not os.path.isfile(coeff_path):
+                # load 3dmm paramter generator from Deep3DFaceRecon_pytorch 
+                video_coeffs, full_coeffs = [],  []
+                lms = [lm[idx].reshape([-1, 2]) for idx in range(len(frames_pil))]
+                with ThreadPoolExecutor(self.workers) as pool, \
+                        tqdm(total=len(frames_pil), desc='3DMM Extraction In Video:') as pbar:
+                    # align_img runs ahead in the pool while net_recon takes the batches in order
+                    aligned = pool.map(self.align, frames_pil, lms)
+                    for start in range(0, len(frames_pil), self.batch_size):
+                        batch = [next(aligned) for _ in range(min(self.batch_size, len(frames_pil) - start))]
+                        trans_params = np.stack([params for params, _ in batch])
+                        im_t = torch.tensor(np.stack([im1 for _, im1 in batch])/255., dtype=torch.float32).permute(0, 3, 1, 2).to(self.device)
+
+                        with torch.no_grad():
+                            full_coeff = self.net_recon(im_t)
+                            coeffs = split_coeff(full_coeff)
+
+                        pred_coeff = {key:coeffs[key].cpu().numpy() for key in coeffs}
+
+                        pred_coeff = np.concatenate([
+                            pred_coeff['exp'],
+                            pred_coeff['angle'],
+                            pred_coeff['trans'],
+                            trans_params[:, 2:],
+                            ], 1)
+                        video_coeffs.append(pred_coeff)
+                        full_coeffs.append(full_coeff.cpu().numpy())
+                        pbar.update(len(batch))
+
+                semantic_npy = np.concatenate(video_coeffs)
+
+                savemat(coeff_path, {'coeff_3dmm': semantic_npy, 'full_3dmm': full_coeffs[0][:1]})
 
         return coeff_path, png_path, crop_info
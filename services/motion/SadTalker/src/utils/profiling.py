@@ -0,0 +1,38 @@
+import os
+import time
+from contextlib import contextmanager
+
+import torch
+
+
+@contextmanager
+def timed(timings, stage):
+    """Adds the duration of the block to timings[stage] (no-op when timings is None)."""
+    if timings is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.) + time.time() - start
+
+
+@contextmanager
+def profile_section(profile_dir, device, trace_name='motion_trace.json'):
+    """Records the block with torch.profiler and saves a Chrome trace into profile_dir."""
+    if not profile_dir:
+        yield
+        return
+
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if 'cuda' in device:
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+    with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+        yield
+
+    os.makedirs(profile_dir, exist_ok=True)
+    trace_path = os.path.join(profile_dir, trace_name)
+    profiler.export_chrome_trace(trace_path)
+    print('Profiler trace saved to', trace_path)
@@ -0,0 +1,57 @@
+import json
+import os
+
+import numpy as np
+
+PLAN_NAME = 'plan.json'
+
+
+def shard_ranges(num_frames, shards, min_frames):
+    """
+    [start, end) frame ranges of up to `shards` equal time shards of at least
+    min_frames frames each; a single range when the clip is too short to split.
+    """
+    count = max(1, min(shards, num_frames // max(1, min_frames)))
+    bounds = np.linspace(0, num_frames, count + 1).round().astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def write_plan(shard_dir, plan):
+    """Saves the render plan (coefficient and crop paths, options, ranges) shared by the shards."""
+    os.makedirs(shard_dir, exist_ok=True)
+    path = os.path.join(shard_dir, PLAN_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(plan, f, default=lambda value: value.tolist())    # numpy scalars in crop_info
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def read_plan(shard_dir):
+    with open(os.path.join(shard_dir, PLAN_NAME)) as f:
+        return json.load(f)
+
+
+def shard_path(shard_dir, index):
+    return os.path.join(shard_dir, 'shard_{:03d}.npz'.format(index))
+
+
+def save_shard(path, frame_index, frames):
+    """Rendered frames (uint8, uncompressed) with their frame numbers in the whole clip."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, frame_index=np.asarray(frame_index, dtype=np.int64), frames=np.asarray(frames, dtype=np.uint8))
+    os.replace(tmp_path, path)
+
+
+def assemble(shard_paths, render_map):
+    """Frames of the whole clip from the shard files: frame i is the rendered frame render_map[i]."""
+    frame_index, frames = [], []
+    for path in shard_paths:
+        with np.load(path) as shard:
+            frame_index.append(shard['frame_index'])
+            frames.extend(shard['frames'])
+    frame_index = np.concatenate(frame_index)
+    position = np.minimum(np.searchsorted(frame_index, render_map), max(len(frame_index) - 1, 0))
+    if len(frame_index) == 0 or not np.array_equal(frame_index[position], render_map):
+        raise ValueError('Rendered shards are missing frames of the clip')
+    return [frames[i] for i in position]
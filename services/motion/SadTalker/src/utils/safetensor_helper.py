@@ -1,3 +1,10 @@
+import threading
+
+from safetensors import safe_open
+
+# Open safetensors handles per weight file, shared by every component of the process
+_checkpoints = {}
+_lock = threading.Lock()
 
 
 def load_x_from_safetensor(checkpoint, key):
@@ -5,4 +12,27 @@ def load_x_from_safetensor(checkpoint, key):
     for k,v in checkpoint.items():
         if key in k:
             x_generator[k.replace(key+'.', '')] = v
-    return x_generator
\ No newline at end of file
+    return x_generator
+
+
+def open_checkpoint(checkpoint_path):
+    """Returns the memory-mapped safe_open handle of a weight file, opening it only once."""
+    with _lock:
+        if checkpoint_path not in _checkpoints:
+            _checkpoints[checkpoint_path] = safe_open(checkpoint_path, framework='pt', device='cpu')
+        return _checkpoints[checkpoint_path]
+
+
+def load_prefix_from_safetensor(checkpoint_path, key):
+    """
+    State dict of one component (e.g. 'audio2pose') read from a shared checkpoint handle.
+    Only the tensors under that key are read, instead of materializing the whole file.
+    """
+    checkpoint = open_checkpoint(checkpoint_path)
+    return {k.replace(key+'.', ''): checkpoint.get_tensor(k) for k in checkpoint.keys() if key in k}
+
+
+def release_checkpoints():
+    """Drops the open handles (and their mappings) once all models are loaded."""
+    with _lock:
+        _checkpoints.clear()
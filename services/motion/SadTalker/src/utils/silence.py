@@ -0,0 +1,18 @@
+import numpy as np
+
+
+def idle_render_map(num_frames, spans, idle_frames=10):
+    """
+    Source frame of every output frame: itself, or inside a pause, one of the
+    pause's first idle_frames frames played back and forth.
+    """
+    render_map = np.arange(num_frames)
+    for start, end in spans:
+        loop = min(idle_frames, end - start)
+        if loop > 1:
+            period = 2 * (loop - 1)
+            phase = np.arange(end - start) % period
+            render_map[start:end] = start + np.minimum(phase, period - phase)
+        else:
+            render_map[start:end] = start
+    return render_map
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import torch
+
+# file identities are shared with Wav2Lip (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..')))
+from common.hashing import file_stamp
+
+
+def source_key(source_image, source_semantics, model_id):
+    """Cache key of an avatar: source pixels, source 3DMM coefficients and the renderer weights."""
+    sha = hashlib.sha256(model_id.encode())
+    for tensor in (source_image[:1], source_semantics[:1]):
+        sha.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return sha.hexdigest()[:32]
+
+
+def model_id(checkpoint_paths, precision):
+    """Identifies the renderer weights by checkpoint path, size and mtime (no full-file hashing per job)."""
+    return json.dumps([precision] + [file_stamp(path) for path in checkpoint_paths])
+
+
+class SourceFeatureCache:
+    """
+    Avatar-level cache of make_animation.encode_source outputs.
+
+    Entries live in an in-process LRU (useful when the renderer stays loaded across
+    jobs) and, with cache_dir, as <key>.pt files so repeat jobs in new processes
+    skip the source encoder too. The oldest files beyond max_files are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_items=8, max_files=256):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_files = max_files
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.pt')
+
+    def get(self, key, device):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        if not self.cache_dir or not os.path.isfile(self._path(key)):
+            return None
+        try:
+            source = torch.load(self._path(key), map_location=device)
+        except Exception as e:
+            print('Ignoring unreadable source cache entry {}: {}'.format(key, e))
+            return None
+        os.utime(self._path(key))
+        self._remember(key, source)
+        return source
+
+    def put(self, key, source):
+        self._remember(key, source)
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._path(key) + '.tmp{}'.format(os.getpid())
+        torch.save(source, tmp_path)
+        os.replace(tmp_path, self._path(key))
+        self._prune()
+
+    def _remember(self, key, source):
+        with self._lock:
+            self._items[key] = source
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _prune(self):
+        files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.pt')]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -7,12 +7,16 @@ import os
 import sys
 import json
 import time
+import shutil
 import logging
 import subprocess
 
 # Add parent to path for queue_manager
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'orchestrator'))
 from queue_manager import RedisQueue
+from job_progress import run_with_progress, read_timings, JobCancelled
+import metrics
+import forkserver
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -21,9 +25,163 @@ logger = logging.getLogger(__name__)
 SADTALKER_DIR = os.path.join(os.path.dirname(__file__), 'SadTalker')
 CHECKPOINT_DIR = os.path.join(SADTALKER_DIR, 'checkpoints')
 RESULT_DIR = os.path.join(os.path.dirname(__file__), 'outputs')
+# Renderer source features per avatar, reused by repeat jobs on the same image
+SOURCE_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'sources')
+# Audio-to-coefficient results, reused by re-renders of the same audio and avatar
+COEFF_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'coeffs')
 
 os.makedirs(RESULT_DIR, exist_ok=True)
 
+# Job type of one time shard of a long clip's render, served by any motion process
+SHARD_JOB_TYPE = "motion_render_shard"
+# Seconds between checks on the shards of a job
+SHARD_POLL_INTERVAL = 0.5
+
+
+def motion_timeout():
+    try:
+        import config
+        return config.motion_timeout()
+    except ImportError:
+        return int(os.environ.get("MOTION_TIMEOUT", "300"))
+
+
+def run_sadtalker(queue: RedisQueue, job_id: str, cmd, deadline: float):
+    """
+    Runs SadTalker with progress reporting, stopped at the job's deadline (unix
+    time). Returns: error message, or None on success.
+    """
+    start_time = time.time()
+    timeout = deadline - start_time
+    if timeout <= 0:
+        return "TIMEOUT: Job deadline passed before SadTalker started"
+    try:
+        result = run_with_progress(
+            cmd,
+            queue,
+            job_id,
+            cwd=SADTALKER_DIR,
+            timeout=timeout
+        )
+        elapsed = time.time() - start_time
+        logger.info(f"[{job_id[:8]}] SadTalker completed in {elapsed:.1f}s")
+        metrics.observe_inference_rss("motion", result.peak_rss)
+
+    except subprocess.TimeoutExpired:
+        elapsed = time.time() - start_time
+        error_msg = f"TIMEOUT: Job deadline reached (SadTalker ran for {elapsed:.1f}s)"
+        logger.error(f"[{job_id[:8]}] {error_msg}")
+        return error_msg
+    except JobCancelled:
+        logger.info(f"[{job_id[:8]}] Cancelled; SadTalker stopped after {time.time() - start_time:.1f}s")
+        return "Cancelled"
+
+    if result.returncode != 0:
+        logger.error(f"[{job_id[:8]}] SadTalker failed (exit code {result.returncode})")
+        logger.error(f"[{job_id[:8]}] stderr: {result.stderr[:300]}")
+        return result.stderr[:500]
+    return None
+
+
+def merge_timings(*parts):
+    """Sums the stage timings of the SadTalker runs making up one job (and keeps their cache lookups)."""
+    merged = {"stages": {}, "caches": {}}
+    for timings in parts:
+        if not timings:
+            continue
+        for stage, seconds in timings.get("stages", {}).items():
+            merged["stages"][stage] = merged["stages"].get(stage, 0.0) + seconds
+        merged["caches"].update(timings.get("caches", {}))
+        merged["frames"] = max(merged.get("frames", 0), timings.get("frames", 0))
+    return merged
+
+
+def record_cache_lookups(timings):
+    """Counts the coefficient ('coeffs') and source feature ('source') cache hits SadTalker reported."""
+    for cache, hit in timings.get("caches", {}).items():
+        metrics.record_cache_lookup(f"motion_{cache}", hit)
+
+
+def process_shard_job(queue: RedisQueue, job_id: str):
+    """Renders one time shard of a planned render into the job's shard directory, by the parent job's deadline."""
+    logger.info(f"Processing motion render shard {job_id}")
+    queue.update_job_status(job_id, "processing")
+
+    job_data = queue.get_job_status(job_id)
+    if not job_data:
+        logger.error(f"Job data unavailable for {job_id}")
+        queue.update_job_status(job_id, "failed", error="Job data missing")
+        return
+
+    try:
+        payload = json.loads(job_data.get("payload", "{}"))
+        shard_dir = payload["shard_dir"]
+        index = payload["index"]
+        timings_path = os.path.join(shard_dir, f"shard_{index:03d}_timings.json")
+
+        cmd = [
+            sys.executable, os.path.join(SADTALKER_DIR, 'inference.py'),
+            '--shard_dir', shard_dir,
+            '--render_shard', str(index),
+            '--checkpoint_dir', CHECKPOINT_DIR,
+            '--source_cache_dir', SOURCE_CACHE_DIR,
+            '--timings_path', timings_path,
+        ]
+        error = run_sadtalker(queue, job_id, cmd, payload.get("deadline") or time.time() + motion_timeout())
+        if error:
+            queue.update_job_status(job_id, "failed", error=error)
+            return
+
+        timings = read_timings(timings_path)
+        if timings:
+            queue.record_timings(job_id, timings)
+            metrics.observe_timings("motion", timings)
+            record_cache_lookups(timings)
+        queue.update_job_status(job_id, "completed", result=shard_dir)
+
+    except Exception as e:
+        logger.exception(f"[{job_id[:8]}] EXCEPTION: {e}")
+        queue.update_job_status(job_id, "failed", error=str(e))
+
+
+def render_shards(queue: RedisQueue, job_id: str, shard_dir: str, deadline: float):
+    """
+    Queues every shard of a planned render for the free motion processes and
+    renders the ones nobody has taken yet itself, so a job never waits on an
+    idle queue. Every shard is stopped at the job's deadline (unix time).
+    Returns: error message, or None once every shard is rendered.
+    """
+    with open(os.path.join(shard_dir, 'plan.json')) as f:
+        num_shards = len(json.load(f)["ranges"])
+    pending = {index: queue.submit_job(SHARD_JOB_TYPE, {"shard_dir": shard_dir, "index": index, "deadline": deadline},
+                                       parent_id=job_id)
+               for index in range(num_shards)}
+    logger.info(f"[{job_id[:8]}] Rendering in {num_shards} time shards")
+
+    try:
+        while pending:
+            if queue.is_cancelled(job_id):
+                return "Cancelled"
+            for index, shard_id in list(pending.items()):
+                if queue.claim_job(SHARD_JOB_TYPE, shard_id):
+                    process_shard_job(queue, shard_id)
+                status = queue.get_job_status(shard_id) or {}
+                if status.get("status") == "completed":
+                    del pending[index]
+                elif status.get("status") in ("failed", "cancelled"):
+                    return f"Render shard {index} {status['status']}: {status.get('error', '')}"
+            if pending:
+                if time.time() > deadline:
+                    return f"TIMEOUT: Render shards {sorted(pending)} not finished by the job deadline"
+                time.sleep(SHARD_POLL_INTERVAL)
+        return None
+    finally:
+        # shards of a failed job that no process has started yet
+        for shard_id in pending.values():
+            if queue.claim_job(SHARD_JOB_TYPE, shard_id):
+                queue.update_job_status(shard_id, "failed", error="Parent job failed")
+
+
 def process_job(queue: RedisQueue, job_id: str):
     logger.info(f"Processing motion job {job_id}")
     queue.update_job_status(job_id, "processing")
@@ -34,6 +192,10 @@ def process_job(queue: RedisQueue, job_id: str):
         queue.update_job_status(job_id, "failed", error="Job data missing")
         return
 
+    # SadTalker names its video after a timestamp; a directory per job keeps
+    # concurrent jobs from picking up each other's videos
+    render_dir = os.path.join(RESULT_DIR, job_id)
+    shard_dir = None
     try:
         payload = json.loads(job_data.get("payload", "{}"))
         source_image = payload.get("source_image")
@@ -43,10 +205,12 @@ def process_job(queue: RedisQueue, job_id: str):
         if not source_image or not driven_audio:
             raise ValueError("Missing 'source_image' or 'driven_audio' in payload")
 
-        # Determine output location
+        # Determine output location (pipeline jobs pass a path inside outputs/{pipeline_id}/)
         if not output_path:
             output_path = os.path.join(RESULT_DIR, f"{job_id}.mp4")
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        timings_path = os.path.splitext(output_path)[0] + "_timings.json"
+        os.makedirs(render_dir, exist_ok=True)
 
         # Build SadTalker command
         cmd = [
@@ -54,58 +218,103 @@ def process_job(queue: RedisQueue, job_id: str):
             '--source_image', source_image,
             '--driven_audio', driven_audio,
             '--checkpoint_dir', CHECKPOINT_DIR,
-            '--result_dir', RESULT_DIR,
-            '--enhancer', 'gfpgan',    # Enable face enhancement
-            '--size', '512',            # Higher quality
-            '--preprocess', 'full',     # Keep full frame context
-            '--still',                  # Anchor face position (prevents floating)
+            '--result_dir', render_dir,
+            '--timings_path', timings_path,
+            '--source_cache_dir', SOURCE_CACHE_DIR,
+            '--coeff_cache_dir', COEFF_CACHE_DIR,
         ]
+        if payload.get("seed") is not None:
+            # unseeded jobs keep SadTalker's random motion and skip the coefficient cache
+            cmd += ['--seed', str(payload["seed"])]
+        if payload.get("profile"):
+            # next to the video: render_dir is removed after the job, and a pipeline's
+            # draft and final renders share one directory
+            cmd += ['--profile_dir', os.path.splitext(output_path)[0] + "_profile"]
 
         # Timeout configuration from config.yaml or env var
         try:
             sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'orchestrator'))
             import config
             TIMEOUT_SECONDS = config.motion_timeout()
+            PRECISION = config.motion_precision()
+            COEFF_BATCH_FRAMES = config.motion_coeff_batch_frames()
+            LIBRARY_DIR = config.motion_library_dir()
+            SKIP_SILENCE = config.motion_skip_silence()
+            RENDER_SHARDS, SHARD_MIN_FRAMES = config.motion_render_shards()
+            QUALITY = config.motion_quality(payload.get("quality", "final"), payload.get("motion_preset"))
         except ImportError:
             TIMEOUT_SECONDS = int(os.environ.get("MOTION_TIMEOUT", "300"))
+            PRECISION = os.environ.get("MOTION_PRECISION", "fp32")
+            COEFF_BATCH_FRAMES = int(os.environ.get("MOTION_COEFF_BATCH_FRAMES", "0"))
+            LIBRARY_DIR = os.environ.get("MOTION_LIBRARY_DIR", os.path.join(os.path.dirname(__file__), 'library'))
+            SKIP_SILENCE = os.environ.get("MOTION_SKIP_SILENCE", "false").lower() in ('true', '1', 'yes')
+            RENDER_SHARDS = int(os.environ.get("MOTION_RENDER_SHARDS", "1"))
+            SHARD_MIN_FRAMES = int(os.environ.get("MOTION_SHARD_MIN_FRAMES", "250"))
+            if payload.get("quality") == "draft":
+                QUALITY = {'size': 256, 'preprocess': 'full', 'still': True, 'enhancer': None, 'paste': 'fast', 'render_fps': 12.5}
+            else:
+                QUALITY = {'size': 512, 'preprocess': 'full', 'still': True, 'enhancer': 'gfpgan', 'paste': 'seamless', 'render_fps': 25.0}
+            # still mode would replace the preset's head motion with the source pose
+            QUALITY['still'] = not payload.get("motion_preset")
+        # Quality tier: full keeps the frame context, still anchors the face (prevents floating)
+        cmd += ['--size', str(QUALITY['size']), '--preprocess', QUALITY['preprocess'],
+                '--paste', QUALITY['paste'], '--render_fps', str(QUALITY['render_fps'])]
+        if QUALITY['enhancer']:
+            cmd += ['--enhancer', QUALITY['enhancer']]
+        if QUALITY['still']:
+            cmd += ['--still']
+        cmd += ['--precision', PRECISION, '--coeff_batch_frames', str(COEFF_BATCH_FRAMES)]
+        if SKIP_SILENCE:
+            cmd += ['--skip_silence']
+        if payload.get("motion_preset"):
+            cmd += ['--motion_preset', payload["motion_preset"], '--motion_library_dir', LIBRARY_DIR]
+        # Long clips stop after the coefficients with a render plan for time shards.
+        # Each shard loads the renderer again, which only pays off when other
+        # motion processes render shards alongside this one.
+        shard_dir = os.path.splitext(output_path)[0] + "_shards"
+        if RENDER_SHARDS > 1 and forkserver.configured_children("motion") > 1:
+            cmd += ['--shard_dir', shard_dir, '--render_shards', str(RENDER_SHARDS), '--shard_min_frames', str(SHARD_MIN_FRAMES)]
         
+        # One limit for the whole job: planning, shards and composing share it
+        deadline = time.time() + TIMEOUT_SECONDS
         logger.info(f"[{job_id[:8]}] Starting SadTalker (timeout: {TIMEOUT_SECONDS}s)")
         logger.info(f"[{job_id[:8]}] Source: {os.path.basename(source_image)}")
         logger.info(f"[{job_id[:8]}] Audio: {os.path.basename(driven_audio)}")
         
-        start_time = time.time()
-        
-        try:
-            result = subprocess.run(
-                cmd, 
-                capture_output=True, 
-                text=True, 
-                cwd=SADTALKER_DIR,
-                timeout=TIMEOUT_SECONDS
-            )
-            elapsed = time.time() - start_time
-            logger.info(f"[{job_id[:8]}] SadTalker completed in {elapsed:.1f}s")
-            
-        except subprocess.TimeoutExpired:
-            elapsed = time.time() - start_time
-            error_msg = f"TIMEOUT: Job exceeded {TIMEOUT_SECONDS}s limit (ran for {elapsed:.1f}s)"
-            logger.error(f"[{job_id[:8]}] {error_msg}")
-            queue.update_job_status(job_id, "failed", error=error_msg)
+        error = run_sadtalker(queue, job_id, cmd, deadline)
+        if error:
+            queue.update_job_status(job_id, "failed", error=error)
             return
+        timings = read_timings(timings_path)
 
-        if result.returncode != 0:
-            logger.error(f"[{job_id[:8]}] SadTalker failed (exit code {result.returncode})")
-            logger.error(f"[{job_id[:8]}] stderr: {result.stderr[:300]}")
-            queue.update_job_status(job_id, "failed", error=result.stderr[:500])
-            return
+        if os.path.exists(os.path.join(shard_dir, 'plan.json')):
+            render_start = time.time()
+            error = render_shards(queue, job_id, shard_dir, deadline)
+            render_seconds = time.time() - render_start
+            if not error:
+                compose_cmd = [
+                    sys.executable, os.path.join(SADTALKER_DIR, 'inference.py'),
+                    '--shard_dir', shard_dir,
+                    '--compose_shards',
+                    '--checkpoint_dir', CHECKPOINT_DIR,
+                    '--timings_path', timings_path,
+                ]
+                error = run_sadtalker(queue, job_id, compose_cmd, deadline)
+            if error:
+                queue.update_job_status(job_id, "failed", error=error)
+                return
+            # wall time of the shards, not their summed stages
+            timings = merge_timings(timings, {"stages": {"render": render_seconds}}, read_timings(timings_path))
 
-        # SadTalker outputs to RESULT_DIR with timestamped names.
-        # Find the most recent .mp4 file and rename/move it.
+        # SadTalker writes one timestamped .mp4 into this job's render_dir
         import glob
-        output_files = sorted(glob.glob(os.path.join(RESULT_DIR, '*.mp4')), key=os.path.getmtime, reverse=True)
+        output_files = glob.glob(os.path.join(render_dir, '*.mp4'))
         if output_files:
-            generated_file = output_files[0]
-            os.rename(generated_file, output_path)
+            os.replace(output_files[0], output_path)
+            if timings:
+                queue.record_timings(job_id, timings)
+                metrics.observe_timings("motion", timings)
+                record_cache_lookups(timings)
             logger.info(f"[{job_id[:8]}] SUCCESS: Video saved to {output_path}")
             queue.update_job_status(job_id, "completed", result=output_path)
         else:
@@ -116,18 +325,28 @@ def process_job(queue: RedisQueue, job_id: str):
     except Exception as e:
         logger.exception(f"[{job_id[:8]}] EXCEPTION: {e}")
         queue.update_job_status(job_id, "failed", error=str(e))
+    finally:
+        # scratch space of every outcome, including failed and cancelled jobs
+        shutil.rmtree(render_dir, ignore_errors=True)
+        if shard_dir:
+            shutil.rmtree(shard_dir, ignore_errors=True)
 
 
-if __name__ == "__main__":
-    logger.info("Motion Worker Initializing (SadTalker)...")
-    queue = RedisQueue()
+def run(queue: RedisQueue):
     logger.info("Motion Worker listening for jobs...")
 
     while True:
         try:
+            # Shards first: they finish jobs already being rendered
+            job_id = queue.pop_job(SHARD_JOB_TYPE)
+            if job_id:
+                process_shard_job(queue, job_id)
+                continue
             job_id = queue.pop_job("motion")
             if job_id:
+                job_start = time.time()
                 process_job(queue, job_id)
+                metrics.observe_job("motion", queue.get_job_status(job_id).get("status"), time.time() - job_start)
             else:
                 time.sleep(1)
         except KeyboardInterrupt:
@@ -136,3 +355,26 @@ if __name__ == "__main__":
         except Exception as e:
             logger.exception(f"Unexpected error: {e}")
             time.sleep(5)
+
+
+def child_main(index: int):
+    """Fork server child: serves jobs (SadTalker loads its models in each job's subprocess)."""
+    metrics.start_exporter("motion", child=index)
+    queue = RedisQueue()
+    try:
+        run(queue)
+    except forkserver.Terminated:
+        queue.fail_running_jobs("Worker process stopped")
+        raise
+
+
+if __name__ == "__main__":
+    logger.info("Motion Worker Initializing (SadTalker)...")
+
+    children = forkserver.configured_children("motion")
+    if children:
+        forkserver.serve("motion", child_main, children)
+    else:
+        queue = RedisQueue()
+        metrics.start_exporter("motion")
+        run(queue)
@@ -0,0 +1,123 @@
+"""Batch-size autotuning for face detection and Wav2Lip generation.
+
+The first job with a given device, frame resolution and runtime setting times its
+own batches at increasing candidate sizes (after one warm-up batch) and keeps the
+fastest size that fit in memory for the rest of the job. The result is saved to a
+JSON profile that later jobs with the same key use directly; a job too short to try
+every candidate saves its measurements and the next one continues from there.
+Running out of memory only shrinks the following batches; finished batches are
+never redone.
+"""
+import json
+import os
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints', 'batch_profiles.json')
+
+DETECTION_CANDIDATES = [1, 2, 4, 8, 16, 32]
+GENERATION_CANDIDATES = [16, 32, 64, 128, 256]
+
+def is_oom(e):
+	message = str(e).lower()
+	return isinstance(e, RuntimeError) and ('out of memory' in message or "can't allocate memory" in message)
+
+def device_key(device):
+	import torch
+
+	if device == 'cuda':
+		return 'cuda:' + torch.cuda.get_device_name(0)
+	return 'cpu:{}t'.format(torch.get_num_threads())
+
+def profile_key(device, frame_shape, **settings):
+	"""e.g. 'cpu:8t|1080x1920|backend=eager,precision=fp32,static=False'"""
+	return '{}|{}x{}|{}'.format(device_key(device), frame_shape[0], frame_shape[1],
+								','.join('{}={}'.format(k, settings[k]) for k in sorted(settings)))
+
+def load_profile(path, key):
+	if not os.path.isfile(path):
+		return {}
+	try:
+		with open(path) as f:
+			return json.load(f).get(key, {})
+	except (OSError, ValueError):
+		return {}
+
+def save_profile(path, key, values):
+	"""Merges `values` into the profile entry of `key` (re-read right before writing)."""
+	profiles = {}
+	if os.path.isfile(path):
+		try:
+			with open(path) as f:
+				profiles = json.load(f)
+		except (OSError, ValueError):
+			pass
+	profiles.setdefault(key, {}).update(values)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp_path = '{}.tmp{}'.format(path, os.getpid())
+	with open(tmp_path, 'w') as f:
+		json.dump(profiles, f, indent=2)
+	os.replace(tmp_path, path)
+
+class BatchTuner(object):
+	"""
+	Batch size of one stage in one job: the profiled size, or tuned on the job's own
+	batches when there is none (tune=True). Callers ask next_size() before building
+	a batch and report its run time with record(), or shrink() after an OOM.
+	"""
+
+	def __init__(self, name, default, candidates, profile=None, tune=False):
+		profile = profile or {}
+		profiled = profile.get(name)
+		self.name = name
+		self.batch_size = profiled or default
+		# ms per item of the candidates measured so far (also by earlier jobs)
+		self.measured = {int(size): ms for size, ms in profile.get(name + '_ms', {}).items()}
+		self.tuning = tune and not profiled
+		self.pending = [size for size in candidates if size not in self.measured] if self.tuning else []
+		self.warmed_up = False
+		# Set once the job found a size worth saving to the profile
+		self.tuned = False
+		if self.tuning and not self.pending:
+			self._finish()
+
+	def next_size(self):
+		return self.pending[0] if self.pending else self.batch_size
+
+	def record(self, items, seconds):
+		if not self.warmed_up:
+			# First batch pays for lazy init / kernel selection
+			self.warmed_up = True
+			return
+		if self.pending and items == self.pending[0]:
+			self.measured[items] = seconds / items * 1000
+			self.pending.pop(0)
+			if not self.pending:
+				self._finish()
+
+	def shrink(self, size):
+		"""Out of memory at `size`: halves the size of the following batches."""
+		smaller = max(1, size // 2)
+		if self.pending:
+			# Tuning hit the memory ceiling
+			self.pending = []
+			self._finish(limit=smaller)
+		self.batch_size = min(self.batch_size, smaller)
+		self.tuned = True
+		print('Recovering from OOM error; new {}: {}'.format(self.name, self.batch_size))
+
+	def _finish(self, limit=None):
+		fits = {size: ms for size, ms in self.measured.items() if limit is None or size <= limit}
+		if not fits:
+			return
+		self.batch_size = min(fits, key=fits.get)
+		self.tuned = True
+		print('Autotuned {}: {} ({})'.format(self.name, self.batch_size,
+			', '.join('{}: {:.1f} ms/item'.format(size, ms) for size, ms in sorted(fits.items()))))
+
+	def profile_values(self):
+		"""Profile entries to save: the chosen size, and the measurements while tuning."""
+		values = {}
+		if self.tuned:
+			values[self.name] = self.batch_size
+		if self.tuning and self.measured:
+			values[self.name + '_ms'] = {str(size): round(ms, 3) for size, ms in sorted(self.measured.items())}
+		return values
@@ -0,0 +1,133 @@
+"""Exported inference backends for CPU-only nodes.
+
+A model is exported once per checkpoint (TorchScript or ONNX), cached under
+<export_dir>/<checkpoint sha256>/ (the hash itself is remembered per file size and
+mtime, see services/common/hashing.py) and loaded from there on later runs. Each fresh
+export is checked against the eager model; if the outputs differ by more than
+the tolerance, or the export/runtime is unavailable, the eager model is used.
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+
+# file hashing is shared with SadTalker (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common.hashing import checkpoint_hash
+
+BACKENDS = ['eager', 'torchscript', 'onnx']
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints', 'exported')
+
+# Max abs difference allowed between exported and eager outputs
+PARITY_TOLERANCE = 1e-3
+
+def set_threads(intra_op_threads=0, inter_op_threads=0):
+	"""Applies thread counts to torch (eager / TorchScript); 0 keeps the default."""
+	if intra_op_threads > 0:
+		torch.set_num_threads(intra_op_threads)
+	if inter_op_threads > 0:
+		try:
+			torch.set_num_interop_threads(inter_op_threads)
+		except RuntimeError:
+			# Can only be set before the first inter-op parallel work
+			pass
+
+class OrtModel(object):
+	"""ONNX Runtime session with the call signature of the eager module (tensors in, tensors out)."""
+
+	def __init__(self, path, intra_op_threads=0, inter_op_threads=0):
+		import onnxruntime as ort
+
+		options = ort.SessionOptions()
+		options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+		options.intra_op_num_threads = intra_op_threads
+		options.inter_op_num_threads = inter_op_threads
+		if inter_op_threads > 1:
+			options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+		self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+		self.input_names = [i.name for i in self.session.get_inputs()]
+
+	def __call__(self, *inputs):
+		feed = {name: x.detach().cpu().numpy().astype(np.float32)
+				for name, x in zip(self.input_names, inputs)}
+		outputs = [torch.from_numpy(o) for o in self.session.run(None, feed)]
+		return outputs[0] if len(outputs) == 1 else outputs
+
+def export_torchscript(model, example_inputs, path):
+	with torch.no_grad():
+		traced = torch.jit.trace(model, example_inputs, check_trace=False)
+		traced = torch.jit.freeze(traced)
+	torch.jit.save(traced, path)
+
+def export_onnx(model, example_inputs, path, input_names, output_names, dynamic_axes):
+	with torch.no_grad():
+		torch.onnx.export(model, example_inputs, path, input_names=input_names, output_names=output_names,
+						dynamic_axes=dynamic_axes, opset_version=17, dynamo=False)
+
+def max_abs_diff(expected, actual):
+	if isinstance(expected, torch.Tensor):
+		expected, actual = [expected], [actual]
+	return max(float((e.cpu() - a.cpu()).abs().max()) for e, a in zip(expected, actual))
+
+def load_backend(backend, model, example_inputs, name, checkpoint_path, input_names, output_names,
+				dynamic_axes, export_dir=None, intra_op_threads=0, inter_op_threads=0,
+				tolerance=PARITY_TOLERANCE):
+	"""
+	Returns a callable running `model` with the requested backend.
+
+	model: eager module in eval mode; example_inputs: tuple of tensors used for
+	tracing and the parity check; name: artifact name (e.g. 'wav2lip', 's3fd').
+	Falls back to the eager model on any export, runtime or parity failure.
+	"""
+	set_threads(intra_op_threads, inter_op_threads)
+	if backend == 'eager':
+		return model
+	if backend == 'onnx' and next(model.parameters()).is_cuda:
+		print('ONNX backend runs on CPU only; using eager {} on CUDA'.format(name))
+		return model
+
+	export_dir = export_dir or DEFAULT_EXPORT_DIR
+	cache_dir = os.path.join(export_dir, checkpoint_hash(checkpoint_path, export_dir))
+	path = os.path.join(cache_dir, name + ('.onnx' if backend == 'onnx' else '.ts'))
+	exported_now = not os.path.isfile(path)
+	# A fresh export is written and checked under a temporary name in the same
+	# directory and moved into place only once it passed, so concurrent jobs never
+	# load a partial or unchecked artifact
+	load_path = path + '.tmp{}'.format(os.getpid()) if exported_now else path
+	try:
+		if exported_now:
+			os.makedirs(cache_dir, exist_ok=True)
+			print('Exporting {} to {} ({})'.format(name, backend, path))
+			if backend == 'onnx':
+				export_onnx(model, example_inputs, load_path, input_names, output_names, dynamic_axes)
+			else:
+				export_torchscript(model, example_inputs, load_path)
+
+		if backend == 'onnx':
+			runner = OrtModel(load_path, intra_op_threads, inter_op_threads)
+		else:
+			runner = torch.jit.load(load_path, map_location=next(model.parameters()).device)
+
+		if exported_now:
+			with torch.no_grad():
+				diff = max_abs_diff(model(*example_inputs), runner(*example_inputs))
+			with open(load_path + '.json', 'w') as f:
+				json.dump({'backend': backend, 'max_abs_diff': diff, 'tolerance': tolerance}, f)
+			os.replace(load_path + '.json', path + '.json')
+			if diff > tolerance:
+				os.remove(load_path)
+				print('{} {} export differs from eager by {:.2e} (> {:.0e}); using eager'.format(
+					name, backend, diff, tolerance))
+				return model
+			os.replace(load_path, path)
+			print('{} {} parity OK (max abs diff {:.2e})'.format(name, backend, diff))
+	except Exception as e:
+		print('{} backend unavailable for {} ({}: {}); using eager'.format(backend, name, type(e).__name__, e))
+		if exported_now and os.path.isfile(load_path):
+			os.remove(load_path)
+		return model
+
+	print('Using {} backend for {}'.format(backend, name))
+	return runner
@@ -0,0 +1,205 @@
+"""Cross-job micro-batching server for the Wav2Lip forward.
+
+One process holds the model; the inference.py runs of concurrent lipsync jobs
+(--batch_server) send it their (mel, face) batches. Requests are merged into
+batches of up to --batch_size frames; a request waits at most --max_wait_ms for
+others to join before its batch runs, which bounds the latency added to a job
+running alone. Each job gets its rows of the prediction back and pastes and
+encodes them itself.
+
+Connections are authenticated with the key in WAV2LIP_BATCH_AUTHKEY.
+"""
+import argparse
+import collections
+import os
+import threading
+import time
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+import numpy as np
+
+AUTHKEY_ENV = 'WAV2LIP_BATCH_AUTHKEY'
+
+def parse_address(address):
+	host, port = address.rsplit(':', 1)
+	return host, int(port)
+
+def authkey():
+	return os.environ.get(AUTHKEY_ENV, '').encode()
+
+class Request(object):
+
+	def __init__(self, mel, face):
+		self.mel, self.face = mel, face
+		self.arrival = time.time()
+		self.done = threading.Event()
+		self.result, self.error = None, None
+
+class MicroBatcher(object):
+	"""
+	Merges forward requests (mel N x 1 x 80 x 16, face N x 6 x 96 x 96 float32) of
+	several jobs: a batch runs once its requests fill batch_size frames or the
+	oldest one has waited max_wait seconds. forward(mel, face) returns the
+	predictions as an array; requests larger than batch_size run alone.
+	"""
+
+	def __init__(self, forward, batch_size=128, max_wait=0.05):
+		self.forward = forward
+		self.batch_size = batch_size
+		self.max_wait = max_wait
+		self.pending = collections.deque()
+		self.condition = threading.Condition()
+
+	def submit(self, mel, face):
+		request = Request(mel, face)
+		with self.condition:
+			self.pending.append(request)
+			self.condition.notify()
+		return request
+
+	def predict(self, mel, face):
+		request = self.submit(mel, face)
+		request.done.wait()
+		if request.error is not None:
+			raise request.error
+		return request.result
+
+	def next_batch(self, timeout=None):
+		"""Requests of the next batch once it is due (empty after timeout seconds without requests)."""
+		give_up = None if timeout is None else time.time() + timeout
+		with self.condition:
+			while True:
+				if self.pending:
+					frames = sum(len(request.mel) for request in self.pending)
+					wait = self.pending[0].arrival + self.max_wait - time.time()
+					if frames >= self.batch_size or wait <= 0:
+						break
+				else:
+					wait = None if give_up is None else give_up - time.time()
+					if wait is not None and wait <= 0:
+						return []
+				self.condition.wait(wait)
+
+			batch = [self.pending.popleft()]
+			frames = len(batch[0].mel)
+			while self.pending and frames + len(self.pending[0].mel) <= self.batch_size:
+				batch.append(self.pending.popleft())
+				frames += len(batch[-1].mel)
+			return batch
+
+	def run_batch(self, batch):
+		try:
+			pred = self.forward(np.concatenate([request.mel for request in batch]),
+								np.concatenate([request.face for request in batch]))
+			splits = np.cumsum([len(request.mel) for request in batch])[:-1]
+			for request, rows in zip(batch, np.split(pred, splits)):
+				request.result = rows
+		except Exception as e:
+			for request in batch:
+				request.error = e
+		for request in batch:
+			request.done.set()
+
+	def run(self):
+		while True:
+			self.run_batch(self.next_batch())
+
+class BatchClient(object):
+	"""Connection of one inference.py run to the batch server."""
+
+	def __init__(self, address):
+		self.connection = Client(parse_address(address), authkey=authkey())
+
+	def predict(self, mel, face):
+		self.connection.send((np.ascontiguousarray(mel, dtype=np.float32), np.ascontiguousarray(face, dtype=np.float32)))
+		status, value = self.connection.recv()
+		if status != 'ok':
+			raise RuntimeError('Wav2Lip batch server: {}'.format(value))
+		return value
+
+	def close(self):
+		self.connection.close()
+
+def handle(batcher, connection):
+	with connection:
+		while True:
+			try:
+				mel, face = connection.recv()
+			except (EOFError, OSError):
+				return
+			try:
+				connection.send(('ok', batcher.predict(mel, face)))
+			except Exception as e:
+				connection.send(('error', '{}: {}'.format(type(e).__name__, e)))
+
+def serve(batcher, address):
+	listener = Listener(parse_address(address), authkey=authkey())
+	threading.Thread(target=batcher.run, daemon=True).start()
+	print('Wav2Lip batch server listening on {} (batch {} frames, max wait {:.0f} ms)'.format(
+		address, batcher.batch_size, batcher.max_wait * 1000))
+	while True:
+		try:
+			connection = listener.accept()
+		except (AuthenticationError, EOFError, OSError) as e:
+			print('Rejected batch server connection: {}'.format(e))
+			continue
+		threading.Thread(target=handle, args=(batcher, connection), daemon=True).start()
+
+def load_forward(opts):
+	"""forward(mel, face) of the Wav2Lip checkpoint with the requested backend and precision."""
+	import torch
+	import autotune, backends, precision
+	from models import Wav2Lip
+
+	device = 'cuda' if torch.cuda.is_available() else 'cpu'
+	model = Wav2Lip()
+	checkpoint = torch.load(opts.checkpoint_path, map_location=lambda storage, loc: storage)
+	model.load_state_dict({k.replace('module.', ''): v for k, v in checkpoint['state_dict'].items()})
+	model = model.to(device).eval()
+
+	mode = precision.resolve(opts.precision, device)
+	if mode == 'int8':
+		int8_path = precision.int8_cache_path(opts.checkpoint_path, 'wav2lip', opts.export_dir)
+		if os.path.isfile(int8_path):
+			model = precision.load_int8(model, int8_path)
+		else:
+			# calibration needs a job's own frames (see inference.py --precision int8)
+			print('No calibrated int8 Wav2Lip at {}; serving fp32'.format(int8_path))
+			mode = 'fp32'
+	if mode == 'fp32':
+		example = (torch.zeros(1, 1, 80, 16, device=device), torch.zeros(1, 6, 96, 96, device=device))
+		model = backends.load_backend(opts.backend, model, example, 'wav2lip', opts.checkpoint_path,
+									['mel', 'face'], ['pred'], {'mel': {0: 'batch'}, 'face': {0: 'batch'}, 'pred': {0: 'batch'}},
+									export_dir=opts.export_dir, intra_op_threads=opts.intra_op_threads,
+									inter_op_threads=opts.inter_op_threads)
+	else:
+		backends.set_threads(opts.intra_op_threads, opts.inter_op_threads)
+
+	def forward(mel, face):
+		try:
+			with torch.no_grad(), precision.autocast(mode, device):
+				pred = model(torch.from_numpy(mel).to(device), torch.from_numpy(face).to(device))
+			return pred.float().cpu().numpy()
+		except RuntimeError as e:
+			if not autotune.is_oom(e) or len(mel) == 1:
+				raise
+			half = len(mel) // 2
+			return np.concatenate([forward(mel[:half], face[:half]), forward(mel[half:], face[half:])])
+	return forward
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Wav2Lip micro-batching server shared by concurrent lipsync jobs')
+	parser.add_argument('--checkpoint_path', type=str, required=True, help='Wav2Lip checkpoint')
+	parser.add_argument('--address', type=str, default='127.0.0.1:9190', help='host:port to listen on')
+	parser.add_argument('--batch_size', type=int, default=128, help='Frames per Wav2Lip forward')
+	parser.add_argument('--max_wait_ms', type=float, default=50., help='Longest wait of a request for others to join its batch')
+	parser.add_argument('--backend', type=str, default='eager', help='eager, torchscript or onnx (see backends.py)')
+	parser.add_argument('--precision', type=str, default='fp32', help='fp32, bf16 or int8 (cached calibration only)')
+	parser.add_argument('--export_dir', type=str, default=None, help='Cache directory of exported models')
+	parser.add_argument('--intra_op_threads', type=int, default=0, help='Threads used inside one operator')
+	parser.add_argument('--inter_op_threads', type=int, default=0, help='Threads used across independent operators')
+	opts = parser.parse_args()
+	if not authkey():
+		parser.error('set {} to the key shared with the jobs'.format(AUTHKEY_ENV))
+
+	serve(MicroBatcher(load_forward(opts), opts.batch_size, opts.max_wait_ms / 1000.), opts.address)
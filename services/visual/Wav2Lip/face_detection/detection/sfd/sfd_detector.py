@@ -20,9 +20,12 @@ class SFDDetector(FaceDetector):
         # Initialise the face detector
         if not os.path.isfile(path_to_detector):
             model_weights = load_url(models_urls['s3fd'])
+            # Cached download, used to key exported copies of the net (see backends.py)
+            path_to_detector = os.path.join(torch.hub.get_dir(), 'checkpoints', os.path.basename(models_urls['s3fd']))
         else:
             model_weights = torch.load(path_to_detector)
 
+        self.weights_path = path_to_detector
         self.face_detector = s3fd()
         self.face_detector.load_state_dict(model_weights)
         self.face_detector.to(device)
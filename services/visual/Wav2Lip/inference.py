@@ -1,11 +1,16 @@
 from os import listdir, path
 import numpy as np
 import scipy, cv2, os, sys, argparse, audio
-import json, subprocess, random, string
+import json, subprocess, random, string, time, tempfile, shutil
+from contextlib import contextmanager, nullcontext
 from tqdm import tqdm
 from glob import glob
-import torch, face_detection
+import torch, face_detection, backends, precision, autotune, batch_server
 from models import Wav2Lip
+
+# pause detection is shared with SadTalker (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common.silence import silent_spans
 import platform
 
 parser = argparse.ArgumentParser(description='Inference code to lip-sync videos in the wild using Wav2Lip models')
@@ -49,6 +54,48 @@ parser.add_argument('--rotate', default=False, action='store_true',
 
 parser.add_argument('--nosmooth', default=False, action='store_true',
 					help='Prevent smoothing face detections over a short temporal window')
+parser.add_argument('--detect_every', type=int, default=1,
+					help='Run face detection on every K-th frame only and interpolate the boxes in between. '
+					'Spans where the face moves too much between keyframes are detected frame by frame')
+parser.add_argument('--detect_scale', type=float, default=1.,
+					help='Downscale keyframes by this factor for detection (with --detect_every > 1)')
+
+parser.add_argument('--skip_silence', default=False, action='store_true',
+					help='Copy the input frames through pauses in the audio instead of generating them')
+parser.add_argument('--silence_db', type=float, default=-40.,
+					help='Audio below the loud parts by this many dB counts as silence (with --skip_silence)')
+parser.add_argument('--min_silence', type=float, default=0.5,
+					help='Shortest pause in seconds that is copied from the input (with --skip_silence)')
+
+parser.add_argument('--timings_path', type=str, default=None,
+					help='Write a JSON breakdown of per-stage timings to this file')
+parser.add_argument('--profile_dir', type=str, default=None,
+					help='Capture a torch.profiler Chrome trace of the inference loop into this directory')
+
+parser.add_argument('--backend', type=str, choices=backends.BACKENDS, default='eager',
+					help='Run Wav2Lip and S3FD eagerly or through a cached TorchScript / ONNX Runtime export')
+parser.add_argument('--export_dir', type=str, default=None,
+					help='Cache directory of exported models (default: checkpoints/exported)')
+parser.add_argument('--intra_op_threads', type=int, default=0,
+					help='Threads used inside one operator (0 = runtime default)')
+parser.add_argument('--inter_op_threads', type=int, default=0,
+					help='Threads used to run independent operators in parallel (0 = runtime default)')
+
+parser.add_argument('--precision', type=str, choices=precision.PRECISIONS, default='fp32',
+					help='Wav2Lip precision: fp32, bf16 autocast (CPUs with bf16 support) or int8 quantized. '
+					'Non-fp32 precisions run the eager model')
+parser.add_argument('--calibration_batches', type=int, default=1,
+					help='Batches of this job used to calibrate int8 when no cached int8 model exists')
+
+parser.add_argument('--batch_server', type=str, default=None,
+					help='host:port of a batch_server.py shared by concurrent jobs: Wav2Lip runs there, batched with '
+					'the frames of other jobs (its own backend/precision apply); --wav2lip_batch_size frames per request '
+					'should be the server batch divided by the concurrent jobs. Runs locally if it is unreachable')
+
+parser.add_argument('--autotune', default=False, action='store_true',
+					help='Use the batch sizes profiled for this device and resolution; tune and save them on first use')
+parser.add_argument('--autotune_profile', type=str, default=autotune.DEFAULT_PROFILE_PATH,
+					help='Batch size profile file (default: checkpoints/batch_profiles.json)')
 
 args = parser.parse_args()
 args.img_size = 96
@@ -56,6 +103,27 @@ args.img_size = 96
 if os.path.isfile(args.face) and args.face.split('.')[1] in ['jpg', 'png', 'jpeg']:
 	args.static = True
 
+# Accumulated seconds per stage, written to --timings_path
+timings = {}
+# 'face_det_batch_size' / 'face_det_keyframe_batch_size' / 'wav2lip_batch_size' -> autotune.BatchTuner, set up in main
+batch_tuners = {}
+
+@contextmanager
+def timed(stage):
+	start = time.time()
+	try:
+		yield
+	finally:
+		timings[stage] = timings.get(stage, 0.) + time.time() - start
+
+def profile_inference():
+	if not args.profile_dir:
+		return nullcontext()
+	activities = [torch.profiler.ProfilerActivity.CPU]
+	if device == 'cuda':
+		activities.append(torch.profiler.ProfilerActivity.CUDA)
+	return torch.profiler.profile(activities=activities, record_shapes=True)
+
 def get_smoothened_boxes(boxes, T):
 	for i in range(len(boxes)):
 		if i + T > len(boxes):
@@ -65,24 +133,97 @@ def get_smoothened_boxes(boxes, T):
 		boxes[i] = np.mean(window, axis=0)
 	return boxes
 
+# Keyframe boxes overlapping less than this are not interpolated (tracking lost)
+TRACK_MIN_IOU = 0.6
+
+def box_iou(a, b):
+	x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+	x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+	inter = max(0, x2 - x1) * max(0, y2 - y1)
+	union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+	return inter / union if union > 0 else 0.
+
+def detect_boxes(detector, images, tuner_name='face_det_batch_size'):
+	"""S3FD on `images` in batches autotuned by batch_tuners[tuner_name]; one (x1, y1, x2, y2) or None per image."""
+	tuner = batch_tuners[tuner_name]
+	predictions = []
+	with tqdm(total=len(images), desc='Face Detection:') as progress:
+		while len(predictions) < len(images):
+			batch = np.array(images[len(predictions):len(predictions) + tuner.next_size()])
+			start = time.time()
+			try:
+				detections = detector.get_detections_for_batch(batch)
+			except RuntimeError as e:
+				if not autotune.is_oom(e):
+					raise
+				if len(batch) == 1: 
+					raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
+				# Retry this batch smaller; earlier batches are kept
+				tuner.shrink(len(batch))
+				continue
+			tuner.record(len(batch), time.time() - start)
+			predictions.extend(detections)
+			progress.update(len(batch))
+	return predictions
+
+def track_boxes(detector, images):
+	"""
+	Detects faces on (downscaled) keyframes every args.detect_every frames and moves
+	the box at constant velocity between them. Spans whose keyframe boxes overlap
+	less than TRACK_MIN_IOU, or lack a face, are detected at full resolution.
+	"""
+	keys = list(range(0, len(images), args.detect_every))
+	if keys[-1] != len(images) - 1:
+		keys.append(len(images) - 1)
+	scale = args.detect_scale
+	if scale < 1:
+		keyframes = [cv2.resize(images[i], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) for i in keys]
+	else:
+		keyframes = [images[i] for i in keys]
+
+	boxes = [None] * len(images)
+	# Downscaled keyframes are timed apart from the full-resolution detections
+	keyframe_tuner = 'face_det_keyframe_batch_size' if scale < 1 else 'face_det_batch_size'
+	for i, rect in zip(keys, detect_boxes(detector, keyframes, keyframe_tuner)):
+		if rect is not None:
+			boxes[i] = np.array(rect, dtype=np.float64) / min(scale, 1.)
+		elif scale < 1:
+			# Face too small once downscaled
+			rect = detect_boxes(detector, [images[i]])[0]
+			boxes[i] = None if rect is None else np.array(rect, dtype=np.float64)
+
+	lost = []
+	for a, b in zip(keys, keys[1:]):
+		if boxes[a] is None or boxes[b] is None or box_iou(boxes[a], boxes[b]) < TRACK_MIN_IOU:
+			lost.extend(range(a + 1, b))
+			continue
+		for i in range(a + 1, b):
+			t = (i - a) / float(b - a)
+			boxes[i] = (1 - t) * boxes[a] + t * boxes[b]
+	if lost:
+		print('Face tracking lost on {} of {} frames; detecting them at full resolution'.format(len(lost), len(images)))
+		for i, rect in zip(lost, detect_boxes(detector, [images[i] for i in lost])):
+			boxes[i] = rect
+
+	print('Face detection ran on {} of {} frames'.format(len(keys) + len(lost), len(images)))
+	return [None if box is None else tuple(int(round(v)) for v in box) for box in boxes]
+
 def face_detect(images):
 	detector = face_detection.FaceAlignment(face_detection.LandmarksType._2D, 
 											flip_input=False, device=device)
-
-	batch_size = args.face_det_batch_size
-	
-	while 1:
-		predictions = []
-		try:
-			for i in tqdm(range(0, len(images), batch_size)):
-				predictions.extend(detector.get_detections_for_batch(np.array(images[i:i + batch_size])))
-		except RuntimeError:
-			if batch_size == 1: 
-				raise RuntimeError('Image too big to run face detection on GPU. Please use the --resize_factor argument')
-			batch_size //= 2
-			print('Recovering from OOM error; New batch size: {}'.format(batch_size))
-			continue
-		break
+	if args.backend != 'eager':
+		sfd = detector.face_detector
+		# Same preprocessing as sfd.detect.batch_detect, on the first frame
+		example = (np.array(images[:1])[..., ::-1] - np.array([104, 117, 123])).transpose(0, 3, 1, 2)
+		example = torch.from_numpy(example.copy()).float().to(device)
+		sfd.face_detector = load_backend('s3fd', sfd.face_detector, (example,), sfd.weights_path,
+										['image'], ['{}{}'.format(kind, i) for i in range(1, 7) for kind in ('cls', 'reg')],
+										{'image': {0: 'batch', 2: 'height', 3: 'width'}})
+
+	if args.detect_every > 1 and len(images) > 2:
+		predictions = track_boxes(detector, images)
+	else:
+		predictions = detect_boxes(detector, images)
 
 	results = []
 	pady1, pady2, padx1, padx2 = args.pads
@@ -105,20 +246,24 @@ def face_detect(images):
 	del detector
 	return results 
 
-def datagen(frames, mels):
-	img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+def datagen(frames, mels, silent):
+	"""Batches of the frames to generate, with their indices; frames where silent is set are left out."""
+	img_batch, mel_batch, frame_batch, coords_batch, index_batch = [], [], [], [], []
 
 	if args.box[0] == -1:
-		if not args.static:
-			face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
-		else:
-			face_det_results = face_detect([frames[0]])
+		with timed('face_detect'):
+			if not args.static:
+				face_det_results = face_detect(frames) # BGR2RGB for CNN face detection
+			else:
+				face_det_results = face_detect([frames[0]])
 	else:
 		print('Using the specified bounding box instead of face detection...')
 		y1, y2, x1, x2 = args.box
 		face_det_results = [[f[y1: y2, x1:x2], (y1, y2, x1, x2)] for f in frames]
 
 	for i, m in enumerate(mels):
+		if silent[i]:
+			continue
 		idx = 0 if args.static else i%len(frames)
 		frame_to_save = frames[idx].copy()
 		face, coords = face_det_results[idx].copy()
@@ -129,8 +274,9 @@ def datagen(frames, mels):
 		mel_batch.append(m)
 		frame_batch.append(frame_to_save)
 		coords_batch.append(coords)
+		index_batch.append(i)
 
-		if len(img_batch) >= args.wav2lip_batch_size:
+		if len(img_batch) >= batch_tuners['wav2lip_batch_size'].next_size():
 			img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
 
 			img_masked = img_batch.copy()
@@ -139,8 +285,8 @@ def datagen(frames, mels):
 			img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
 			mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
 
-			yield img_batch, mel_batch, frame_batch, coords_batch
-			img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+			yield img_batch, mel_batch, frame_batch, coords_batch, index_batch
+			img_batch, mel_batch, frame_batch, coords_batch, index_batch = [], [], [], [], []
 
 	if len(img_batch) > 0:
 		img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
@@ -151,7 +297,7 @@ def datagen(frames, mels):
 		img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.
 		mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
 
-		yield img_batch, mel_batch, frame_batch, coords_batch
+		yield img_batch, mel_batch, frame_batch, coords_batch, index_batch
 
 mel_step_size = 16
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
@@ -178,7 +324,67 @@ def load_model(path):
 	model = model.to(device)
 	return model.eval()
 
+def load_backend(name, model, example_inputs, checkpoint_path, input_names, output_names, dynamic_axes):
+	return backends.load_backend(args.backend, model, example_inputs, name, checkpoint_path,
+								input_names, output_names, dynamic_axes, export_dir=args.export_dir,
+								intra_op_threads=args.intra_op_threads, inter_op_threads=args.inter_op_threads)
+
+def load_wav2lip(mel_batch, img_batch):
+	"""
+	Wav2Lip with the requested precision / backend.
+	Returns (model, calibrating); a calibrating int8 model still runs in float
+	and records activation ranges until finish_calibration.
+	"""
+	model = load_model(args.checkpoint_path)
+	if args.precision == 'int8':
+		backends.set_threads(args.intra_op_threads, args.inter_op_threads)
+		int8_path = precision.int8_cache_path(args.checkpoint_path, 'wav2lip', args.export_dir)
+		if os.path.isfile(int8_path):
+			print('Loading int8 Wav2Lip from {}'.format(int8_path))
+			return precision.load_int8(model, int8_path), False
+		print('Calibrating int8 Wav2Lip on {} batch(es) of this job'.format(args.calibration_batches))
+		return precision.prepare_int8(model), True
+	if args.precision == 'bf16' or args.static:
+		# Static faces run eagerly so the face encoder output can be reused
+		backends.set_threads(args.intra_op_threads, args.inter_op_threads)
+		return model, False
+	return load_backend('wav2lip', model, (mel_batch[:1], img_batch[:1]), args.checkpoint_path,
+						['mel', 'face'], ['pred'], {'mel': {0: 'batch'}, 'face': {0: 'batch'}, 'pred': {0: 'batch'}}), False
+
+def connect_batch_server():
+	"""Client of --batch_server, or None to load the model in this process."""
+	if not args.batch_server:
+		return None
+	try:
+		client = batch_server.BatchClient(args.batch_server)
+	except (OSError, EOFError, batch_server.AuthenticationError) as e:
+		print('Batch server {} unavailable ({}); running Wav2Lip locally'.format(args.batch_server, e))
+		return None
+	print('Running Wav2Lip on batch server {}'.format(args.batch_server))
+	return client
+
+def finish_calibration(model, batches):
+	precision.convert_int8(model)
+	int8_path = precision.int8_cache_path(args.checkpoint_path, 'wav2lip', args.export_dir)
+	precision.save_int8(model, int8_path, {'face': args.face, 'audio': args.audio, 'batches': batches})
+	print('int8 Wav2Lip calibrated and saved to {}'.format(int8_path))
+
 def main():
+	# Per-run scratch files, so concurrent jobs sharing a working directory do not collide
+	work_dir = tempfile.mkdtemp(prefix='wav2lip_')
+	try:
+		lipsync(work_dir)
+	finally:
+		shutil.rmtree(work_dir, ignore_errors=True)
+
+def lipsync(work_dir):
+	main_start = time.time()
+	args.precision = precision.resolve(args.precision, device)
+	if (args.precision != 'fp32' or args.static) and args.backend != 'eager':
+		print('{} runs Wav2Lip eagerly; --backend {} only applies to face detection'.format(
+			'Static face input' if args.static else '--precision ' + args.precision, args.backend))
+
+	decode_start = time.time()
 	if not os.path.isfile(args.face):
 		raise ValueError('--face argument must be a valid path to video/image file')
 
@@ -216,10 +422,11 @@ def main():
 
 	if not args.audio.endswith('.wav'):
 		print('Extracting raw audio...')
-		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, 'temp/temp.wav')
+		wav_path = os.path.join(work_dir, 'temp.wav')
+		command = 'ffmpeg -y -i {} -strict -2 {}'.format(args.audio, wav_path)
 
 		subprocess.call(command, shell=True)
-		args.audio = 'temp/temp.wav'
+		args.audio = wav_path
 
 	wav = audio.load_wav(args.audio, 16000)
 	mel = audio.melspectrogram(wav)
@@ -228,6 +435,69 @@ def main():
 	if np.isnan(mel.reshape(-1)).sum() > 0:
 		raise ValueError('Mel contains nan! Using a TTS voice? Add a small epsilon noise to the wav file and try again')
 
+	mel_chunks = get_mel_chunks(mel, fps)
+
+	print("Length of mel chunks: {}".format(len(mel_chunks)))
+
+	silent = np.zeros(len(mel_chunks), dtype=bool)
+	if args.skip_silence:
+		# Frame i's mel chunk covers the audio from i/fps on for mel_step_size mel frames
+		for start, end in silent_spans(wav, 16000, fps, len(mel_chunks), window=mel_step_size / 80.,
+												threshold_db=args.silence_db, min_silence=args.min_silence):
+			silent[start:end] = True
+		print('Copying {} of {} frames in pauses from the input'.format(silent.sum(), len(mel_chunks)))
+	timings['decode'] = time.time() - decode_start
+
+	full_frames = full_frames[:len(mel_chunks)]
+
+	setup_batch_tuners(full_frames[0].shape[:2])
+	gen = datagen(full_frames.copy(), mel_chunks, silent)
+	avi_path = os.path.join(work_dir, 'result.avi')
+
+	profiler_ctx = profile_inference()
+	with profiler_ctx as profiler:
+		run_inference(gen, full_frames, mel_chunks, fps, avi_path)
+	save_batch_profile(full_frames[0].shape[:2])
+
+	if profiler is not None:
+		os.makedirs(args.profile_dir, exist_ok=True)
+		trace_path = os.path.join(args.profile_dir, 'lipsync_trace.json')
+		profiler.export_chrome_trace(trace_path)
+		print('Profiler trace saved to {}'.format(trace_path))
+
+	with timed('mux'):
+		command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, avi_path, args.outfile)
+		subprocess.call(command, shell=platform.system() != 'Windows')
+
+	if args.timings_path:
+		with open(args.timings_path, 'w') as f:
+			json.dump({'frames': len(mel_chunks), 'total': time.time() - main_start, 'stages': timings}, f)
+
+def batch_profile_key(frame_shape):
+	return autotune.profile_key(device, frame_shape, backend=args.backend, precision=args.precision,
+								static=args.static, detect_scale=args.detect_scale)
+
+def setup_batch_tuners(frame_shape):
+	profile = autotune.load_profile(args.autotune_profile, batch_profile_key(frame_shape)) if args.autotune else {}
+	if profile:
+		print('Using profiled batch sizes: {}'.format(profile))
+	batch_tuners['face_det_batch_size'] = autotune.BatchTuner('face_det_batch_size', args.face_det_batch_size,
+															autotune.DETECTION_CANDIDATES, profile, tune=args.autotune)
+	batch_tuners['face_det_keyframe_batch_size'] = autotune.BatchTuner('face_det_keyframe_batch_size', args.face_det_batch_size,
+															autotune.DETECTION_CANDIDATES, profile, tune=args.autotune)
+	batch_tuners['wav2lip_batch_size'] = autotune.BatchTuner('wav2lip_batch_size', args.wav2lip_batch_size,
+															autotune.GENERATION_CANDIDATES, profile,
+															tune=args.autotune and not args.batch_server)
+
+def save_batch_profile(frame_shape):
+	values = {}
+	for tuner in batch_tuners.values():
+		values.update(tuner.profile_values())
+	if args.autotune and values:
+		autotune.save_profile(args.autotune_profile, batch_profile_key(frame_shape), values)
+		print('Saved batch profile {} to {}'.format(values, args.autotune_profile))
+
+def get_mel_chunks(mel, fps):
 	mel_chunks = []
 	mel_idx_multiplier = 80./fps 
 	i = 0
@@ -238,62 +508,126 @@ def main():
 			break
 		mel_chunks.append(mel[:, start_idx : start_idx + mel_step_size])
 		i += 1
+	return mel_chunks
 
-	print("Length of mel chunks: {}".format(len(mel_chunks)))
-
-	full_frames = full_frames[:len(mel_chunks)]
-
-	batch_size = args.wav2lip_batch_size
-	gen = datagen(full_frames.copy(), mel_chunks)
-
-	for i, (img_batch, mel_batch, frames, coords) in enumerate(tqdm(gen, 
-											total=int(np.ceil(float(len(mel_chunks))/batch_size)))):
-		if i == 0:
-			model = load_model(args.checkpoint_path)
-			print ("Model loaded")
-
-			frame_h, frame_w = full_frames[0].shape[:-1]
-			out = cv2.VideoWriter('temp/result.avi', 
-									cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
-
-		img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
-		mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
-
-		with torch.no_grad():
-			pred = model(mel_batch, img_batch)
-
-		pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.
+def blend_face(p, f, c):
+	y1, y2, x1, x2 = c
+	# Resize generated face patch to match the ROI dimensions
+	p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
+	
+	# --- Alpha Blending / Feathering ---
+	# Goal: Remove the hard "cut-out" edge around the generated lips.
+	# Method: Create a transparency mask, blur it (feathering), and alpha-blend 
+	# the generated lip region (p) with the original face (roi).
+	
+	# Create a soft mask (white) matching resized p's dimensions
+	mask = np.full((p.shape[0], p.shape[1]), 255, dtype=np.float32)
+	# Blur the mask to feather edges (Kernel: 51x51, Sigma: 16)
+	mask = cv2.GaussianBlur(mask, (51, 51), 16) / 255.0
+	mask = np.dstack([mask, mask, mask]) # Make it 3-channel
+
+	# Region of interest from original frame
+	roi = f[y1:y2, x1:x2].astype(np.float32)
+	p_float = p.astype(np.float32)
+
+	# Linear blend: Output = (Generated * Mask) + (Original * (1 - Mask))
+	blended = (p_float * mask + roi * (1 - mask)).astype(np.uint8)
+
+	f[y1:y2, x1:x2] = blended
+	return f
+
+def predict(model, mel_batch, img_batch, face_feats):
+	"""Wav2Lip forward; on OOM the batch is run in halves and later batches shrink."""
+	try:
+		if face_feats is not None:
+			return model.decode(mel_batch, face_feats)
+		return model(mel_batch, img_batch)
+	except RuntimeError as e:
+		if not autotune.is_oom(e) or len(mel_batch) == 1:
+			raise
+		batch_tuners['wav2lip_batch_size'].shrink(len(mel_batch))
+		half = len(mel_batch) // 2
+		if face_feats is not None:
+			return torch.cat([predict(model, mel_batch[:half], img_batch, face_feats),
+							predict(model, mel_batch[half:], img_batch, face_feats)])
+		return torch.cat([predict(model, mel_batch[:half], img_batch[:half], None),
+						predict(model, mel_batch[half:], img_batch[half:], None)])
+
+def write_input_frames(out, full_frames, start, end):
+	"""Frames start..end-1 as they are in the input (pauses skipped by datagen)."""
+	with timed('encode'):
+		for i in range(start, end):
+			out.write(full_frames[0 if args.static else i % len(full_frames)])
+
+def run_inference(gen, full_frames, mel_chunks, fps, avi_path):
+	progress = tqdm(total=len(mel_chunks), desc='Wav2Lip Inference:')
+	frame_h, frame_w = full_frames[0].shape[:-1]
+	out = cv2.VideoWriter(avi_path, 
+							cv2.VideoWriter_fourcc(*'DIVX'), fps, (frame_w, frame_h))
+	face_feats = None
+	calibrating = False
+	written = 0
+	server = connect_batch_server()
+	for i, (img_batch, mel_batch, frames, coords, indices) in enumerate(gen):
+		if server is not None:
+			# Batched with other jobs' frames; the mixed batches are not tuned per job
+			with timed('render'):
+				pred = server.predict(np.transpose(mel_batch, (0, 3, 1, 2)), np.transpose(img_batch, (0, 3, 1, 2)))
+				pred = pred.transpose(0, 2, 3, 1) * 255.
+		else:
+			with timed('render'):
+				if args.static:
+					# datagen repeats the same face per frame; only the first one is encoded
+					img_batch = img_batch[:1]
+				img_batch = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
+				mel_batch = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+
+			if i == 0:
+				with timed('model_load'):
+					model, calibrating = load_wav2lip(mel_batch, img_batch)
+				print ("Model loaded")
+
+			with timed('render'):
+				forward_start = time.time()
+				with torch.no_grad(), precision.autocast(args.precision, device):
+					if args.static and i == 0:
+						# Every frame shows the same face: encode it once, then only
+						# run the audio encoder and decoder per frame
+						face_feats = model.encode_face(img_batch[:1])
+					pred = predict(model, mel_batch, img_batch, face_feats)
+
+				pred = pred.float().cpu().numpy().transpose(0, 2, 3, 1) * 255.
+				if not calibrating:
+					batch_tuners['wav2lip_batch_size'].record(len(pred), time.time() - forward_start)
+
+			if calibrating and i + 1 == args.calibration_batches:
+				with timed('model_load'):
+					finish_calibration(model, i + 1)
+				calibrating = False
 		
-		for p, f, c in zip(pred, frames, coords):
-			y1, y2, x1, x2 = c
-			# Resize generated face patch to match the ROI dimensions
-			p = cv2.resize(p.astype(np.uint8), (x2 - x1, y2 - y1))
-			
-			# --- Alpha Blending / Feathering ---
-			# Goal: Remove the hard "cut-out" edge around the generated lips.
-			# Method: Create a transparency mask, blur it (feathering), and alpha-blend 
-			# the generated lip region (p) with the original face (roi).
-			
-			# Create a soft mask (white) matching resized p's dimensions
-			mask = np.full((p.shape[0], p.shape[1]), 255, dtype=np.float32)
-			# Blur the mask to feather edges (Kernel: 51x51, Sigma: 16)
-			mask = cv2.GaussianBlur(mask, (51, 51), 16) / 255.0
-			mask = np.dstack([mask, mask, mask]) # Make it 3-channel
-
-			# Region of interest from original frame
-			roi = f[y1:y2, x1:x2].astype(np.float32)
-			p_float = p.astype(np.float32)
-
-			# Linear blend: Output = (Generated * Mask) + (Original * (1 - Mask))
-			blended = (p_float * mask + roi * (1 - mask)).astype(np.uint8)
-
-			f[y1:y2, x1:x2] = blended
-			out.write(f)
-
+		paste_start, encode_before = time.time(), timings.get('encode', 0.)
+		done = written
+		for p, f, c, idx in zip(pred, frames, coords, indices):
+			write_input_frames(out, full_frames, written, idx)
+			f = blend_face(p, f, c)
+			with timed('encode'):
+				out.write(f)
+			written = idx + 1
+		# Blending time only; frame writes are accounted as 'encode'
+		paste_time = time.time() - paste_start - (timings['encode'] - encode_before)
+		timings['paste'] = timings.get('paste', 0.) + paste_time
+		progress.update(written - done)
+
+	write_input_frames(out, full_frames, written, len(mel_chunks))
+	progress.update(len(mel_chunks) - written)
+	progress.close()
+	if server is not None:
+		server.close()
+	if calibrating:
+		# Fewer batches than --calibration_batches in this job
+		with timed('model_load'):
+			finish_calibration(model, i + 1)
 	out.release()
 
-	command = 'ffmpeg -y -i {} -i {} -strict -2 -q:v 1 {}'.format(args.audio, 'temp/result.avi', args.outfile)
-	subprocess.call(command, shell=platform.system() != 'Windows')
-
 if __name__ == '__main__':
 	main()
@@ -93,36 +93,46 @@ class Wav2Lip(nn.Module):
             audio_sequences = torch.cat([audio_sequences[:, i] for i in range(audio_sequences.size(1))], dim=0)
             face_sequences = torch.cat([face_sequences[:, :, i] for i in range(face_sequences.size(2))], dim=0)
 
-        audio_embedding = self.audio_encoder(audio_sequences) # B, 512, 1, 1
+        x = self.decode(audio_sequences, self.encode_face(face_sequences))
+
+        if input_dim_size > 4:
+            x = torch.split(x, B, dim=0) # [(B, C, H, W)]
+            outputs = torch.stack(x, dim=2) # (B, C, T, H, W)
 
+        else:
+            outputs = x
+            
+        return outputs
+
+    def encode_face(self, face_sequences):
+        # face_sequences = (B, 6, 96, 96); returns the skip-connection features
         feats = []
         x = face_sequences
         for f in self.face_encoder_blocks:
             x = f(x)
             feats.append(x)
+        return feats
+
+    def decode(self, audio_sequences, feats):
+        # audio_sequences = (B, 1, 80, 16); feats from encode_face, either per
+        # sample or a single face (batch 1) broadcast over the whole batch
+        audio_embedding = self.audio_encoder(audio_sequences) # B, 512, 1, 1
+        feats = list(feats)
 
         x = audio_embedding
         for f in self.face_decoder_blocks:
             x = f(x)
+            skip = feats.pop()
+            if skip.size(0) != x.size(0):
+                skip = skip.expand(x.size(0), -1, -1, -1)
             try:
-                x = torch.cat((x, feats[-1]), dim=1)
+                x = torch.cat((x, skip), dim=1)
             except Exception as e:
                 print(x.size())
-                print(feats[-1].size())
+                print(skip.size())
                 raise e
-            
-            feats.pop()
-
-        x = self.output_block(x)
 
-        if input_dim_size > 4:
-            x = torch.split(x, B, dim=0) # [(B, C, H, W)]
-            outputs = torch.stack(x, dim=2) # (B, C, T, H, W)
-
-        else:
-            outputs = x
-            
-        return outputs
+        return self.output_block(x)
 
 class Wav2Lip_disc_qual(nn.Module):
     def __init__(self):
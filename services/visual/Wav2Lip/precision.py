@@ -0,0 +1,20 @@
+"""Reduced-precision inference on CPU: bf16 autocast and int8 static quantization
+(implemented in services/common/precision.py).
+
+The calibrated int8 Wav2Lip is cached next to the TorchScript/ONNX exports, keyed by
+checkpoint hash, so calibration only runs for the first job of a checkpoint.
+"""
+import os
+import sys
+
+from backends import DEFAULT_EXPORT_DIR
+
+# bf16 / int8 helpers and file hashing are shared with SadTalker (services/common)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from common.hashing import checkpoint_hash
+from common.precision import (PRECISIONS, resolve, autocast, prepare_int8, convert_int8,  # noqa: F401
+							save_int8, load_int8)
+
+def int8_cache_path(checkpoint_path, name, cache_dir=None):
+	cache_dir = cache_dir or DEFAULT_EXPORT_DIR
+	return os.path.join(cache_dir, checkpoint_hash(checkpoint_path, cache_dir), name + '.int8.pt')
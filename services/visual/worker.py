@@ -5,6 +5,8 @@ import json
 import logging
 import redis
 import torch
+import atexit
+import secrets
 import subprocess
 
 # Configure logging
@@ -16,20 +18,91 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../o
 
 try:
     from queue_manager import RedisQueue
+    from job_progress import ProgressReporter, run_with_progress, read_timings, JobCancelled
+    import metrics
+    import forkserver
+    import config
 except ImportError:
     logger.error("Could not import queue_manager. Make sure the 'orchestrator' directory is adjacent to 'services'.")
     sys.exit(1)
 
 # Placeholder for Wav2Lip model loading
 model = None
+# GFPGAN restorer, created once per process (see load_restorer)
+restorer = None
+GFPGAN_MODEL_URL = 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth'
+GFPGAN_MODEL_PATH = os.path.join(os.path.dirname(__file__), "gfpgan_weights.pth")
+WAV2LIP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "Wav2Lip"))
+# host:port of the shared Wav2Lip batch server, when this worker started one (see start_batch_server)
+batch_server_address = None
 
-def load_model():
-    global model
-    # Select device
+def select_device():
     if os.getenv("FORCE_CPU", "0") == "1":
-        device = "cpu"
-    else:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        return "cpu"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def load_restorer(device=None):
+    """
+    Returns the GFPGAN restorer, downloading the weights on first use.
+    Raises ImportError if gfpgan is not installed.
+    """
+    global restorer
+    if restorer is None:
+        from gfpgan import GFPGANer
+        
+        if not os.path.exists(GFPGAN_MODEL_PATH):
+            logger.info("Downloading GFPGAN weights...")
+            import requests
+            r = requests.get(GFPGAN_MODEL_URL, allow_redirects=True)
+            with open(GFPGAN_MODEL_PATH, 'wb') as f:
+                f.write(r.content)
+        
+        restorer = GFPGANer(model_path=GFPGAN_MODEL_PATH, upscale=1, arch='clean', channel_multiplier=2,
+                            bg_upsampler=None, device=torch.device(device or select_device()))
+    return restorer
+
+def wav2lip_checkpoint():
+    checkpoint_path = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip_gan.pth")
+    if not os.path.exists(checkpoint_path):
+        # Fallback to standard if GAN not found (though we downloaded GAN)
+        checkpoint_path = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip.pth")
+    return checkpoint_path
+
+def wav2lip_env():
+    env = os.environ.copy()
+    if os.getenv("FORCE_CPU", "0") == "1":
+        env["CUDA_VISIBLE_DEVICES"] = "" # Hide GPU from subprocess
+    return env
+
+def start_batch_server():
+    """
+    Starts the Wav2Lip micro-batching server shared by the jobs of this worker's
+    children (visual.batch_server). The key authenticating the jobs is passed on
+    through the environment they inherit.
+    """
+    global batch_server_address
+    port, batch_size, max_wait_ms = config.visual_batch_server_options()
+    os.environ.setdefault("WAV2LIP_BATCH_AUTHKEY", secrets.token_hex(16))
+    intra_op_threads, inter_op_threads = config.visual_threads()
+    batch_server_address = f"127.0.0.1:{port}"
+    cmd = [
+        sys.executable, "batch_server.py",
+        "--checkpoint_path", wav2lip_checkpoint(),
+        "--address", batch_server_address,
+        "--batch_size", str(batch_size),
+        "--max_wait_ms", str(max_wait_ms),
+        "--backend", config.visual_backend(),
+        "--precision", config.visual_precision(),
+        "--intra_op_threads", str(intra_op_threads),
+        "--inter_op_threads", str(inter_op_threads),
+    ]
+    logger.info(f"Starting Wav2Lip batch server on {batch_server_address}")
+    server = subprocess.Popen(cmd, cwd=WAV2LIP_DIR, env=wav2lip_env())
+    atexit.register(server.terminate)
+
+def load_model(device=None):
+    global model
+    device = device or select_device()
         
     logger.info(f"Loading Visual Service (Wav2Lip) on {device}...")
     
@@ -65,20 +138,19 @@ def process_job(queue: RedisQueue, job_id: str):
         # Check if output_path is provided (Pipeline mode) or generate default
         if payload.get("output_path"):
             output_path = payload.get("output_path")
+            job_dir = os.path.dirname(output_path)
             # Ensure dir exists for custom path
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
         else:
             output_path = os.path.join(output_dir, f"{job_id}.mp4")
+            job_dir = os.path.join(output_dir, job_id)
         
         result_path = os.path.abspath(output_path)
+        timings_path = os.path.splitext(result_path)[0] + "_timings.json"
         
         # Paths for Wav2Lip
-        wav2lip_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "Wav2Lip"))
-        checkpoint_path = os.path.join(wav2lip_dir, "checkpoints", "wav2lip_gan.pth")
-        
-        if not os.path.exists(checkpoint_path):
-             # Fallback to standard if GAN not found (though we downloaded GAN)
-             checkpoint_path = os.path.join(wav2lip_dir, "checkpoints", "wav2lip.pth")
+        wav2lip_dir = WAV2LIP_DIR
+        checkpoint_path = wav2lip_checkpoint()
         
         # Construct command
         # python inference.py --checkpoint_path <ckpt> --face <video> --audio <audio> --outfile <out>
@@ -91,111 +163,142 @@ def process_job(queue: RedisQueue, job_id: str):
             "--audio", audio_path,
             "--outfile", result_path,
             "--resize_factor", "1",
-            "--nosmooth"
+            "--nosmooth",
+            "--timings_path", timings_path
         ]
+        if payload.get("profile"):
+            cmd += ["--profile_dir", os.path.abspath(job_dir)]
+        intra_op_threads, inter_op_threads = config.visual_threads()
+        cmd += ["--backend", config.visual_backend(),
+                "--precision", config.visual_precision(),
+                "--intra_op_threads", str(intra_op_threads),
+                "--inter_op_threads", str(inter_op_threads)]
+        if config.visual_autotune():
+            cmd += ["--autotune"]
+        detect_every, detect_scale = config.visual_detection()
+        cmd += ["--detect_every", str(detect_every), "--detect_scale", str(detect_scale)]
+        if config.visual_skip_silence():
+            cmd += ["--skip_silence"]
+        if batch_server_address:
+            cmd += ["--batch_server", batch_server_address,
+                    "--wav2lip_batch_size", str(config.visual_batch_server_job_batch_size())]
         
         logger.info(f"Running Wav2Lip: {' '.join(cmd)}")
         
         # Prepare Environment (Handle Force CPU)
-        env = os.environ.copy()
-        if os.getenv("FORCE_CPU", "0") == "1":
-            env["CUDA_VISIBLE_DEVICES"] = "" # Hide GPU from subprocess
+        env = wav2lip_env()
         
-        # Run Inference
-        process = subprocess.run(
+        # Run Inference (tqdm progress is streamed into the job record; stopped on timeout or cancel)
+        process = run_with_progress(
             cmd,
+            queue,
+            job_id,
             cwd=wav2lip_dir,
             env=env,
-            capture_output=True,
-            text=True
+            timeout=config.visual_process_timeout()
         )
         
+        metrics.observe_inference_rss("visual", process.peak_rss)
         if process.returncode != 0:
             logger.error(f"Wav2Lip failed: {process.stderr}")
             raise Exception(f"Wav2Lip failed with code {process.returncode}: {process.stderr}")
             
         logger.info(f"Wav2Lip Output: {process.stdout}")
+        timings = read_timings(timings_path) or {"stages": {}}
+        stages = timings["stages"]
 
-        # --- GFPGAN Enhancement Step ---
-        try:
-            logger.info("Starting GFPGAN Face Enhancement...")
-            from gfpgan import GFPGANer
-            import cv2
-            
-            # 1. Setup GFPGAN
-            # Download weights if needed
-            model_url = 'https://github.com/TencentARC/GFPGAN/releases/download/v1.3.0/GFPGANv1.4.pth'
-            model_path = os.path.join(os.path.dirname(__file__), "gfpgan_weights.pth")
-            
-            if not os.path.exists(model_path):
-                logger.info("Downloading GFPGAN weights...")
-                import requests
-                r = requests.get(model_url, allow_redirects=True)
-                with open(model_path, 'wb') as f:
-                    f.write(r.content)
+        # --- GFPGAN Enhancement Step (skipped by draft quality) ---
+        if payload.get("quality") == "draft":
+            logger.info("Draft quality: skipping GFPGAN enhancement")
+        else:
+            try:
+                logger.info("Starting GFPGAN Face Enhancement...")
+                import cv2
             
-            restorer = GFPGANer(model_path=model_path, upscale=1, arch='clean', channel_multiplier=2, bg_upsampler=None)
+                # 1. Setup GFPGAN (loaded once per worker process)
+                load_start = time.time()
+                restorer = load_restorer()
+                stages["model_load"] = stages.get("model_load", 0.0) + time.time() - load_start
             
-            # 2. Process Video
-            vid = cv2.VideoCapture(result_path)
-            fps = vid.get(cv2.CAP_PROP_FPS)
-            w = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH))
-            h = int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                # 2. Process Video
+                vid = cv2.VideoCapture(result_path)
+                fps = vid.get(cv2.CAP_PROP_FPS)
+                total_frames = int(vid.get(cv2.CAP_PROP_FRAME_COUNT))
+                w = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH))
+                h = int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
             
-            enhanced_path = result_path.replace(".mp4", "_enhanced.mp4")
-            out = cv2.VideoWriter(enhanced_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+                enhanced_path = result_path.replace(".mp4", "_enhanced.mp4")
+                out = cv2.VideoWriter(enhanced_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
             
-            frame_count = 0
-            while True:
-                ret, frame = vid.read()
-                if not ret:
-                    break
+                frame_count = 0
+                progress = ProgressReporter(queue, job_id)
+                enhance_start = time.time()
+                while True:
+                    ret, frame = vid.read()
+                    if not ret:
+                        break
+                    if queue.is_cancelled(job_id):
+                        vid.release()
+                        out.release()
+                        os.remove(enhanced_path)
+                        raise JobCancelled(job_id)
                 
-                # Enhance
-                _, _, output = restorer.enhance(frame, has_aligned=False, only_center_face=False, paste_back=True)
-                out.write(output)
-                frame_count += 1
+                    # Enhance
+                    _, _, output = restorer.enhance(frame, has_aligned=False, only_center_face=False, paste_back=True)
+                    out.write(output)
+                    frame_count += 1
+
+                    elapsed = time.time() - enhance_start
+                    eta = elapsed / frame_count * max(total_frames - frame_count, 0)
+                    progress.update("enhance", frame_count, total_frames, eta=eta)
             
-            vid.release()
-            out.release()
+                vid.release()
+                out.release()
+                stages["enhance"] = time.time() - enhance_start
             
-            # 3. Merge Audio back
-            # wav2lip result has audio, but we created a silent enhanced video.
-            # Use ffmpeg to merge original audio to enhanced video.
-            final_output = result_path # Overwrite original or keep separate? 
-            # Let's overwrite result_path with enhanced version if successful
+                # 3. Merge Audio back
+                # wav2lip result has audio, but we created a silent enhanced video.
+                # Use ffmpeg to merge original audio to enhanced video.
+                final_output = result_path # Overwrite original or keep separate? 
+                # Let's overwrite result_path with enhanced version if successful
             
-            temp_path = result_path.replace(".mp4", "_temp_final.mp4")
-            # ffmpeg -i enhanced -i original -c:v copy -c:a copy -map 0:v:0 -map 1:a:0 output
-            merge_cmd = [
-                "ffmpeg", "-y",
-                "-i", enhanced_path,
-                "-i", result_path,
-                "-c:v", "copy",
-                "-c:a", "copy",
-                "-map", "0:v:0",
-                "-map", "1:a:0",
-                temp_path
-            ]
-            subprocess.run(merge_cmd, check=True)
+                temp_path = result_path.replace(".mp4", "_temp_final.mp4")
+                # ffmpeg -i enhanced -i original -c:v copy -c:a copy -map 0:v:0 -map 1:a:0 output
+                merge_cmd = [
+                    "ffmpeg", "-y",
+                    "-i", enhanced_path,
+                    "-i", result_path,
+                    "-c:v", "copy",
+                    "-c:a", "copy",
+                    "-map", "0:v:0",
+                    "-map", "1:a:0",
+                    temp_path
+                ]
+                mux_start = time.time()
+                subprocess.run(merge_cmd, check=True)
+                stages["mux"] = stages.get("mux", 0.0) + time.time() - mux_start
             
-            # Replace original
-            os.replace(temp_path, result_path)
-            os.remove(enhanced_path)
+                # Replace original
+                os.replace(temp_path, result_path)
+                os.remove(enhanced_path)
             
-            logger.info(f"GFPGAN Enhancement complete. Frames: {frame_count}")
+                logger.info(f"GFPGAN Enhancement complete. Frames: {frame_count}")
             
-        except ImportError:
-            logger.warning("GFPGAN not installed. Skipping enhancement.")
-        except Exception as e:
-            logger.error(f"GFPGAN Enhancement failed: {e}. Returning raw Wav2Lip result.")
-            # We continue with original result_path if enhancement fails
+            except JobCancelled:
+                raise
+            except ImportError:
+                logger.warning("GFPGAN not installed. Skipping enhancement.")
+            except Exception as e:
+                logger.error(f"GFPGAN Enhancement failed: {e}. Returning raw Wav2Lip result.")
+                # We continue with original result_path if enhancement fails
         # -------------------------------
 
         # 4. Success
         if not os.path.exists(result_path):
              raise Exception("Output file was not created by Wav2Lip.")
 
+        queue.record_timings(job_id, timings)
+        metrics.observe_timings("visual", timings)
         queue.update_job_status(job_id, "completed", result=result_path)
         logger.info(f"Job {job_id} completed successfully.")
 
@@ -203,25 +306,15 @@ def process_job(queue: RedisQueue, job_id: str):
         logger.error(f"Error processing job {job_id}: {e}")
         queue.update_job_status(job_id, "failed", error=str(e))
 
-def main():
-    logger.info("Visual Worker Initializing...")
-    
-    # Connect to Redis
-    try:
-        queue = RedisQueue()
-    except Exception as e:
-        logger.error(f"Redis connection failed: {e}")
-        return
-
-    # Load Model
-    load_model()
-    
+def run(queue: RedisQueue):
     logger.info("Visual Worker listening for jobs...")
     while True:
         try:
             job_id = queue.pop_job("visual")
             if job_id:
+                job_start = time.time()
                 process_job(queue, job_id)
+                metrics.observe_job("visual", queue.get_job_status(job_id).get("status"), time.time() - job_start)
             else:
                 time.sleep(1) # Poll interval
                 
@@ -232,5 +325,49 @@ def main():
             logger.error(f"Unexpected error in loop: {e}")
             time.sleep(5)
 
+def child_main(index: int):
+    """Fork server child: rebuilds the restorer on the GPU (if any) and serves jobs."""
+    global restorer
+    if restorer is not None and select_device() != "cpu":
+        restorer = None
+        load_restorer()
+    metrics.start_exporter("visual", child=index)
+    queue = RedisQueue()
+    try:
+        run(queue)
+    except forkserver.Terminated:
+        queue.fail_running_jobs("Worker process stopped")
+        raise
+
+def main():
+    logger.info("Visual Worker Initializing...")
+
+    if config.visual_batch_server():
+        start_batch_server()
+
+    children = forkserver.configured_children("visual")
+    if children:
+        # GFPGAN is preloaded on the CPU and shared copy-on-write; Wav2Lip itself
+        # loads in each job's inference subprocess
+        load_model(device="cpu")
+        try:
+            load_restorer(device="cpu")
+        except ImportError:
+            logger.warning("GFPGAN not installed. Skipping enhancement preload.")
+        forkserver.serve("visual", child_main, children)
+        return
+    
+    # Connect to Redis
+    try:
+        queue = RedisQueue()
+    except Exception as e:
+        logger.error(f"Redis connection failed: {e}")
+        return
+
+    # Load Model
+    load_model()
+    metrics.start_exporter("visual")
+    run(queue)
+
 if __name__ == "__main__":
     main()
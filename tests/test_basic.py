@@ -25,7 +25,7 @@ def test_imports():
 
 def test_schema_validation():
     """Test Pydantic schema validation."""
-    from orchestrator.schemas import PipelineRequest
+    from orchestrator.schemas import PipelineRequest, MotionRequest
     
     # Valid request
     req = PipelineRequest(
@@ -36,15 +36,22 @@ def test_schema_validation():
     )
     assert req.text == "Hello world"
     assert req.mode == "motion"
+    
+    # Motion is only seeded (reproducible, cached) when the request asks for it
+    assert MotionRequest(source_image="a.png", driven_audio="a.wav").seed is None
+    assert MotionRequest(source_image="a.png", driven_audio="a.wav", seed=3).seed == 3
     print("✓ Schema validation passed")
 
 
 def test_config_defaults():
     """Test config returns sensible defaults."""
-    from orchestrator.config import pipeline_max_concurrent, motion_timeout
+    from orchestrator.config import pipeline_max_concurrent, motion_timeout, visual_backend, visual_detection
     
     assert pipeline_max_concurrent() >= 1
     assert motion_timeout() >= 60
+    assert visual_backend() in ("eager", "torchscript", "onnx")
+    detect_every, detect_scale = visual_detection()
+    assert detect_every >= 1 and 0 < detect_scale <= 1
     print("✓ Config defaults valid")
 
 
@@ -85,6 +92,550 @@ def test_srt_generation():
     print("✓ SRT generation passed")
 
 
+def test_tqdm_progress_parsing():
+    """Test parsing of worker tqdm bars into structured progress."""
+    from orchestrator.job_progress import parse_tqdm_line
+    
+    progress = parse_tqdm_line("Face Renderer::  45%|####5     | 45/100 [00:10<00:12,  4.50it/s]")
+    assert progress["stage"] == "render"
+    assert progress["done"] == 45 and progress["total"] == 100
+    assert progress["eta"] == 12.0
+    
+    # Unknown remaining time and plain log lines
+    assert parse_tqdm_line("seamlessClone::   0%|          | 0/50 [00:00<?, ?it/s]")["eta"] is None
+    assert parse_tqdm_line("Using cpu for inference.") is None
+    print("✓ Progress parsing passed")
+
+
+def test_timing_aggregation():
+    """Test that child job timings are summed into the pipeline breakdown."""
+    import json
+    from orchestrator.pipeline_worker import aggregate_timings
+    
+    class JobStore:
+        jobs = {
+            "a": {"created_at": "10.0", "started_at": "11.0", "timings": json.dumps({"stages": {"tts": 2.0}})},
+            "m": {"created_at": "13.0", "started_at": "13.5",
+                  "timings": json.dumps({"frames": 50, "stages": {"model_load": 4.0, "render": 6.0}})},
+        }
+        def get_job_status(self, job_id):
+            return self.jobs.get(job_id)
+    
+    timings = aggregate_timings(JobStore(), {"audio": "a", "motion": "m"}, total=20.0)
+    assert timings["stages"] == {"tts": 2.0, "queue_wait": 1.5, "model_load": 4.0, "render": 6.0}
+    assert timings["jobs"]["motion"]["frames"] == 50
+    assert timings["total"] == 20.0
+    print("✓ Timing aggregation passed")
+
+
+def test_admission_estimates():
+    """Test the predicted work, remaining work and start/finish times of pipelines."""
+    import json
+    from orchestrator.admission import pipeline_work, remaining_work, predict, DEFAULT_RATES
+    
+    rates = dict(DEFAULT_RATES, speech=0.1, audio=0.5, motion=4.0, motion_draft=1.0)
+    assert pipeline_work(rates, "x" * 100, "motion") == {"audio": 5.0, "motion": 40.0}
+    assert pipeline_work(rates, "x" * 100, "motion", preview=True) == {"audio": 5.0, "motion": 50.0}
+    assert pipeline_work(rates, "x" * 100, "lipsync", quality="draft") == {"audio": 5.0, "visual": 10.0}
+    
+    # running for 8s: audio done, 3s into the render
+    job = {"started_at": "100.0", "work": json.dumps({"audio": 5.0, "motion": 40.0})}
+    assert remaining_work(job, now=108.0) == {"audio": 0.0, "motion": 37.0}
+    
+    # 20s of audio and 120s of render ahead, two motion processes
+    estimate = predict({"audio": 5.0, "motion": 40.0}, {"audio": 20.0, "motion": 120.0},
+                       {"audio": 1, "motion": 2}, now=1000.0)
+    assert estimate["estimated_start"] == 1020.0
+    assert estimate["wait"] == 55.0                 # 20s audio + (60 - 20 - 5)s render
+    assert estimate["estimated_finish"] == 1100.0
+    print("✓ Admission estimates passed")
+
+
+def test_subprocess_cancellation():
+    """Test that a cancelled job's subprocess is stopped."""
+    import time
+    from orchestrator.job_progress import run_with_progress, JobCancelled
+    
+    class CancelledJobs:
+        def is_cancelled(self, job_id):
+            return job_id == "cancelled"
+        def report_progress(self, *args, **kwargs):
+            pass
+    
+    result = run_with_progress([sys.executable, "-c", "print('done')"], CancelledJobs(), "running")
+    assert result.returncode == 0 and result.stdout == "done\n"
+    start = time.time()
+    try:
+        run_with_progress([sys.executable, "-c", "import time; time.sleep(60)"], CancelledJobs(), "cancelled")
+        assert False, "cancelled subprocess ran to the end"
+    except JobCancelled:
+        pass
+    assert time.time() - start < 10
+    print("✓ Subprocess cancellation passed")
+
+
+def test_request_fingerprint():
+    """Test that identical requests share a fingerprint and different ones do not."""
+    from orchestrator.schemas import PipelineRequest
+    from orchestrator.queue_manager import request_fingerprint
+    
+    payload = PipelineRequest(text="Hello", video_path="/path/to/image.jpg").model_dump()
+    reordered = dict(reversed(list(payload.items())))
+    assert request_fingerprint("pipeline", payload) == request_fingerprint("pipeline", reordered)
+    assert request_fingerprint("pipeline", payload) != request_fingerprint("pipeline", dict(payload, text="Hello!"))
+    assert request_fingerprint("pipeline", payload) != request_fingerprint("motion", payload)
+    print("✓ Request fingerprint passed")
+
+
+def fake_queue():
+    """RedisQueue on an in-memory fakeredis server."""
+    import fakeredis
+    from orchestrator.queue_manager import RedisQueue
+    return RedisQueue(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_single_flight_queue():
+    """Test duplicate submissions sharing one job, and cancelling and failing them."""
+    queue = fake_queue()
+    
+    # a duplicate becomes an alias that resolves to the primary's result
+    primary = queue.submit_job("pipeline", {"text": "Hi"}, fingerprint="fp", ttl=60)
+    alias = queue.submit_job("pipeline", {"text": "Hi"}, fingerprint="fp", ttl=60)
+    assert alias != primary and queue.resolve_alias(alias) == primary
+    assert queue.get_job_status(alias)["alias_of"] == primary
+    assert queue.pop_job("pipeline") == primary and queue.pop_job("pipeline") is None
+    queue.update_job_status(primary, "completed", result="/out.mp4")
+    assert queue.get_job_status(alias)["status"] == "completed"
+    assert queue.get_job_status(alias)["result"] == "/out.mp4"
+    assert queue.in_flight("fp") is None
+    
+    # the original requester cancelling only detaches it (nothing is cancelled); the job
+    # runs on and completes for the alias and, under its own id, for the original request
+    primary = queue.submit_job("pipeline", {"text": "Hi"}, fingerprint="fp2", ttl=60)
+    alias = queue.submit_job("pipeline", {"text": "Hi"}, fingerprint="fp2", ttl=60)
+    assert queue.cancel_job(primary) == []
+    assert not queue.is_cancelled(primary)
+    assert queue.get_job_status(primary)["status"] == "queued"
+    assert queue.pop_job("pipeline") == primary
+    queue.update_job_status(primary, "completed", result="/out2.mp4")
+    assert queue.get_job_status(alias)["status"] == "completed"
+    assert queue.get_job_status(primary)["status"] == "completed"
+    
+    # once detached, the alias cancelling as the last requester cancels the job
+    primary = queue.submit_job("pipeline", {"text": "Hey"}, fingerprint="fp5", ttl=60)
+    alias = queue.submit_job("pipeline", {"text": "Hey"}, fingerprint="fp5", ttl=60)
+    assert queue.cancel_job(primary) == []
+    assert sorted(queue.cancel_job(alias)) == sorted([alias, primary])
+    assert queue.get_job_status(primary)["status"] == "cancelled"
+    assert queue.pop_job("pipeline") is None
+    
+    # cancelling an alias ends it alone; the last requester cancels the job and its children
+    primary = queue.submit_job("pipeline", {"text": "Yo"}, fingerprint="fp3", ttl=60)
+    alias = queue.submit_job("pipeline", {"text": "Yo"}, fingerprint="fp3", ttl=60)
+    child = queue.submit_job("motion", {}, parent_id=primary)
+    assert queue.cancel_job(alias) == [alias]
+    assert queue.get_job_status(alias)["status"] == "cancelled"
+    assert queue.get_job_status(primary)["status"] == "queued"
+    assert sorted(queue.cancel_job(primary)) == sorted([primary, child])
+    assert queue.get_job_status(primary)["status"] == "cancelled"
+    assert queue.get_job_status(child)["status"] == "cancelled"
+    assert queue.pop_job("pipeline") is None and queue.pop_job("motion") is None
+    
+    # a failed job releases its fingerprint so the request can be retried
+    failed = queue.submit_job("pipeline", {"text": "Oops"}, fingerprint="fp4", ttl=60)
+    queue.pop_job("pipeline")
+    queue.update_job_status(failed, "failed", error="boom")
+    assert queue.in_flight("fp4") is None
+    assert queue.submit_job("pipeline", {"text": "Oops"}, fingerprint="fp4", ttl=60) != failed
+    print("✓ Single-flight queue passed")
+
+
+def test_admission_backlog():
+    """Test that registered pipelines count as work ahead of new submissions until they end."""
+    import time
+    import threading
+    from orchestrator import admission
+    
+    queue = fake_queue()
+    now = time.time()
+    estimate = admission.estimate(queue, "x" * 100, "motion", {"audio": 1, "motion": 1})
+    assert estimate["wait"] == 0.0
+    first = queue.submit_job("pipeline", {})
+    admission.register(queue, first, estimate)
+    ahead = admission.backlog(queue, now)
+    assert ahead == estimate["work"]
+    later = admission.predict(estimate["work"], ahead, {"audio": 1, "motion": 1}, now)
+    assert later["estimated_start"] == now + estimate["work"]["audio"]
+    assert later["wait"] > 0
+    
+    # a finished pipeline no longer counts
+    queue.update_job_status(first, "completed")
+    assert admission.backlog(queue, now) == {}
+    assert not queue.redis.smembers(admission.ACTIVE_KEY)
+    
+    # concurrent submissions each see the others' reserved work: one fits a wait limit
+    # shorter than a pipeline's audio work, the rest are rejected
+    barrier = threading.Barrier(4)
+    def submit(results):
+        barrier.wait()
+        results.append(admission.admit(queue, "x" * 100, "motion", {"audio": 1, "motion": 1}, max_wait=1.0))
+    results = []
+    threads = [threading.Thread(target=submit, args=(results,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    [admitted] = [result for result in results if result.get("reservation")]
+    assert queue.redis.smembers(admission.ACTIVE_KEY) == {admitted["reservation"]}
+    job_id = queue.submit_job("pipeline", {})
+    admission.register(queue, job_id, admitted)
+    assert queue.redis.smembers(admission.ACTIVE_KEY) == {job_id}
+    assert admission.backlog(queue) == admitted["work"]
+    print("✓ Admission backlog passed")
+
+
+def test_benchmark_baseline_compare():
+    """Test that benchmark regressions are detected against the baseline."""
+    from benchmarks.run_benchmarks import compare
+    
+    baseline = {"suites": {"lipsync": {"forward": {"fps": 10.0, "peak_rss_mb": 1000.0}}}}
+    faster = {"suites": {"lipsync": {"forward": {"fps": 12.0, "peak_rss_mb": 1010.0},
+                                     "blend": {"fps": 5.0, "peak_rss_mb": 900.0}}}}
+    slower = {"suites": {"lipsync": {"forward": {"fps": 8.0, "peak_rss_mb": 1300.0}}}}
+    
+    assert compare(faster, baseline, 0.15) == []
+    assert len(compare(slower, baseline, 0.15)) == 2
+    print("✓ Benchmark baseline comparison passed")
+
+
+def test_lse_score_parsing():
+    """Test parsing of SyncNet LSE script output in the precision report."""
+    from benchmarks.precision_quality import parse_lse
+    
+    output = "Model loaded.\n7.0 6.0\n8.0 5.0\n"
+    assert parse_lse(output) == (7.5, 5.5)
+    assert parse_lse("no faces found") is None
+    print("✓ LSE score parsing passed")
+
+
+def test_coeff_cache_roundtrip():
+    """Test the SadTalker coefficient cache keys and stores coefficient arrays."""
+    import tempfile
+    import numpy as np
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker'))
+    from src.utils.coeff_cache import CoeffCache
+    
+    cache = CoeffCache(tempfile.mkdtemp(), max_files=1)
+    key = CoeffCache.key(audio="a1", avatar="f1", pose_style=0, seed=0)
+    assert key == CoeffCache.key(seed=0, pose_style=0, avatar="f1", audio="a1")
+    assert key != CoeffCache.key(audio="a1", avatar="f1", pose_style=0, seed=1)
+    assert cache.get(key) is None
+    
+    coeffs = np.arange(140, dtype=np.float32).reshape(2, 70)
+    cache.put(key, coeffs)
+    assert np.array_equal(cache.get(key), coeffs)
+    cache.put("other", coeffs)
+    assert len(os.listdir(cache.cache_dir)) == 1
+    print("✓ Coefficient cache round trip passed")
+
+
+def test_motion_library():
+    """Test motion preset names in requests and the preset round trip."""
+    import tempfile
+    import numpy as np
+    from pydantic import ValidationError
+    from orchestrator.schemas import MotionRequest
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker'))
+    from src.utils.motion_library import MotionLibrary
+    
+    assert MotionRequest(source_image="a.png", driven_audio="a.wav", motion_preset="nod_calm").motion_preset == "nod_calm"
+    try:
+        MotionRequest(source_image="a.png", driven_audio="a.wav", motion_preset="../secrets")
+        assert False, "path-like preset name accepted"
+    except ValidationError:
+        pass
+    
+    library = MotionLibrary(tempfile.mkdtemp())
+    coeffs = np.arange(3 * 73, dtype=np.float64).reshape(3, 73)
+    library.add("nod_calm", coeffs)
+    blink, pose = library.load("nod_calm")
+    assert blink.shape == (3, 64) and pose.shape == (3, 6) and pose.dtype == np.float32
+    assert np.array_equal(pose, coeffs[:, 64:70]) and library.names() == ["nod_calm"]
+    print("✓ Motion library passed")
+
+
+def test_motion_preset_pose():
+    """Test that a motion preset's head pose reaches the renderer input (still mode off)."""
+    import tempfile
+    import numpy as np
+    from orchestrator.config import motion_quality
+    
+    assert not motion_quality("final", motion_preset="nod_calm")["still"]
+    assert not motion_quality("draft", motion_preset="nod_calm")["still"]
+    
+    # the render input needs the SadTalker dependencies (torch, scipy, scikit-image)
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker'))
+    import cv2
+    import scipy.io as scio
+    from src.generate_facerender_batch import get_facerender_data
+    
+    work_dir = tempfile.mkdtemp()
+    pic_path, first_path, coeff_path = (os.path.join(work_dir, name) for name in ("face.png", "first.mat", "coeffs.mat"))
+    cv2.imwrite(pic_path, np.zeros((64, 64, 3), dtype=np.uint8))
+    scio.savemat(first_path, {"coeff_3dmm": np.zeros((1, 73), dtype=np.float32)})
+    coeffs = np.zeros((4, 70), dtype=np.float32)
+    coeffs[:, 64:70] = np.arange(24).reshape(4, 6)         # the preset's pose
+    scio.savemat(coeff_path, {"coeff_3dmm": coeffs})
+    
+    still = motion_quality("final", motion_preset="nod_calm")["still"]
+    data = get_facerender_data(coeff_path, pic_path, first_path, None, 1, still_mode=still, preprocess="full", size=64)
+    centers = data["target_semantics_list"].reshape(4, 73, -1)[:, :, 13].numpy()
+    assert np.array_equal(centers[:, 64:70], coeffs[:, 64:70])
+    print("✓ Motion preset pose passed")
+
+
+def test_batched_audio2coeff():
+    """Test that batched Audio2Exp/Audio2Pose match the per-window loop under the same seed."""
+    import tempfile
+    import torch
+    sadtalker_dir = os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker')
+    sys.path.insert(0, sadtalker_dir)
+    from benchmarks.bench_motion import write_random_audio2coeff_checkpoint
+    from src.test_audio2coeff import Audio2Coeff
+    from src.utils.init_path import init_path
+
+    torch.manual_seed(0)
+    config_dir = os.path.join(sadtalker_dir, 'src', 'config')
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        write_random_audio2coeff_checkpoint(os.path.join(checkpoint_dir, 'SadTalker_V0.0.2_256.safetensors'),
+                                            config_dir, 'cpu')
+        audio_to_coeff = Audio2Coeff(init_path(checkpoint_dir, config_dir, 256, False, 'crop'), 'cpu')
+
+    num_frames = 75                                      # two full 32-frame pose windows and a partial one
+    batch = {'indiv_mels': torch.randn(1, num_frames, 1, 80, 16),
+             'ref': torch.randn(1, num_frames, 70) * 0.1,
+             'ratio_gt': torch.rand(1, num_frames, 1),
+             'num_frames': num_frames,
+             'class': torch.LongTensor([0])}
+    with torch.no_grad():
+        exp_loop = audio_to_coeff.audio2exp_model.test(batch)['exp_coeff_pred']
+        exp_batched = audio_to_coeff.audio2exp_model.test(batch, frames_per_step=64)['exp_coeff_pred']
+        pose_model = audio_to_coeff.audio2pose_model
+        pose_loop = pose_model.test(dict(batch), generator=torch.Generator().manual_seed(7))['pose_pred']
+        pose_batched = pose_model.test(dict(batch), batch_frames=64,
+                                       generator=torch.Generator().manual_seed(7))['pose_pred']
+    assert exp_loop.shape == exp_batched.shape == (1, num_frames, 64)
+    assert torch.allclose(exp_loop, exp_batched, atol=1e-5)
+    assert pose_loop.shape == pose_batched.shape == (1, num_frames, 6)
+    assert torch.allclose(pose_loop, pose_batched, atol=1e-5)
+    print("✓ Batched Audio2Coeff passed")
+
+
+def test_silent_spans():
+    """Test pause detection in the driving audio and the idle loop over a pause."""
+    import numpy as np
+    sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'services'))
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker'))
+    from common.silence import silent_spans
+    from src.utils.silence import idle_render_map
+    
+    rng = np.random.RandomState(0)
+    speech, pause, breath = rng.randn(16000) * 0.3, np.zeros(16000), rng.randn(4000) * 1e-4
+    wav = np.concatenate([speech, pause, speech, breath, speech])     # 1s, 1s, 1s, 0.25s, 1s
+    spans = silent_spans(wav, 16000, 25, 106)
+    assert len(spans) == 1                    # the 0.25s pause is too short
+    start, end = spans[0]
+    assert 25 <= start <= 26 and 45 <= end <= 50
+    
+    render_map = idle_render_map(12, [(2, 12)], idle_frames=3)
+    assert render_map.tolist() == [0, 1, 2, 3, 4, 3, 2, 3, 4, 3, 2, 3]
+    print("✓ Silent span detection passed")
+
+
+def test_render_shards():
+    """Test time shard ranges of a long render and joining the shards' frames."""
+    import tempfile
+    import numpy as np
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'motion', 'SadTalker'))
+    from src.utils.render_shards import shard_ranges, save_shard, shard_path, assemble
+    
+    assert shard_ranges(3000, 4, 250) == [(0, 750), (750, 1500), (1500, 2250), (2250, 3000)]
+    assert shard_ranges(600, 4, 250) == [(0, 300), (300, 600)]
+    assert shard_ranges(400, 4, 250) == [(0, 400)]
+    
+    # frames 3-5 lie in a pause that repeats frame 2
+    shard_dir = tempfile.mkdtemp()
+    frames = np.arange(8, dtype=np.uint8)[:, None, None, None].repeat(2, axis=1)
+    save_shard(shard_path(shard_dir, 0), [0, 1, 2], frames[[0, 1, 2]])
+    save_shard(shard_path(shard_dir, 1), [], frames[:0])
+    save_shard(shard_path(shard_dir, 2), [6, 7], frames[[6, 7]])
+    paths = [shard_path(shard_dir, index) for index in range(3)]
+    video = assemble(paths, np.array([0, 1, 2, 2, 2, 2, 6, 7]))
+    assert [int(frame[0, 0, 0]) for frame in video] == [0, 1, 2, 2, 2, 2, 6, 7]
+    try:
+        assemble(paths, np.arange(8))
+        assert False, "missing frames accepted"
+    except ValueError:
+        pass
+    print("✓ Render shards passed")
+
+
+def test_quality_tiers():
+    """Test the draft/final quality field and the SadTalker settings of each tier."""
+    from pydantic import ValidationError
+    from orchestrator.schemas import PipelineRequest
+    from orchestrator.config import motion_quality
+    
+    req = PipelineRequest(text="Hi", video_path="/path/to/image.jpg", preview=True)
+    assert req.quality == "final" and req.preview
+    try:
+        PipelineRequest(text="Hi", video_path="/path/to/image.jpg", quality="ultra")
+        assert False, "unknown quality accepted"
+    except ValidationError:
+        pass
+    
+    draft, final = motion_quality("draft"), motion_quality("final")
+    assert draft["enhancer"] is None and draft["paste"] == "fast"
+    assert draft["size"] <= final["size"] and draft["render_fps"] <= final["render_fps"] == 25.0
+    print("✓ Quality tiers passed")
+
+
+def test_batch_tuner():
+    """Test Wav2Lip batch size tuning, profile resume and OOM shrinking."""
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'visual', 'Wav2Lip'))
+    from autotune import BatchTuner
+    
+    tuner = BatchTuner("wav2lip_batch_size", 128, [16, 32, 64], tune=True)
+    tuner.record(16, 5.0)                     # warm-up batch, not measured
+    tuner.record(16, 1.6)
+    tuner.record(32, 1.6)
+    assert tuner.next_size() == 64 and not tuner.tuned
+    saved = tuner.profile_values()            # job ended before trying 64
+    assert saved == {"wav2lip_batch_size_ms": {"16": 100.0, "32": 50.0}}
+    
+    resumed = BatchTuner("wav2lip_batch_size", 128, [16, 32, 64], saved, tune=True)
+    assert resumed.next_size() == 64
+    resumed.shrink(64)                        # out of memory at 64
+    assert resumed.batch_size == 32 and resumed.tuned
+    assert BatchTuner("wav2lip_batch_size", 128, [16, 32, 64], {"wav2lip_batch_size": 32}, tune=True).next_size() == 32
+    print("✓ Batch tuner passed")
+
+
+def test_micro_batcher():
+    """Test that Wav2Lip requests of several jobs share batches and get their own rows back."""
+    import numpy as np
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'visual', 'Wav2Lip'))
+    from batch_server import MicroBatcher
+    
+    sizes = []
+    def forward(mel, face):
+        sizes.append(len(mel))
+        return face[:, :3] + mel.mean(axis=(1, 2, 3))[:, None, None, None]
+    
+    batcher = MicroBatcher(forward, batch_size=8, max_wait=0.)
+    jobs = [batcher.submit(np.full((n, 1, 80, 16), job, np.float32), np.zeros((n, 6, 96, 96), np.float32))
+            for job, n in enumerate([3, 4, 5])]
+    batcher.run_batch(batcher.next_batch())   # 3 + 4 frames fit, 5 more would not
+    batcher.run_batch(batcher.next_batch())
+    assert sizes == [7, 5]
+    for job, request in enumerate(jobs):
+        assert request.done.is_set() and request.result.shape == (len(request.mel), 3, 96, 96)
+        assert np.all(request.result == job)
+    assert batcher.next_batch(timeout=0.01) == []
+    print("✓ Micro-batcher passed")
+
+
+def test_batch_server_sharing():
+    """Test that two concurrent full-length lipsync jobs share every batch server forward."""
+    import threading
+    import numpy as np
+    from orchestrator import config
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'visual', 'Wav2Lip'))
+    from batch_server import MicroBatcher
+    
+    os.environ["VISUAL_FORK_CHILDREN"] = "2"
+    try:
+        job_batch = config.visual_batch_server_job_batch_size()
+    finally:
+        del os.environ["VISUAL_FORK_CHILDREN"]
+    server_batch = config.visual_batch_server_options()[1]
+    assert job_batch * 2 == server_batch
+    
+    sizes = []
+    def forward(mel, face):
+        sizes.append(len(mel))
+        return face[:, :3]
+    
+    batcher = MicroBatcher(forward, batch_size=server_batch, max_wait=1.)
+    threading.Thread(target=batcher.run, daemon=True).start()
+    def job():
+        # full requests, each sent once the previous one returned (as inference.py does)
+        for _ in range(4):
+            batcher.predict(np.zeros((job_batch, 1, 80, 16), np.float32), np.zeros((job_batch, 6, 96, 96), np.float32))
+    jobs = [threading.Thread(target=job) for _ in range(2)]
+    for thread in jobs:
+        thread.start()
+    for thread in jobs:
+        thread.join()
+    assert sizes == [server_batch] * 4
+    print("✓ Batch server sharing passed")
+
+
+def test_static_face_encoding():
+    """Test that decoding with one encoded static face matches the full Wav2Lip forward."""
+    import torch
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'visual', 'Wav2Lip'))
+    from models import Wav2Lip
+    
+    torch.manual_seed(0)
+    model = Wav2Lip().eval()
+    face = torch.rand(1, 6, 96, 96).repeat(4, 1, 1, 1)    # the same face every frame
+    audio = torch.randn(4, 1, 80, 16)
+    with torch.no_grad():
+        expected = model(audio, face)
+        actual = model.decode(audio, model.encode_face(face[:1]))
+    assert actual.shape == expected.shape == (4, 3, 96, 96)
+    assert torch.allclose(actual, expected, atol=1e-5)
+    print("✓ Static face encoding passed")
+
+
+def test_backend_parity_fallback():
+    """Test that a Wav2Lip export failing the parity check falls back to eager, and the remembered checkpoint hash."""
+    import json
+    import tempfile
+    import torch
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'services', 'visual', 'Wav2Lip'))
+    import backends
+    from common.hashing import HASHES_FILE
+    
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 3), torch.nn.ReLU()).eval()
+    example = (torch.randn(1, 3, 8, 8),)
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "tiny.pth")
+        torch.save(model.state_dict(), checkpoint)
+        export_dir = os.path.join(tmp, "exported")
+        args = ("torchscript", model, example, "tiny", checkpoint, ["x"], ["y"], None)
+        
+        # every difference exceeds a negative tolerance
+        assert backends.load_backend(*args, export_dir=export_dir, tolerance=-1.) is model
+        with open(os.path.join(export_dir, HASHES_FILE)) as f:
+            hashes = json.load(f)
+        [digest] = hashes.values()
+        assert os.listdir(os.path.join(export_dir, digest)) == ["tiny.ts.json"]   # only the parity note
+        
+        # later jobs take the hash from the sidecar instead of reading the checkpoint
+        hashes = {stamp: "remembered" for stamp in hashes}
+        with open(os.path.join(export_dir, HASHES_FILE), "w") as f:
+            json.dump(hashes, f)
+        runner = backends.load_backend(*args, export_dir=export_dir)
+        assert runner is not model
+        assert sorted(os.listdir(os.path.join(export_dir, "remembered"))) == ["tiny.ts", "tiny.ts.json"]
+        with torch.no_grad():
+            assert torch.allclose(runner(*example), model(*example), atol=1e-5)
+    print("✓ Backend parity fallback passed")
+
+
 def test_assets_exist():
     """Verify test assets are present."""
     assets_dir = os.path.join(os.path.dirname(__file__), 'assets')
@@ -99,6 +650,39 @@ if __name__ == "__main__":
     test_schema_validation()
     test_config_defaults()
     test_srt_generation()
+    test_tqdm_progress_parsing()
+    test_timing_aggregation()
+    test_admission_estimates()
+    test_subprocess_cancellation()
+    test_request_fingerprint()
+    test_single_flight_queue()
+    test_admission_backlog()
+    test_benchmark_baseline_compare()
+    test_lse_score_parsing()
+    test_coeff_cache_roundtrip()
+    test_motion_library()
+    try:
+        test_motion_preset_pose()
+    except ImportError as e:
+        print(f"⚠ Skipping motion preset pose test: {e}")
+    try:
+        test_batched_audio2coeff()
+    except ImportError as e:
+        print(f"⚠ Skipping batched Audio2Coeff test: {e}")
+    test_silent_spans()
+    test_render_shards()
+    test_quality_tiers()
+    test_batch_tuner()
+    test_micro_batcher()
+    test_batch_server_sharing()
+    try:
+        test_static_face_encoding()
+    except ImportError as e:
+        print(f"⚠ Skipping static face encoding test: {e}")
+    try:
+        test_backend_parity_fallback()
+    except ImportError as e:
+        print(f"⚠ Skipping backend parity test: {e}")
     
     # Only run asset test if assets exist
     try: